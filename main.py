@@ -79,7 +79,7 @@ def setup_elastic():
     script = REPO_ROOT / "src" / "setup_es.py"
     if not script.exists():
         sys.exit("src/setup_es.py not found.")
-    run([PYTHON, str(script)])
+    run([PYTHON, "-m", "src.setup_es"], cwd=str(REPO_ROOT))   # module run: it imports src.es
 
 def ensure_ollama_and_model():
     if LLM_PROVIDER != "ollama":
@@ -121,8 +121,8 @@ def ingest_and_embed():
         sys.exit("src/ingest_pdfs.py not found.")
     if not emb.exists():
         sys.exit("src/embed_dense.py not found.")
-    run([PYTHON, str(ing)])
-    run([PYTHON, str(emb)])
+    run([PYTHON, "-m", "src.ingest_pdfs"], cwd=str(REPO_ROOT))
+    run([PYTHON, "-m", "src.embed_dense"], cwd=str(REPO_ROOT))
 
 def start_api_and_ui():
     api = REPO_ROOT / "src" / "api.py"
@@ -134,7 +134,8 @@ def start_api_and_ui():
     print("\nStarting FastAPI on http://127.0.0.1:8000 …")
     api_proc = run_bg([PYTHON, "-m", "uvicorn", "src.api:app", "--reload", "--port", "8000"], cwd=str(REPO_ROOT))
     time.sleep(2)
-    wait_for_http("http://127.0.0.1:8000/healthz", 200, timeout=60)
+    # /healthz turns 200 once the API has loaded and warmed the embedding model
+    wait_for_http("http://127.0.0.1:8000/healthz", 200, timeout=300)
     print("\nStarting Streamlit UI on http://127.0.0.1:8501 …")
     ui_proc = run_bg(["streamlit", "run", str(ui)], cwd=str(REPO_ROOT))
 
@@ -1,43 +1,66 @@
 # src/api.py
 import os
 import json
-import requests
+import time
+import asyncio
 import traceback
-import shutil
+from contextlib import asynccontextmanager
 from typing import Optional
 from pathlib import Path
 
 from fastapi import FastAPI, Body, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from requests.auth import HTTPBasicAuth
 from dotenv import load_dotenv
 
-from .rag_answer import answer as rag_answer
-from .ingest_pdfs import main as ingest_local_main
-from .embed_dense import main as embed_dense_main
-
-# Optional: use gdown if available for Drive folder downloads
-try:
-    import gdown
-except Exception:
-    gdown = None
+from . import embeddings, es, llm, rag_answer as rag
+from .jobs import IngestJobs
+from .rag_answer import answer_async as rag_answer_async, answer_stream_async as rag_answer_stream
 
 # ---------------- env ----------------
 load_dotenv()
 
-ES_URL   = os.getenv("ES_URL", "http://localhost:9200")
-ES_USER  = os.getenv("ES_USERNAME", "elastic")
-ES_PASS  = os.getenv("ES_PASSWORD", "elastic")
 INDEX    = os.getenv("ES_INDEX", "docs_rag")
+API_WARMUP = os.getenv("API_WARMUP", "1") == "1"
 
 # Where ingestion reads PDFs from
 DATA_DIR = Path(os.getenv("DATA_DIR", "data/pdfs/_drive_sync")).resolve()
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
-HEADERS = {"Content-Type": "application/json"}
+# ---------------- startup warm-up ----------------
+# /healthz reports ready only after this finishes, so a load balancer never routes
+# the first queries to a worker that still has to load MiniLM.
+_warmup = {"ready": not API_WARMUP, "steps": {}}
 
-app = FastAPI(title="RAG-Elastic MDP API", version="0.2.0")
+async def _warm_step(name, coro):
+    t0 = time.perf_counter()
+    try:
+        await coro
+        _warmup["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+    except Exception as e:
+        _warmup["steps"][name] = {"ok": False, "error": str(e)}
+
+async def _warm_up():
+    await _warm_step("embedding_model", asyncio.to_thread(embeddings.warm_up))
+    await asyncio.gather(
+        _warm_step("elasticsearch", es.arequest("GET", "/", timeout=10, retries=0)),
+        _warm_step("ollama", llm.awarm_up()),   # loads the model + prefills the system prompt
+    )
+    # ES/Ollama are best-effort (their connections are now pooled); the model must be loaded.
+    _warmup["ready"] = _warmup["steps"]["embedding_model"]["ok"]
+    print(f"Warm-up done: {_warmup}")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    task = asyncio.create_task(_warm_up()) if API_WARMUP else None
+    yield
+    if task is not None:
+        task.cancel()
+    ingest_jobs.shutdown()
+    await es.aclose()
+    await llm.aclose()
+
+app = FastAPI(title="RAG-Elastic MDP API", version="0.2.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
@@ -46,26 +69,39 @@ app.add_middleware(
 
 # ---------------- health ----------------
 @app.get("/health")
-def health():
+async def health():
     try:
-        r = requests.get(f"{ES_URL}", auth=auth, timeout=5)
+        r = await es.arequest("GET", "/", timeout=5, retries=0)
         ok = r.status_code == 200
     except Exception:
         ok = False
     return {"ok": ok}
 
 @app.get("/healthz")
-def healthz():
-    return health()
+async def healthz():
+    """Readiness: 503 until the startup warm-up has loaded the embedding model."""
+    if not _warmup["ready"]:
+        return JSONResponse(status_code=503, content={"ok": False, "ready": False, "warmup": _warmup["steps"]})
+    return {**(await health()), "ready": True}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "embedding_cache": rag.embedding_cache.stats(),
+        "query_batcher": rag.query_batcher.stats(),
+        "answer_cache": rag.answer_cache.stats() if rag.answer_cache else None,
+        "ingest_job": ingest_jobs.active(),
+        "dense_fallbacks": rag.dense_fallbacks,
+    }
 
 # ---------------- /query ----------------
 @app.post("/query")
-def query_answer(payload: dict = Body(...)):
+async def query_answer(payload: dict = Body(...)):
     """
     Body:
       {
         "q": "...",
-        "mode": "hybrid|elser|dense|bm25",
+        "mode": "hybrid|hybrid-msearch|elser|dense|dense-local|bm25|bm25-local",
         "size": 5,
         "history": [{"user":"...", "answer":"..."}, ...]   # optional
       }
@@ -75,65 +111,89 @@ def query_answer(payload: dict = Body(...)):
     size = int(payload.get("size", 5))
     history = payload.get("history") or None
     try:
-        return rag_answer(q, mode=mode, size=size, history=history)
+        return await rag_answer_async(q, mode=mode, size=size, history=history)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=502, detail=f"Query failed: {e}")
 
-# ---------------- helpers ----------------
-def _download_drive_folder(folder_url: str, out_dir: Path) -> int:
+# ---------------- /query/stream (SSE) ----------------
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/query/stream")
+async def query_answer_stream(payload: dict = Body(...)):
     """
-    Download a *public* Google Drive folder to out_dir using gdown.
-    Returns number of files it reported.
+    Same body as /query. Responds with text/event-stream:
+      event: retrieval  -> {mode, query, results, citations, timings}
+      event: token      -> {"text": "..."}   (repeated)
+      event: done       -> final /query response
+      event: error      -> {"detail": "..."}
     """
-    if gdown is None:
-        raise RuntimeError("gdown is not installed. Add to requirements.txt and pip install.")
-    # Clean-replace for each new folder download
-    if out_dir.exists():
-        shutil.rmtree(out_dir, ignore_errors=True)
-    out_dir.mkdir(parents=True, exist_ok=True)
-    saved = gdown.download_folder(url=folder_url, output=str(out_dir), quiet=False, use_cookies=False)
-    return len(saved) if isinstance(saved, list) else 0
-
-# ---------------- /ingest ----------------
-@app.post("/ingest")
-def ingest_from_drive_or_disk(payload: Optional[dict] = Body(default=None)):
+    q = payload.get("q", "")
+    mode = payload.get("mode", "hybrid")
+    size = int(payload.get("size", 5))
+    history = payload.get("history") or None
+
+    async def events():
+        try:
+            async for event, data in rag_answer_stream(q, mode=mode, size=size, history=history):
+                yield _sse(event, data)
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"Query failed: {e}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------------- /ingest (background jobs) ----------------
+def _on_ingest_finished(job: dict):
+    # New index contents -> answers cached against the old ones are stale.
+    if rag.answer_cache is not None:
+        rag.answer_cache.bump_generation()
+
+# Download/extract/embed run in a separate process (see jobs.py), one job at a time.
+ingest_jobs = IngestJobs(on_finish=_on_ingest_finished)
+
+@app.post("/ingest", status_code=202)
+async def ingest_from_drive_or_disk(payload: Optional[dict] = Body(default=None)):
     """
-    Body (optional): { "folder_url": "https://drive.google.com/drive/folders/<id>" }
-      - If folder_url is provided (or DRIVE_FOLDER_URL is set), we CLEAN the target dir,
-        download PDFs into DATA_DIR, then ingest + embed.
+    Body (optional): { "folder_url": "https://drive.google.com/drive/folders/<id>", "reindex": false }
+      - If folder_url is provided (or DRIVE_FOLDER_URL is set), DATA_DIR is replaced with a
+        fresh copy of the Drive folder, then ingest + embed.
       - If nothing is provided, we ingest whatever PDFs are already in DATA_DIR.
-
-    Returns: { status, downloaded, ingested_chunks, embedded_vectors, data_dir }
+    Ingestion is incremental: unchanged files are skipped, changed files upserted and
+    chunks of removed files deleted (see ingest_pdfs.ingest_folder).
+    With "reindex": true everything is rebuilt into a fresh versioned index that replaces
+    the live one atomically (see reindex.py); queries keep using the old one meanwhile.
+
+    Returns the queued job right away: { id, status, stages, ... }.
+    Poll GET /ingest/{id}; when it succeeds, "result" holds
+    { downloaded, ingested_chunks, embedded_vectors, ingest, data_dir }.
     """
-    folder_url = None
+    folder_url, reindex = None, False
     if payload and isinstance(payload, dict):
         folder_url = payload.get("folder_url")
+        reindex = bool(payload.get("reindex", False))
     if not folder_url:
         folder_url = os.getenv("DRIVE_FOLDER_URL")  # optional fallback
-
-    downloaded = 0
-    try:
-        if folder_url:
-            downloaded = _download_drive_folder(folder_url, DATA_DIR)
-    except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=400, detail=f"Drive download failed: {e}")
-
-    # Ensure ingest scripts read the same folder
-    os.environ["DATA_DIR"] = str(DATA_DIR)
-
-    try:
-        ingested = ingest_local_main(return_count=True) or 0
-        embedded = embed_dense_main() or 0
-    except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Ingestion/embedding failed: {e}")
-
-    return {
-        "status": "ok",
-        "downloaded": downloaded,
-        "ingested_chunks": ingested,
-        "embedded_vectors": embedded,
-        "data_dir": str(DATA_DIR),
-    }
+    return ingest_jobs.submit({"folder_url": folder_url, "data_dir": str(DATA_DIR), "reindex": reindex})
+
+@app.get("/ingest")
+async def ingest_list():
+    return {"jobs": ingest_jobs.list()}
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    """status: queued|running|cancelling|succeeded|failed|cancelled, plus per-stage
+    (download/ingest/embed) counters, elapsed_s and files/chunks/vectors _per_s."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job {job_id}")
+    return job
+
+@app.delete("/ingest/{job_id}")
+async def ingest_cancel(job_id: str):
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job {job_id}")
+    return job
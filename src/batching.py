@@ -0,0 +1,75 @@
+# src/batching.py
+import time, queue, threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+class MicroBatcher:
+    """
+    Dynamic batcher: callers submit single items from any thread; a background thread
+    collects whatever arrives within `window_ms` (up to `max_batch`), runs fn(items) once,
+    and resolves each caller's Future with its own result.
+
+    fn must return one result per input item, in order.
+    """
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 32,
+                 window_ms: float = 2.0, name: str = "micro-batcher"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.name = name
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    def submit(self, item: Any) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        self._q.put((item, fut))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                results = self.fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    # zip() would silently leave the extra callers waiting forever.
+                    raise RuntimeError(f"{self.name}: fn returned {len(results)} results for {len(batch)} items")
+                for (_, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "items": self.items, "largest_batch": self.largest,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch, "window_ms": self.window * 1000.0}
@@ -0,0 +1,232 @@
+# src/bm25_index.py
+import os, re, json, glob, time, threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "data/bm25.idx")
+BM25_REBUILD    = os.getenv("BM25_REBUILD", "0") == "1"     # rebuild after every ingest job
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))                # Elasticsearch defaults
+BM25_B  = float(os.getenv("BM25_B", "0.75"))
+
+# Same fields/boosts as rag_answer._bm25_body (multi_match best_fields: the best field wins).
+FIELDS = {"content": 1.0, "title": 2.0}
+SOURCE_FIELDS = ["title", "source", "page", "content", "drive_url"]
+
+_MAGIC = b"BM25IDX1"
+_ALIGN = 64
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def analyze(text: str) -> List[str]:
+    """Close to ES's standard analyzer: unicode word tokens, lowercased, no stopwords."""
+    return _TOKEN.findall((text or "").lower())
+
+
+# ---------------- single-file, memory-mappable storage ----------------
+# [magic][u64 header length][header json][arrays, each 64-byte aligned]
+# header["arrays"][name] = [dtype, shape, offset]
+
+def _write(path: str, meta: Dict, arrays: Dict[str, np.ndarray]) -> None:
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        layout[name] = [arr.dtype.str, list(arr.shape), offset]
+        offset += arr.nbytes
+    # header length depends on the final offsets, so place arrays after a padded header
+    header = json.dumps({**meta, "arrays": layout}).encode("utf-8")
+    base = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(base + layout[name][2])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, path)
+
+def _read(path: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a BM25 index")
+        n = int.from_bytes(f.read(8), "little")
+        meta = json.loads(f.read(n))
+    base = -(-(len(_MAGIC) + 8 + n) // _ALIGN) * _ALIGN
+    arrays = {}
+    for name, (dtype, shape, offset) in meta.pop("arrays").items():
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=base + offset, shape=tuple(shape))
+    return meta, arrays
+
+def _pack_strings(items: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in items])
+    return np.frombuffer(b"".join(items), dtype=np.uint8), offsets
+
+def _string_at(blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+
+# ---------------- build ----------------
+def build(docs: Iterable[Dict], path: str = BM25_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B) -> Dict:
+    """
+    Build the index from chunk dicts (as produced by ingest_pdfs.extract_pdf; _id = chunk_id).
+    Postings per field are sorted (term_id, doc_id) pairs in typed arrays with a per-term offset
+    table; the BM25 length norm k1 * (1 - b + b * dl / avgdl) is precomputed per doc.
+    """
+    t0 = time.perf_counter()
+    vocab: Dict[str, int] = {}
+    post = {f: (array("I"), array("I"), array("H")) for f in FIELDS}   # term, doc, tf
+    lengths = {f: array("I") for f in FIELDS}
+    ids, sources = [], []
+    for doc_no, d in enumerate(docs):
+        ids.append((d.get("chunk_id") or d.get("_id") or str(doc_no)).encode("utf-8"))
+        sources.append(json.dumps({k: d.get(k) for k in SOURCE_FIELDS}, ensure_ascii=False).encode("utf-8"))
+        for field in FIELDS:
+            toks = analyze(str(d.get(field) or ""))
+            lengths[field].append(len(toks))
+            tf = Counter(toks)
+            terms, docs_, tfs = post[field]
+            terms.extend([vocab.setdefault(t, len(vocab)) for t in tf])
+            docs_.extend([doc_no] * len(tf))
+            tfs.extend([min(c, 65535) for c in tf.values()])
+
+    n_docs, n_terms = len(ids), len(vocab)
+    arrays: Dict[str, np.ndarray] = {}
+    meta = {"version": 1, "n_docs": n_docs, "n_terms": n_terms, "k1": k1, "b": b, "fields": {}}
+    for field, boost in FIELDS.items():
+        terms = np.frombuffer(post[field][0], dtype=np.uint32) if n_docs else np.zeros(0, np.uint32)
+        docs_ = np.frombuffer(post[field][1], dtype=np.uint32) if n_docs else np.zeros(0, np.uint32)
+        tfs = np.frombuffer(post[field][2], dtype=np.uint16) if n_docs else np.zeros(0, np.uint16)
+        order = np.lexsort((docs_, terms))
+        df = np.bincount(terms, minlength=n_terms).astype(np.int64)
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(df)
+        dl = np.frombuffer(lengths[field], dtype=np.uint32).astype(np.float32) if n_docs else np.zeros(0, np.float32)
+        avgdl = float(dl.mean()) if n_docs and dl.sum() else 1.0
+        arrays[f"{field}.offsets"] = offsets
+        arrays[f"{field}.docs"] = docs_[order]
+        arrays[f"{field}.tfs"] = tfs[order]
+        arrays[f"{field}.norm"] = (k1 * (1.0 - b + b * dl / avgdl)).astype(np.float32)
+        meta["fields"][field] = {"boost": boost, "avgdl": avgdl, "postings": int(len(order))}
+
+    terms_sorted = sorted(vocab, key=vocab.get)
+    arrays["vocab.blob"], arrays["vocab.offsets"] = _pack_strings([t.encode("utf-8") for t in terms_sorted])
+    arrays["ids.blob"], arrays["ids.offsets"] = _pack_strings(ids)
+    arrays["src.blob"], arrays["src.offsets"] = _pack_strings(sources)
+    _write(path, meta, arrays)
+    stats = {"docs": n_docs, "terms": n_terms, "bytes": os.path.getsize(path),
+             "seconds": round(time.perf_counter() - t0, 2)}
+    print(f"BM25 index built: {path} {stats}")
+    return stats
+
+def build_from_folder(data_dir: str, path: str = BM25_INDEX_PATH, workers: Optional[int] = None) -> Dict:
+    """Extract + chunk every PDF under data_dir exactly like ingestion does, then build()."""
+    from .ingest_pdfs import INGEST_WORKERS, iter_extracted
+    pdfs = sorted(glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True))
+    chunks = (d for _, docs in iter_extracted(pdfs, workers=INGEST_WORKERS if workers is None else workers,
+                                              data_dir=data_dir) for d in docs)
+    return build(chunks, path)
+
+
+# ---------------- search ----------------
+class BM25Index:
+    """Read side: memory-maps the file; postings are scored with NumPy, one slice per query term."""
+    def __init__(self, path: str = BM25_INDEX_PATH):
+        self.path = path
+        self.meta, self.arrays = _read(path)
+        raw, vo = bytes(self.arrays["vocab.blob"]), self.arrays["vocab.offsets"].tolist()
+        self.vocab = {raw[vo[i]:vo[i + 1]].decode("utf-8"): i for i in range(self.meta["n_terms"])}
+        self.n_docs = self.meta["n_docs"]
+        self.mtime = os.stat(path).st_mtime_ns
+        # IDF as Lucene computes it: log(1 + (N - df + 0.5) / (df + 0.5)), per field
+        self.idf = {}
+        for field in FIELDS:
+            df = np.diff(self.arrays[f"{field}.offsets"]).astype(np.float32)
+            self.idf[field] = np.log1p((self.n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def scores(self, query: str) -> np.ndarray:
+        tids = sorted({self.vocab[t] for t in analyze(query) if t in self.vocab})
+        best = np.zeros(self.n_docs, dtype=np.float32)
+        for field, cfg in self.meta["fields"].items():
+            offsets, docs = self.arrays[f"{field}.offsets"], self.arrays[f"{field}.docs"]
+            tfs, norm, idf = self.arrays[f"{field}.tfs"], self.arrays[f"{field}.norm"], self.idf[field]
+            acc = np.zeros(self.n_docs, dtype=np.float32)
+            for t in tids:
+                lo, hi = offsets[t], offsets[t + 1]
+                if lo == hi:
+                    continue
+                d = docs[lo:hi]
+                tf = tfs[lo:hi].astype(np.float32)
+                acc[d] += idf[t] * tf / (tf + norm[d])      # doc ids are unique within a posting list
+            np.maximum(best, acc * cfg["boost"], out=best)
+        return best
+
+    def search(self, query: str, size: int = 10) -> List[Dict]:
+        if not self.n_docs:
+            return []
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        size = min(size, len(hits))
+        top = hits[np.argpartition(-scores[hits], size - 1)[:size]]
+        top = top[np.lexsort((top, -scores[top]))]          # score desc, then doc order
+        a = self.arrays
+        return [{"_id": _string_at(a["ids.blob"], a["ids.offsets"], i), "_index": "bm25-local",
+                 "_score": float(scores[i]),
+                 "_source": json.loads(_string_at(a["src.blob"], a["src.offsets"], i))} for i in top.tolist()]
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+def get_bm25_index(path: str = BM25_INDEX_PATH) -> BM25Index:
+    """Process-wide index; reopened when the file is rebuilt (checked on every call, a single stat)."""
+    global _index
+    with _index_lock:
+        if not os.path.exists(path):
+            raise RuntimeError(f"BM25 index not built ({path}); run python -m src.bm25_index build")
+        if _index is None or _index.path != path or os.stat(path).st_mtime_ns != _index.mtime:
+            _index = BM25Index(path)
+    return _index
+
+
+# ---------------- benchmark vs Elasticsearch ----------------
+def bench(queries: List[str], size: int = 10, runs: int = 3) -> Dict:
+    """Per-query latency of bm25-local vs ES q_bm25, plus top-k overlap between the two."""
+    from . import rag_answer as rag
+    from .evaluate import percentiles
+    index = get_bm25_index()
+    local_ms, es_ms, overlap = [], [], []
+    for q in queries:
+        for _ in range(runs):
+            t0 = time.perf_counter(); local = index.search(q, size); local_ms.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter(); remote = rag.q_bm25(q, size); es_ms.append((time.perf_counter() - t0) * 1000)
+        a, b = {h["_id"] for h in local}, {h["_id"] for h in remote}
+        overlap.append(len(a & b) / float(max(1, len(b))))
+    return {"queries": len(queries), "size": size, "bm25-local_ms": percentiles(local_ms), "es_ms": percentiles(es_ms),
+            f"overlap@{size}": round(sum(overlap) / max(1, len(overlap)), 4)}
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Embedded BM25 index: build from PDFs, or benchmark against ES")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data/pdfs/_drive_sync"))
+    b.add_argument("--out", default=BM25_INDEX_PATH)
+    bb = sub.add_parser("bench")
+    bb.add_argument("--queries", required=True, help="text file (one query per line) or evaluate.py jsonl")
+    bb.add_argument("--size", type=int, default=10)
+    args = ap.parse_args()
+    if args.cmd == "build":
+        build_from_folder(args.data_dir, args.out)
+    else:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            lines = [l.strip() for l in f if l.strip()]
+        qs = [json.loads(l)["query"] if l.startswith("{") else l for l in lines]
+        print(json.dumps(bench(qs, size=args.size), indent=1, sort_keys=True))
@@ -0,0 +1,165 @@
+# src/bulk.py
+import os, json, time, threading, requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import es
+
+BULK_MAX_BYTES   = int(os.getenv("BULK_MAX_BYTES", str(5 * 1024 * 1024)))   # flush threshold per request
+BULK_MAX_DOCS    = int(os.getenv("BULK_MAX_DOCS", "1000"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "2"))                  # requests in flight
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_BACKOFF     = float(os.getenv("BULK_BACKOFF", "0.5"))                  # seconds, doubled per retry
+
+RETRY_STATUSES = es.RETRY_STATUSES
+
+# (action line, source line). Source is None for deletes.
+Action = Tuple[Dict, Optional[Dict]]
+
+def index_action(index: str, doc: Dict, _id: Optional[str] = None) -> Action:
+    meta = {"_index": index}
+    if _id is not None:
+        meta["_id"] = _id
+    return {"index": meta}, doc
+
+def update_action(index: str, _id: str, partial: Dict) -> Action:
+    return {"update": {"_index": index, "_id": _id}}, {"doc": partial}
+
+def delete_action(index: str, _id: str) -> Action:
+    return {"delete": {"_index": index, "_id": _id}}, None
+
+
+class BulkIndexer:
+    """
+    Streaming _bulk writer shared by the ingest and embedding scripts.
+
+    - consumes any iterable of actions (generators welcome), encoding each one once
+    - flushes by byte size (max_bytes) or doc count (max_docs)
+    - keeps up to `concurrency` requests in flight on the shared pooled transport (es.py),
+      bodies gzipped on the wire
+    - retries only the items ES rejected with 429/503, with exponential backoff + jitter;
+      a whole batch is resent after a connection error, or after a timeout only when every
+      action has an explicit _id (ES may have applied it; auto-id docs would be duplicated)
+    - refreshes the touched indices once at the end (refresh=True)
+    """
+    def __init__(self, pipeline: Optional[str] = None, refresh: bool = True,
+                 max_bytes: int = BULK_MAX_BYTES, max_docs: int = BULK_MAX_DOCS,
+                 concurrency: int = BULK_CONCURRENCY, max_retries: int = BULK_MAX_RETRIES,
+                 backoff: float = BULK_BACKOFF, transport: Optional[es.Transport] = None):
+        self.pipeline = pipeline
+        self.refresh = refresh
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.transport = transport or es.get_transport()
+        self._lock = threading.Lock()
+        self._indices: Set[str] = set()
+        self.stats = {"ok": 0, "failed": 0, "retried": 0, "requests": 0}
+        self.first_error = None
+
+    # ---------- public ----------
+    def index(self, actions: Iterable[Action]) -> Dict[str, int]:
+        slots = threading.BoundedSemaphore(self.concurrency)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk") as pool:
+            def submit(lines: List[bytes], idempotent: bool):
+                slots.acquire()   # back-pressure: the producer waits while `concurrency` requests are in flight
+                fut = pool.submit(self._send, lines, idempotent)
+                fut.add_done_callback(lambda _: slots.release())
+                futures.append(fut)
+
+            buf, buf_bytes, idempotent = [], 0, True
+            for action, source in actions:
+                idempotent = self._track_index(action) and idempotent
+                line = self._encode(action, source)
+                buf.append(line); buf_bytes += len(line)
+                if buf_bytes >= self.max_bytes or len(buf) >= self.max_docs:
+                    submit(buf, idempotent)
+                    buf, buf_bytes, idempotent = [], 0, True
+            if buf:
+                submit(buf, idempotent)
+            for fut in futures:
+                fut.result()
+
+        if self.refresh:
+            self.refresh_indices()
+        if self.first_error is not None:
+            print("Bulk completed with errors (first):", json.dumps(self.first_error, indent=2))
+        print(f"Bulk done: {self.stats}")
+        return dict(self.stats)
+
+    def refresh_indices(self) -> None:
+        if self._indices:
+            r = self.transport.post(f"/{','.join(sorted(self._indices))}/_refresh", timeout=120)
+            if r.status_code != 200:
+                print("Refresh failed:", r.status_code, r.text)
+
+    # ---------- internals ----------
+    @staticmethod
+    def _encode(action: Dict, source: Optional[Dict]) -> bytes:
+        out = json.dumps(action)
+        if source is not None:
+            out += "\n" + json.dumps(source, ensure_ascii=False)
+        return (out + "\n").encode("utf-8")
+
+    def _track_index(self, action: Dict) -> bool:
+        """Remember the action's index; True if it has an explicit _id (safe to send twice)."""
+        meta = next(iter(action.values()))
+        if meta.get("_index"):
+            self._indices.add(meta["_index"])
+        return "_id" in meta
+
+    def _path(self) -> str:
+        return f"/_bulk?pipeline={self.pipeline}" if self.pipeline else "/_bulk"
+
+    def _sleep(self, attempt: int) -> None:
+        time.sleep(es.backoff_delay(attempt, self.backoff))
+
+    def _send(self, lines: List[bytes], idempotent: bool = True) -> None:
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                self.stats["requests"] += 1
+            try:
+                # retries=0: this loop retries, and only the items ES actually rejected
+                r = self.transport.post(self._path(), b"".join(lines), timeout=120, retries=0)
+            except requests.RequestException as e:
+                # A read timeout may mean ES applied the batch: resending auto-id actions duplicates them.
+                resend = isinstance(e, requests.ConnectionError) or idempotent
+                if not resend or attempt == self.max_retries:
+                    self._fail(len(lines), {"reason": str(e)})
+                    return
+                self._sleep(attempt)
+                continue
+
+            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._sleep(attempt)
+                continue
+            if r.status_code != 200:
+                self._fail(len(lines), {"status": r.status_code, "body": r.text[:500]})
+                return
+
+            retry, ok = [], 0
+            for line, item in zip(lines, r.json().get("items", [])):
+                res = next(iter(item.values()))
+                status = res.get("status", 500)
+                if status < 300:
+                    ok += 1
+                elif status in RETRY_STATUSES and attempt < self.max_retries:
+                    retry.append(line)
+                else:
+                    self._fail(1, res.get("error"))
+            with self._lock:
+                self.stats["ok"] += ok
+                self.stats["retried"] += len(retry)
+            if not retry:
+                return
+            lines = retry
+            self._sleep(attempt)
+
+    def _fail(self, n: int, error) -> None:
+        with self._lock:
+            self.stats["failed"] += n
+            if self.first_error is None:
+                self.first_error = error
@@ -0,0 +1,296 @@
+# src/cache.py
+import os, re, json, time, hashlib, sqlite3, threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))      # max entries
+EMBED_CACHE_MB   = float(os.getenv("EMBED_CACHE_MB", "64"))         # max memory
+EMBED_CACHE_TTL  = float(os.getenv("EMBED_CACHE_TTL", "86400"))     # seconds, 0 = no expiry
+EMBED_CACHE_DIR  = os.getenv("EMBED_CACHE_DIR", "")                 # set to share a disk tier across workers
+
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory").lower()  # memory | disk | off
+ANSWER_CACHE_SIZE    = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL     = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_DIR     = os.getenv("ANSWER_CACHE_DIR", "data/cache")
+
+# Models whose tokenizer lowercases its input (do_lower_case): case can't change their vector,
+# so their cache keys are case-insensitive. Any other model keys on the text as sent.
+UNCASED_MODELS = {m.strip() for m in os.getenv(
+    "UNCASED_MODELS", "sentence-transformers/all-MiniLM-L6-v2,sentence-transformers/all-MiniLM-L12-v2"
+).split(",") if m.strip()}
+
+_WS = re.compile(r"\s+")
+def normalize_text(text: str) -> str:
+    """Collapse whitespace (tokenizers split on it anyway); case is left alone."""
+    return _WS.sub(" ", (text or "").strip())
+
+def is_uncased(model_name: str) -> bool:
+    return model_name.split("@", 1)[0] in UNCASED_MODELS   # model_id() appends "@backend"
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha1("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU bounded by entry count and (approximate) bytes, with optional TTL.
+    sizeof(value) -> bytes is used for the memory bound.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 0, ttl: float = 0,
+                 sizeof: Callable[[Any], int] = lambda v: 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and time.time() - item[2] > self.ttl:
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value) -> None:
+        size = self.sizeof(value) + len(key)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, time.time())
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries
+                                  or (self.max_bytes and self._bytes > self.max_bytes)):
+                self._drop(next(iter(self._data)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self._data), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+class SqliteKV:
+    """Small on-disk key/value store (WAL mode) so several worker processes can share a cache tier."""
+    def __init__(self, path: str, table: str = "kv", ttl: float = 0):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path, self.table, self.ttl = path, table, ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (k TEXT PRIMARY KEY, v BLOB, t REAL)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT v, t FROM {self.table} WHERE k = ?", (key,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.table} (k, v, t) VALUES (?, ?, ?)",
+                               (key, value, time.time()))
+            self._conn.commit()
+
+    def put_many(self, items: List[tuple]) -> None:
+        """(key, value) pairs in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self.table} (k, v, t) VALUES (?, ?, ?)",
+                                   [(k, v, now) for k, v in items])
+            self._conn.commit()
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE k = ?", [(k,) for k in keys])
+            self._conn.commit()
+
+    def incr(self, key: str) -> int:
+        """Atomically increment an integer counter stored under key; returns the new value."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(f"SELECT v FROM {self.table} WHERE k = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row else 1
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.table} (k, v, t) VALUES (?, ?, ?)",
+                               (key, value, time.time()))
+            self._conn.commit()
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+
+class EmbeddingCache:
+    """
+    Query-embedding cache: in-process LRU (float32 arrays) in front of an optional sqlite tier.
+    Keys are (model name, normalize_text(query)), lowercased only for UNCASED_MODELS.
+    """
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE, max_mb: float = EMBED_CACHE_MB,
+                 ttl: float = EMBED_CACHE_TTL, disk_dir: str = EMBED_CACHE_DIR):
+        self.mem = LRUCache(max_entries=max_entries, max_bytes=int(max_mb * 1024 * 1024), ttl=ttl,
+                            sizeof=lambda v: v.itemsize * len(v))
+        self.disk = SqliteKV(os.path.join(disk_dir, "embeddings.sqlite"), table="embeddings", ttl=ttl) \
+            if disk_dir else None
+        self.disk_hits = 0
+
+    def lookup(self, text: str, model_name: str):
+        """(key, normalized_text, vector or None); the async path encodes misses itself, then store()s them."""
+        norm = normalize_text(text)
+        key = cache_key(model_name, norm.lower() if is_uncased(model_name) else norm)
+        vec = self.mem.get(key)
+        if vec is None and self.disk is not None:
+            raw = self.disk.get(key)
+            if raw is not None:
+                vec = array("f"); vec.frombytes(raw)
+                self.mem.put(key, vec)
+                self.disk_hits += 1
+        return key, norm, (vec.tolist() if vec is not None else None)
+
+    def store(self, key: str, vec: List[float]) -> List[float]:
+        """Cache vec under key; returns it as stored (float32), so a miss and a later hit agree."""
+        vec = array("f", vec)
+        self.mem.put(key, vec)
+        if self.disk is not None:
+            self.disk.put(key, vec.tobytes())
+        return vec.tolist()
+
+    def get_or_compute(self, text: str, model_name: str, compute: Callable[[str], List[float]]) -> List[float]:
+        """Return the vector for text, calling compute(normalized_text) only on a miss in both tiers."""
+        key, norm, vec = self.lookup(text, model_name)
+        return vec if vec is not None else self.store(key, compute(norm))
+
+    def clear(self) -> None:
+        self.mem.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        out = self.mem.stats()
+        out["disk_hits"] = self.disk_hits
+        out["disk"] = self.disk.path if self.disk is not None else None
+        return out
+
+
+# ---------------- answer cache ----------------
+def history_fingerprint(history: Optional[List[Dict]]) -> str:
+    if not history:
+        return "-"
+    turns = [(normalize_text(t.get("user") or ""), (t.get("answer") or "").strip()) for t in history]
+    return cache_key(json.dumps(turns, ensure_ascii=False))
+
+class MemoryAnswerBackend:
+    """Per-process LRU; the index generation lives in this process only."""
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.lru = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._generation = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.lru.get(key)
+
+    def put(self, key: str, entry: Dict) -> None:
+        self.lru.put(key, entry)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def bump(self) -> int:
+        self._generation += 1
+        self.lru.clear()
+        return self._generation
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self.lru.stats()}
+
+class DiskAnswerBackend:
+    """sqlite store shared by every worker on the host; the generation counter is shared too."""
+    def __init__(self, cache_dir: str = ANSWER_CACHE_DIR, ttl: float = ANSWER_CACHE_TTL):
+        path = os.path.join(cache_dir, "answers.sqlite")
+        self.kv = SqliteKV(path, table="answers", ttl=ttl)
+        self.meta = SqliteKV(path, table="meta")
+
+    def get(self, key: str) -> Optional[Dict]:
+        raw = self.kv.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, key: str, entry: Dict) -> None:
+        self.kv.put(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def generation(self) -> int:
+        raw = self.meta.get("generation")
+        return int(raw) if raw is not None else 0
+
+    def bump(self) -> int:
+        gen = self.meta.incr("generation")
+        self.kv.clear()
+        return gen
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": "disk", "path": self.kv.path}
+
+class AnswerCache:
+    """
+    Full-answer cache keyed by (normalized query, mode, size, history fingerprint).
+    Every entry records the index generation it was computed against; bump_generation()
+    (called after ingestion) makes all older entries misses.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, mode: str, size: int, history: Optional[List[Dict]] = None) -> str:
+        return cache_key(normalize_text(query), mode, str(size), history_fingerprint(history))
+
+    def generation(self) -> int:
+        return self.backend.generation()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.backend.get(key)
+        if entry is None or entry.get("generation") != self.backend.generation():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["value"]
+
+    def put(self, key: str, value: Dict, generation: int) -> None:
+        # generation is read *before* computing the answer, so a re-ingest that lands
+        # mid-query cannot get a stale answer stored under the new generation.
+        if generation == self.backend.generation():
+            self.backend.put(key, {"generation": generation, "value": value})
+
+    def bump_generation(self) -> int:
+        return self.backend.bump()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.backend.describe(), "generation": self.generation(),
+                "hits": self.hits, "misses": self.misses}
+
+def get_answer_cache(backend: str = ANSWER_CACHE_BACKEND) -> Optional[AnswerCache]:
+    if backend == "off":
+        return None
+    if backend == "disk":
+        return AnswerCache(DiskAnswerBackend())
+    return AnswerCache(MemoryAnswerBackend())
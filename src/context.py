@@ -0,0 +1,158 @@
+# src/context.py
+import os, re, math
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# Prompt size drives Ollama prefill time, so the LLM context is assembled under a token budget:
+# overlapping chunks of the same page are merged (CHUNK_OVERLAP words are sent once), duplicates
+# dropped, and whatever does not fit is cut from the lowest-ranked hits first.
+CONTEXT_TOKEN_BUDGET     = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))       # 0 = unbounded
+CONTEXT_TOKENS_PER_WORD  = float(os.getenv("CONTEXT_TOKENS_PER_WORD", "1.3"))   # estimate for English text
+CONTEXT_MIN_OVERLAP      = int(os.getenv("CONTEXT_MIN_OVERLAP", "8"))           # words; shorter overlaps are coincidence
+CONTEXT_MIN_PARTIAL      = int(os.getenv("CONTEXT_MIN_PARTIAL", "64"))          # tokens; a smaller tail is dropped, not cut
+
+_ORDINAL = re.compile(r":(\d+):(\d+)$")   # ingest_pdfs.chunk_id: {doc_key}:{page}:{ordinal}
+
+
+def estimate_tokens(text: str) -> int:
+    """Whitespace words scaled to LLM tokens (the chunker counts words too; no tokenizer needed)."""
+    return int(math.ceil(len(text.split()) * CONTEXT_TOKENS_PER_WORD))
+
+def _words_tokens(n_words: int) -> int:
+    return int(math.ceil(n_words * CONTEXT_TOKENS_PER_WORD))
+
+def overlap(a: List[str], b: List[str], min_words: int = CONTEXT_MIN_OVERLAP) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if shorter than min_words)."""
+    if not a or not b:
+        return 0
+    longest = min(len(a), len(b))
+    for k in range(longest, max(min_words, 1) - 1, -1):
+        if a[-k] == b[0] and a[-k:] == b[:k]:
+            return k
+    return 0
+
+def _contains(outer: List[str], inner: List[str]) -> bool:
+    return len(inner) <= len(outer) and f" {' '.join(inner)} " in f" {' '.join(outer)} "
+
+
+class _Chunk:
+    __slots__ = ("hit", "rank", "group", "ordinal", "words", "truncated", "cost")
+
+    def __init__(self, hit: Dict, rank: int):
+        src = hit.get("_source", {})
+        m = _ORDINAL.search(hit.get("_id") or "")
+        self.hit, self.rank = hit, rank
+        self.group = (src.get("source"), src.get("page"))
+        self.ordinal = int(m.group(2)) if m else None
+        self.words = (src.get("content") or "").split()
+        self.truncated = False
+        self.cost = 0
+
+
+def _consecutive(a: _Chunk, b: _Chunk) -> bool:
+    return a.ordinal is not None and b.ordinal is not None and b.ordinal == a.ordinal + 1
+
+def _shared(chunk: _Chunk, kept: List[_Chunk]) -> Tuple[int, int]:
+    """(head, tail): words of chunk already sent by kept chunks of its page ending / starting there."""
+    head = max((overlap(o.words, chunk.words) for o in kept), default=0)
+    tail = max((overlap(chunk.words, o.words) for o in kept), default=0)
+    return head, tail
+
+def _select(chunks: List[_Chunk], budget: int, stats: Dict) -> List[_Chunk]:
+    """Walk hits best-first; stop at the first one that no longer fits (cutting it if enough room is left)."""
+    kept: List[_Chunk] = []
+    by_group: Dict[Tuple, List[_Chunk]] = defaultdict(list)
+    used = 0
+    for i, c in enumerate(chunks):
+        same_page = by_group[c.group]
+        if not c.words or any(_contains(o.words, c.words) for o in same_page):
+            stats["deduped"] += 1
+            continue
+        # A lower-ranked superset (e.g. the chunk a short page tail repeats) replaces what it contains.
+        for o in [o for o in same_page if _contains(c.words, o.words)]:
+            same_page.remove(o); kept.remove(o)
+            used -= o.cost
+            c.rank = min(c.rank, o.rank)
+            stats["deduped"] += 1
+        head, tail = _shared(c, same_page)
+        cost = _words_tokens(max(0, len(c.words) - head - tail))
+        if budget and used + cost > budget:
+            room = budget - used
+            if room >= CONTEXT_MIN_PARTIAL or not kept:
+                # keep the head (already sent) plus as much new text as fits
+                c.words = c.words[:head + max(1, int(room / CONTEXT_TOKENS_PER_WORD))]
+                c.truncated = True
+                kept.append(c)
+                stats["truncated"] += 1
+                i += 1
+            stats["dropped"] = len(chunks) - i
+            break
+        used += cost
+        c.cost = cost
+        kept.append(c); same_page.append(c)
+    return kept
+
+def _merge(group: List[_Chunk]) -> List[List[_Chunk]]:
+    """Chain a page's chunks into runs of overlapping or consecutive (by chunk ordinal) chunks."""
+    group = sorted(group, key=lambda c: (c.ordinal is None, c.ordinal if c.ordinal is not None else c.rank))
+    runs: List[List[_Chunk]] = []
+    for c in group:
+        for run in runs:
+            last, first = run[-1], run[0]
+            if overlap(last.words, c.words) or (_consecutive(last, c) and not last.truncated):
+                run.append(c)
+                break
+            if overlap(c.words, first.words):
+                run.insert(0, c)
+                break
+        else:
+            runs.append([c])
+    return runs
+
+def _run_words(run: List[_Chunk]) -> List[str]:
+    words = list(run[0].words)
+    for prev, c in zip(run, run[1:]):
+        # Neighbouring chunks of one page share exactly their overlap, however short (a page's
+        # last chunk can be a few words that the previous chunk already ends with).
+        shared = overlap(words, c.words, min_words=1 if _consecutive(prev, c) else CONTEXT_MIN_OVERLAP)
+        words.extend(c.words[shared:])
+    return words
+
+def assemble_context(hits: List[Dict], budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[Dict], Dict]:
+    """
+    Ranked hits -> (blocks, stats).
+
+    Each block is one contiguous span of a source/page: {"id", "ids", "title", "page", "source",
+    "drive_url", "snippet", "tokens"}, in the rank order of its best hit, so [Title p.Page]
+    citations map back exactly as before. Stats report token counts before/after packing.
+    """
+    chunks = [_Chunk(h, rank) for rank, h in enumerate(hits)]
+    stats = {"hits": len(hits), "budget": budget, "deduped": 0, "merged": 0, "dropped": 0, "truncated": 0,
+             "context_tokens_raw": sum(_words_tokens(len(c.words)) for c in chunks)}
+    kept = _select(chunks, budget, stats)
+
+    by_group: Dict[Tuple, List[_Chunk]] = defaultdict(list)
+    for c in kept:
+        by_group[c.group].append(c)
+    runs = [run for group in by_group.values() for run in _merge(group)]
+    runs.sort(key=lambda run: min(c.rank for c in run))
+
+    blocks = []
+    for run in runs:
+        best = min(run, key=lambda c: c.rank)
+        src = best.hit.get("_source", {})
+        text = " ".join(_run_words(run))
+        blocks.append({
+            "id": best.hit.get("_id"),
+            "ids": [c.hit.get("_id") for c in sorted(run, key=lambda c: c.rank)],
+            "title": src.get("title"),
+            "page": src.get("page"),
+            "source": src.get("source"),
+            "drive_url": src.get("drive_url"),
+            "snippet": text,
+            "tokens": estimate_tokens(text),
+        })
+    stats["merged"] = len(kept) - len(runs)
+    stats["blocks"] = len(blocks)
+    stats["context_tokens"] = sum(b["tokens"] for b in blocks)
+    return blocks, stats
@@ -1,95 +1,153 @@
-import os, json, requests
-from requests.auth import HTTPBasicAuth
-from sentence_transformers import SentenceTransformer
+import os, queue, threading, requests
+
+from . import es
+from .bulk import BulkIndexer, update_action
+from .embeddings import get_model
 
-ES_URL  = os.getenv("ES_URL", "http://localhost:9200")
-ES_USER = os.getenv("ES_USERNAME", "elastic")
-ES_PASS = os.getenv("ES_PASSWORD", "elastic")
 INDEX   = os.getenv("ES_INDEX", "docs_rag")
-MODEL_NAME = os.getenv("DENSE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "256"))             # docs per scan page / encode call
+EMBED_QUEUE_DEPTH = int(os.getenv("EMBED_QUEUE_DEPTH", "4"))   # pages buffered ahead of the encoder
+PIT_KEEP_ALIVE = os.getenv("PIT_KEEP_ALIVE", "5m")
 
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
-headers_json   = {"Content-Type": "application/json"}
-headers_ndjson = {"Content-Type": "application/x-ndjson"}
+def open_pit(index=INDEX):
+    r = es.post(f"/{index}/_pit?keep_alive={PIT_KEEP_ALIVE}")
+    r.raise_for_status()
+    return r.json()["id"]
 
-_model = None
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(MODEL_NAME)
-    return _model
+def close_pit(pit_id):
+    try:
+        es.delete("/_pit", {"id": pit_id})
+    except requests.RequestException as e:
+        print("Closing PIT failed (it will expire on its own):", e)
 
-def scan(batch_size=256):
+def scan(batch_size=EMBED_BATCH, index=INDEX):
     """
     Stream ONLY docs that do NOT yet have dense_vec.
+
+    Pages through a point-in-time snapshot (search_after on _shard_doc), so the vectors we
+    write while scanning cannot shift or shrink the result set under our feet.
     """
-    url = f"{ES_URL}/{INDEX}/_search"
+    pit_id = open_pit(index)
     body = {
         "size": batch_size,
-        "sort": [{"_doc": "asc"}],
+        "sort": [{"_shard_doc": "asc"}],
         "_source": ["content"],
         "query": {
             "bool": {
                 "must_not": {"exists": {"field": "dense_vec"}}
             }
-        }
+        },
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
     }
-    search_after = None
-    while True:
-        if search_after:
-            body["search_after"] = search_after
-        r = requests.post(url, auth=auth, headers=headers_json, data=json.dumps(body))
-        r.raise_for_status()
-        hits = r.json()["hits"]["hits"]
-        if not hits:
-            break
-        yield hits
-        search_after = hits[-1]["sort"]
+    try:
+        while True:
+            r = es.post("/_search", body, timeout=60)
+            r.raise_for_status()
+            resp = r.json()
+            pit_id = resp.get("pit_id", pit_id)
+            body["pit"]["id"] = pit_id
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            yield hits
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        close_pit(pit_id)
 
-def bulk_update(pairs):
+def bulk_update(pairs, refresh=False, index=INDEX):
     """
     pairs: list of tuples (_id, vector:list[float])
     """
     if not pairs:
         return
-    lines = []
-    for _id, vec in pairs:
-        lines.append(json.dumps({"update": {"_index": INDEX, "_id": _id}}))
-        lines.append(json.dumps({"doc": {"dense_vec": vec}}))
-    ndjson = "\n".join(lines) + "\n"
-    r = requests.post(f"{ES_URL}/_bulk?refresh=false", auth=auth,
-                      headers=headers_ndjson, data=ndjson.encode("utf-8"))
-    if r.status_code != 200:
-        print("Bulk HTTP error:", r.status_code, r.text)
-        return
-    resp = r.json()
-    if resp.get("errors"):
-        for it in resp.get("items", []):
-            err = it.get("update", {}).get("error")
-            if err:
-                print("Bulk error (first):", json.dumps(err, indent=2))
-                break
-    else:
-        print(f"Updated {len(pairs)} docs")
+    BulkIndexer(refresh=refresh).index(update_action(index, _id, {"dense_vec": vec}) for _id, vec in pairs)
+
+# ---------------- pipelined backfill ----------------
+_DONE = object()
 
-def main():
+def _prefetch(gen, depth):
+    """
+    Run a generator on its own thread, `depth` items ahead of the consumer.
+    When the consumer stops early (an error while encoding/writing), the thread is told to stop
+    and gen is closed, so scan() still closes its PIT; a scanner error is re-raised here.
+    """
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def worker():
+        try:
+            for item in gen:
+                if not put(item):
+                    break
+        except BaseException as e:   # surface scanner errors in the consumer
+            put(e)
+        finally:
+            gen.close()
+            put(_DONE)
+    thread = threading.Thread(target=worker, name="dense-scan", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def main(progress=None, index=INDEX):
+    """
+    Three overlapping stages:
+      scanner (thread, PIT pages, bounded queue) -> encoder (this thread) -> BulkIndexer
+      (writer pool, bounded in-flight requests).
+    Fetching page N+1 and writing page N-1 both happen while page N is being encoded.
+    progress("embed", {"vectors": n}) is called after every page; it may raise to abort.
+    """
+    from .embed_store import encode_with_store, get_store   # numpy; only needed when we actually embed
     total = 0
     model = get_model()
-    for hits in scan():
-        texts = []
-        ids   = []
-        for h in hits:
-            t = (h["_source"] or {}).get("content") or ""
-            if t and t.strip():
-                texts.append(t)
-                ids.append(h["_id"])
-        if not ids:
-            continue
-        vecs = model.encode(texts, normalize_embeddings=True).tolist()
-        bulk_update(list(zip(ids, vecs)))
-        total += len(ids)
-        print(f"Progress: {total} vectors")
+
+    def actions():
+        nonlocal total
+        pages = _prefetch(scan(index=index), EMBED_QUEUE_DEPTH)
+        try:
+            for hits in pages:
+                texts = []
+                ids   = []
+                for h in hits:
+                    t = (h["_source"] or {}).get("content") or ""
+                    if t and t.strip():
+                        texts.append(t)
+                        ids.append(h["_id"])
+                if not ids:
+                    continue
+                vecs = encode_with_store(
+                    texts, lambda batch: model.encode(batch, normalize_embeddings=True, batch_size=len(batch)).tolist())
+                for _id, vec in zip(ids, vecs):
+                    yield update_action(index, _id, {"dense_vec": vec})
+                total += len(ids)
+                print(f"Progress: {total} vectors")
+                if progress:
+                    progress("embed", {"vectors": total})
+        finally:
+            pages.close()   # stops the scanner thread, which closes the PIT
+
+    BulkIndexer(refresh=True, max_docs=EMBED_BATCH).index(actions())
+    if get_store() is not None:
+        get_store().flush()
     print(f"Done. Total vectors written: {total}")
+    if progress:
+        progress("embed", {"vectors": total})
     return total
 
 if __name__ == "__main__":
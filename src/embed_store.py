@@ -0,0 +1,191 @@
+# src/embed_store.py
+import os, json, hashlib, threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .embeddings import model_id
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", "data/embed_store")   # "" disables the store
+EMBED_STORE_MAX = int(os.getenv("EMBED_STORE_MAX", "500000"))       # max vectors kept on disk
+DENSE_DIMS  = int(os.getenv("DENSE_DIMS", "384"))
+
+_KEY_BYTES = 20   # raw sha1 digest; stored as uint8 rows (an all-zero row is a free slot)
+EMBED_STORE_FLUSH_EVERY = int(os.getenv("EMBED_STORE_FLUSH_EVERY", "8192"))   # new vectors between index writes
+
+
+def content_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha1(f"{model_name}\x00{text}".encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Content-addressed embedding store: sha1(model name, chunk text) -> float32 vector.
+
+    On disk (under `path`):
+      vectors.f32  memory-mapped float32 matrix [capacity, dim]
+      keys.npy     sha1 digest per row (all zeros = free slot)
+      clock.npy    last-use tick per row, for LRU eviction once `max_entries` is reached
+      meta.json    model / dim / capacity; a mismatch resets the store
+    """
+    def __init__(self, path: str = EMBED_STORE_DIR, model_name: Optional[str] = None, dim: int = DENSE_DIMS,
+                 max_entries: int = EMBED_STORE_MAX, initial_capacity: int = 4096):
+        model_name = model_name or model_id()
+        self.path, self.model_name, self.dim = path, model_name, dim
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._vec_path = os.path.join(path, "vectors.f32")
+        meta = self._read_meta()
+        if meta and meta.get("model") == model_name and meta.get("dim") == dim and os.path.exists(self._vec_path):
+            self.capacity = meta["capacity"]
+            self.keys = np.load(os.path.join(path, "keys.npy"))
+            self.clock = np.load(os.path.join(path, "clock.npy"))
+            self.tick = int(meta.get("tick", 0))
+        else:
+            self.capacity = min(initial_capacity, self.max_entries)
+            self.keys = np.zeros((self.capacity, _KEY_BYTES), dtype=np.uint8)
+            self.clock = np.zeros(self.capacity, dtype=np.int64)
+            self.tick = 0
+            with open(self._vec_path, "wb") as f:
+                f.truncate(self.capacity * dim * 4)
+        self.vectors = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+        used = self.keys.any(axis=1)
+        self.slots = {self.keys[i].tobytes(): i for i in np.flatnonzero(used).tolist()}
+        self.free = np.flatnonzero(~used)[::-1].tolist()
+        self._unflushed = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- public ----------
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        out: List[Optional[List[float]]] = []
+        with self._lock:
+            self.tick += 1
+            for t in texts:
+                slot = self.slots.get(content_key(self.model_name, t))
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    self.clock[slot] = self.tick
+                    out.append(self.vectors[slot].tolist())
+        return out
+
+    def put_many(self, texts: List[str], vecs: List[List[float]]) -> None:
+        with self._lock:
+            self.tick += 1
+            for t, v in zip(texts, vecs):
+                key = content_key(self.model_name, t)
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = self._take_slot()
+                    self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                    self.slots[key] = slot
+                    self._unflushed += 1
+                self.vectors[slot] = np.asarray(v, dtype=np.float32)
+                self.clock[slot] = self.tick
+
+    def maybe_flush(self, every: int = EMBED_STORE_FLUSH_EVERY) -> None:
+        if self._unflushed >= every:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write_index()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def stats(self):
+        return {"entries": len(self.slots), "capacity": self.capacity, "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "path": self.path}
+
+    # ---------- internals ----------
+    def _write_index(self) -> None:
+        # Vectors first: keys on disk must never point at a row whose vector isn't written yet.
+        self._unflushed = 0
+        self.vectors.flush()
+        self._save(os.path.join(self.path, "keys.npy"), self.keys)
+        self._save(os.path.join(self.path, "clock.npy"), self.clock)
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "capacity": self.capacity,
+                       "tick": self.tick}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _take_slot(self) -> int:
+        if not self.free:
+            if self.capacity < self.max_entries:
+                self._grow(min(self.capacity * 2, self.max_entries))
+            else:
+                self._evict(max(1, self.capacity // 10))
+        return self.free.pop()
+
+    def _grow(self, new_capacity: int) -> None:
+        self.vectors.flush()
+        del self.vectors
+        with open(self._vec_path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.vectors = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self.keys = np.concatenate([self.keys, np.zeros((new_capacity - self.capacity, _KEY_BYTES), dtype=np.uint8)])
+        self.clock = np.concatenate([self.clock, np.zeros(new_capacity - self.capacity, dtype=np.int64)])
+        self.free.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def _evict(self, n: int) -> None:
+        # Least-recently-used rows; evicting a batch keeps this off the per-insert path.
+        victims = np.argpartition(self.clock, n - 1)[:n]
+        for slot in victims.tolist():
+            self.slots.pop(self.keys[slot].tobytes(), None)
+            self.keys[slot] = 0
+            self.clock[slot] = 0
+            self.free.append(slot)
+        # Persist the freed keys before any of these rows is overwritten: otherwise a crash before
+        # the next flush would leave keys.npy mapping the evicted texts to the new vectors.
+        self._write_index()
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _save(path: str, arr: np.ndarray) -> None:
+        tmp = path + ".tmp.npy"
+        np.save(tmp, arr)
+        os.replace(tmp, path)
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+def get_store() -> Optional[EmbeddingStore]:
+    global _store
+    if not EMBED_STORE_DIR:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore()
+    return _store
+
+def encode_with_store(texts: List[str], encode: Callable[[List[str]], List[List[float]]],
+                      store: Optional[EmbeddingStore] = None) -> List[List[float]]:
+    """
+    Vectors for texts, calling encode() only for texts the store has never seen.
+    Pass store=None to use the process-wide store (or encode everything when disabled).
+    New vectors are persisted every EMBED_STORE_FLUSH_EVERY inserts; call flush() when done.
+    """
+    if store is None:
+        store = get_store()
+    if store is None:
+        return encode(texts)
+    vecs = store.get_many(texts)
+    missing = list(dict.fromkeys(texts[i] for i, v in enumerate(vecs) if v is None))   # unique, in order
+    if missing:
+        fresh = dict(zip(missing, encode(missing)))
+        store.put_many(missing, [fresh[t] for t in missing])
+        store.maybe_flush()
+        vecs = [v if v is not None else fresh[t] for t, v in zip(texts, vecs)]
+    return vecs
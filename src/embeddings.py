@@ -0,0 +1,112 @@
+# src/embeddings.py
+import os, sys, time, argparse, threading
+from typing import Dict, List, Optional
+
+DENSE_MODEL   = os.getenv("DENSE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+DENSE_DIMS    = int(os.getenv("DENSE_DIMS", "384"))
+# torch       : fp32 PyTorch SentenceTransformer (reference)
+# torch-int8  : same model, Linear layers dynamically quantized to int8 (CPU)
+# onnx        : ONNX Runtime export shipped with the model repo
+# onnx-int8   : ONNX Runtime, int8-quantized export (DENSE_ONNX_FILE)
+DENSE_BACKEND = os.getenv("DENSE_BACKEND", "torch").lower()
+DENSE_ONNX_FILE = os.getenv("DENSE_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+PARITY_MIN_COSINE = float(os.getenv("DENSE_PARITY_MIN_COSINE", "0.98"))
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+PARITY_TEXTS = [
+    "What is the submission deadline for the final project?",
+    "Reciprocal rank fusion combines several ranked lists into one.",
+    "The ELSER model expands text into weighted sparse tokens.",
+    "Dense vectors are compared with cosine similarity in the kNN search.",
+    "Refunds are processed within ten business days of the request.",
+    "football match results",
+]
+
+def model_id(name: str = DENSE_MODEL, backend: str = DENSE_BACKEND) -> str:
+    """Identity used in cache/store keys: vectors from different backends are not byte-identical."""
+    return name if backend == "torch" else f"{name}@{backend}"
+
+def load_model(name: str = DENSE_MODEL, backend: str = DENSE_BACKEND):
+    """
+    Return an object with SentenceTransformer's encode() for the selected backend.
+    Every backend yields the same normalized DENSE_DIMS-dim vectors (see parity_check).
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend == "torch-int8":
+        import torch
+        model = SentenceTransformer(name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(name, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(name, backend="onnx", model_kwargs={"file_name": DENSE_ONNX_FILE})
+    raise ValueError(f"Unknown DENSE_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+# ---------------- shared provider ----------------
+# One model per process: query encoding, inline ingestion and the backfill all share it.
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_model()
+    return _model
+
+def warm_up() -> float:
+    """Load the model and run one encode (first-inference setup); returns elapsed ms."""
+    t0 = time.perf_counter()
+    get_model().encode(["warm up"], normalize_embeddings=True)
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
+def parity_check(backend: str, reference: str = "torch", texts: Optional[List[str]] = None,
+                 min_cosine: float = PARITY_MIN_COSINE, name: str = DENSE_MODEL) -> Dict[str, float]:
+    """
+    Encode texts with both backends and compare row-wise cosine similarity.
+    Raises AssertionError if shapes differ or any row falls below min_cosine.
+    """
+    import numpy as np
+    texts = texts or PARITY_TEXTS
+    ref = np.asarray(load_model(name, reference).encode(texts, normalize_embeddings=True))
+    out = np.asarray(load_model(name, backend).encode(texts, normalize_embeddings=True))
+    assert out.shape == ref.shape == (len(texts), DENSE_DIMS), f"shape {out.shape} vs {ref.shape}"
+    cos = (ref * out).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(out, axis=1))
+    stats = {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
+    assert stats["min_cosine"] >= min_cosine, f"{backend} vs {reference}: {stats} < {min_cosine}"
+    return stats
+
+def bench(backend: str, runs: int = 50, name: str = DENSE_MODEL) -> Dict[str, float]:
+    """Single-query encode latency (ms) and batch throughput (texts/s) on this machine."""
+    model = load_model(name, backend)
+    model.encode(PARITY_TEXTS[:1])   # warm-up
+    lat = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        model.encode([PARITY_TEXTS[i % len(PARITY_TEXTS)]], normalize_embeddings=True)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    lat.sort()
+    batch = PARITY_TEXTS * 43   # ~256 texts
+    t0 = time.perf_counter()
+    model.encode(batch, normalize_embeddings=True, batch_size=64)
+    return {"p50_ms": round(lat[len(lat) // 2], 2), "p99_ms": round(lat[int(len(lat) * 0.99) - 1], 2),
+            "texts_per_s": round(len(batch) / (time.perf_counter() - t0), 1)}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embedding backend parity check + CPU benchmark")
+    ap.add_argument("backends", nargs="*", default=[b for b in BACKENDS if b != "torch"])
+    ap.add_argument("--min-cosine", type=float, default=PARITY_MIN_COSINE)
+    args = ap.parse_args()
+    print("torch:", bench("torch"))
+    failed = False
+    for b in args.backends:
+        try:
+            print(f"{b}: parity={parity_check(b, min_cosine=args.min_cosine)} bench={bench(b)}")
+        except AssertionError as e:
+            failed = True
+            print(f"{b}: PARITY FAILED: {e}")
+    sys.exit(1 if failed else 0)
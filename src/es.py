@@ -0,0 +1,172 @@
+# src/es.py
+import os, gzip, json, time, random, asyncio, threading
+from typing import Any, Dict, Optional, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled, keep-alive connection set per process for every Elasticsearch call
+# (queries, ingest, embedding backfill, setup), instead of a new TCP/TLS handshake per request.
+ES_URL   = os.getenv("ES_URL", "http://localhost:9200").rstrip("/")
+ES_USER  = os.getenv("ES_USERNAME", "elastic")
+ES_PASS  = os.getenv("ES_PASSWORD", "elastic")
+ES_MAX_CONNECTIONS = int(os.getenv("ES_MAX_CONNECTIONS", "200"))     # pooled (kept-alive) connections per process
+ES_TIMEOUT         = float(os.getenv("ES_TIMEOUT", "30"))             # default per-call timeout, seconds
+ES_RETRIES         = int(os.getenv("ES_RETRIES", "3"))                # retries on 429/503 and connection errors
+ES_BACKOFF         = float(os.getenv("ES_BACKOFF", "0.2"))            # seconds, doubled per retry, with jitter
+ES_GZIP            = os.getenv("ES_GZIP", "1") == "1"                 # gzip _bulk/_msearch request bodies
+ES_GZIP_MIN_BYTES  = int(os.getenv("ES_GZIP_MIN_BYTES", "1024"))      # smaller bodies go out as-is
+ES_GZIP_LEVEL      = int(os.getenv("ES_GZIP_LEVEL", "1"))             # 1: most of the size win for little CPU
+
+RETRY_STATUSES = (429, 503)
+COMPRESSED_ENDPOINTS = ("_bulk", "_msearch")
+HEADERS = {"Content-Type": "application/json"}
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+
+Body = Union[Dict, list, str, bytes, None]
+
+
+def _encode(body: Body) -> Optional[bytes]:
+    if body is None or isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    return json.dumps(body).encode("utf-8")
+
+def _endpoint(path: str) -> str:
+    return path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+def _prepare(path: str, body: Body, compress: Optional[bool]):
+    """(data, headers): NDJSON for _bulk/_msearch, gzipped when large enough."""
+    data = _encode(body)
+    endpoint = _endpoint(path)
+    headers = dict(NDJSON_HEADERS if endpoint in COMPRESSED_ENDPOINTS else HEADERS)
+    if compress is None:
+        compress = ES_GZIP and endpoint in COMPRESSED_ENDPOINTS
+    if compress and data is not None and len(data) >= ES_GZIP_MIN_BYTES:
+        data = gzip.compress(data, compresslevel=ES_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return data, headers
+
+def backoff_delay(attempt: int, backoff: float = ES_BACKOFF) -> float:
+    # Full exponential backoff scaled by a random factor, so retrying clients don't stampede together.
+    return backoff * (2 ** attempt) * (0.5 + random.random())
+
+
+class Transport:
+    """
+    Synchronous ES client on one pooled requests.Session.
+
+    request() takes a path ("/index/_search"), JSON-encodes dict/list bodies, gzips
+    _bulk/_msearch bodies, and retries 429/503 responses and connection failures (never read
+    timeouts: the request may still be running on ES). The response is returned as-is;
+    callers decide what a non-2xx means.
+    """
+    def __init__(self, url: str = ES_URL, auth=(ES_USER, ES_PASS), pool_size: int = ES_MAX_CONNECTIONS,
+                 retries: int = ES_RETRIES, backoff: float = ES_BACKOFF, session=None):
+        self.url = url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.auth = auth
+        self.session = session
+
+    def request(self, method: str, path: str, body: Body = None, *, timeout: float = ES_TIMEOUT,
+                retries: Optional[int] = None, compress: Optional[bool] = None):
+        data, headers = _prepare(path, body, compress)
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                r = self.session.request(method, f"{self.url}{path}", data=data, headers=headers, timeout=timeout)
+            except requests.ConnectionError:
+                if attempt == retries:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt == retries:
+                    return r
+            time.sleep(backoff_delay(attempt, self.backoff))
+
+    def get(self, path: str, **kw):
+        return self.request("GET", path, **kw)
+
+    def head(self, path: str, **kw):
+        return self.request("HEAD", path, **kw)
+
+    def post(self, path: str, body: Body = None, **kw):
+        return self.request("POST", path, body, **kw)
+
+    def put(self, path: str, body: Body = None, **kw):
+        return self.request("PUT", path, body, **kw)
+
+    def delete(self, path: str, body: Body = None, **kw):
+        return self.request("DELETE", path, body, **kw)
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+def get_transport() -> Transport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
+
+def request(method: str, path: str, body: Body = None, **kw):
+    return get_transport().request(method, path, body, **kw)
+
+def get(path: str, **kw):
+    return get_transport().get(path, **kw)
+
+def head(path: str, **kw):
+    return get_transport().head(path, **kw)
+
+def post(path: str, body: Body = None, **kw):
+    return get_transport().post(path, body, **kw)
+
+def put(path: str, body: Body = None, **kw):
+    return get_transport().put(path, body, **kw)
+
+def delete(path: str, body: Body = None, **kw):
+    return get_transport().delete(path, body, **kw)
+
+
+# ---------------- async (API event loop) ----------------
+_aclient: Optional[httpx.AsyncClient] = None
+def get_async_client() -> httpx.AsyncClient:
+    global _aclient
+    if _aclient is None:
+        _aclient = httpx.AsyncClient(
+            base_url=ES_URL, auth=(ES_USER, ES_PASS), timeout=ES_TIMEOUT,
+            limits=httpx.Limits(max_connections=ES_MAX_CONNECTIONS, max_keepalive_connections=ES_MAX_CONNECTIONS),
+        )
+    return _aclient
+
+async def aclose():
+    global _aclient
+    if _aclient is not None:
+        await _aclient.aclose()
+        _aclient = None
+
+async def arequest(method: str, path: str, body: Body = None, *, timeout: float = ES_TIMEOUT,
+                   retries: int = ES_RETRIES, compress: Optional[bool] = None) -> httpx.Response:
+    """Async counterpart of Transport.request() on the shared httpx client."""
+    data, headers = _prepare(path, body, compress)
+    for attempt in range(retries + 1):
+        try:
+            r = await get_async_client().request(method, path, content=data, headers=headers, timeout=timeout)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+            if attempt == retries:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == retries:
+                return r
+        await asyncio.sleep(backoff_delay(attempt))
+
+async def apost(path: str, body: Body = None, **kw) -> httpx.Response:
+    return await arequest("POST", path, body, **kw)
@@ -0,0 +1,291 @@
+# src/evaluate.py
+"""
+Offline retrieval evaluation + latency benchmark.
+
+    # once, against a live stack: run the queries and record every ES response, the query
+    # vectors and the indexed dense vectors into a fixture
+    python -m src.evaluate --queries eval/queries.jsonl --fixture eval/fixture.json --record
+
+    # anywhere (CI): replay the fixture, no ES / model needed
+    python -m src.evaluate --queries eval/queries.jsonl --fixture eval/fixture.json --out eval/results.json
+
+queries.jsonl: one {"query": "...", "relevant": ["<chunk _id>", ...]} per line; "relevant" may
+also be {"<_id>": grade} for graded nDCG.
+
+Reports recall@k / MRR / nDCG@k per mode, dense-kNN recall against exact (brute-force NumPy)
+neighbours for each --knn setting, hybrid at each --depths leg depth, and p50/p90/p99 latency
+per stage. Output is sorted JSON so two runs can be diffed.
+"""
+import os, sys, gzip, json, math, time, hashlib, argparse
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+
+from . import es, rag_answer as rag
+from .embeddings import model_id
+
+MODES = rag.MODES   # the local modes need their on-disk indices (vector_index.py, bm25_index.py)
+PERCENTILES = (50, 90, 99)
+
+Relevance = Dict[str, float]
+
+# ---------------- metrics ----------------
+def recall_at_k(ranked: Sequence[str], relevant: Relevance, k: int) -> float:
+    if not relevant:
+        return 0.0
+    return len(set(ranked[:k]) & set(relevant)) / float(len(relevant))
+
+def mrr(ranked: Sequence[str], relevant: Relevance) -> float:
+    for i, _id in enumerate(ranked, start=1):
+        if _id in relevant:
+            return 1.0 / i
+    return 0.0
+
+def ndcg_at_k(ranked: Sequence[str], relevant: Relevance, k: int) -> float:
+    dcg = sum((2 ** relevant.get(_id, 0) - 1) / math.log2(i + 1) for i, _id in enumerate(ranked[:k], start=1))
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum((2 ** g - 1) / math.log2(i + 1) for i, g in enumerate(ideal, start=1))
+    return dcg / idcg if idcg else 0.0
+
+def percentiles(values: Sequence[float], ps: Sequence[int] = PERCENTILES) -> Dict[str, float]:
+    if not values:
+        return {}
+    xs = sorted(values)
+    out = {f"p{p}": round(xs[min(len(xs) - 1, max(0, math.ceil(p / 100.0 * len(xs)) - 1))], 2) for p in ps}
+    out["mean"] = round(sum(xs) / len(xs), 2)
+    return out
+
+def exact_knn(query_vecs, doc_vecs, doc_ids: List[str], k: int) -> List[List[str]]:
+    """Brute-force cosine top-k (ground truth for the HNSW kNN leg)."""
+    import numpy as np
+    q = np.asarray(query_vecs, dtype=np.float32)
+    d = np.asarray(doc_vecs, dtype=np.float32)
+    q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+    d = d / np.maximum(np.linalg.norm(d, axis=1, keepdims=True), 1e-12)
+    scores = q @ d.T
+    k = min(k, d.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    out = []
+    for row, idx in zip(scores, top):
+        idx = idx[np.argsort(-row[idx], kind="stable")]
+        out.append([doc_ids[i] for i in idx.tolist()])
+    return out
+
+# ---------------- recorded-fixture Elasticsearch stand-in ----------------
+def request_key(url: str, data: Union[bytes, str, None]) -> str:
+    """Stable key for a search request: path (index + endpoint) + canonical JSON of the body lines."""
+    path = url.split("://", 1)[-1].split("/", 1)[-1]
+    if isinstance(data, bytes) and data[:2] == b"\x1f\x8b":   # gzipped _msearch body (es.py)
+        data = gzip.decompress(data)
+    raw = data.decode("utf-8") if isinstance(data, bytes) else (data or "")
+    lines = [json.dumps(json.loads(l), sort_keys=True) for l in raw.splitlines() if l.strip()]
+    return hashlib.sha1((path + "\n" + "\n".join(lines)).encode("utf-8")).hexdigest()
+
+class _Response:
+    def __init__(self, body: Dict, status_code: int = 200):
+        self._body, self.status_code = body, status_code
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self.text[:200]}")
+
+class RecordingSession:
+    """Wraps the transport's requests.Session and keeps every response body, keyed by request_key."""
+    def __init__(self, session: Optional[requests.Session] = None):
+        self.session = session or requests.Session()
+        self.responses: Dict[str, Dict] = {}
+
+    def request(self, method, url, data=None, **kwargs):
+        r = self.session.request(method, url, data=data, **kwargs)
+        r.raise_for_status()
+        self.responses[request_key(url, data)] = r.json()
+        return r
+
+class FixtureSession:
+    """Drop-in for the es.py transport session that answers from recorded responses only."""
+    def __init__(self, responses: Dict[str, Dict]):
+        self.responses = responses
+        self.misses = 0
+
+    def request(self, method, url, data=None, **kwargs):
+        body = self.responses.get(request_key(url, data))
+        if body is None:
+            self.misses += 1
+            return _Response({"error": "request not in fixture; re-record with --record"}, status_code=404)
+        return _Response(body)
+
+def load_fixture(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_fixture(fixture: Dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, sort_keys=True)
+
+def prime_query_vectors(query_vectors: Dict[str, List[float]]) -> None:
+    """Seed rag_answer's embedding cache so dense legs never load the model."""
+    mid = model_id(rag.DENSE_MODEL)
+    for q, vec in query_vectors.items():
+        rag.embedding_cache.get_or_compute(q, mid, lambda _t, v=vec: v)
+
+def use_fixture(fixture: Dict) -> FixtureSession:
+    """Point the ES transport at the fixture and prime the query-embedding cache (no model load)."""
+    session = FixtureSession(fixture["responses"])
+    es.get_transport().session = session
+    prime_query_vectors(fixture.get("query_vectors", {}))
+    return session
+
+def scan_vectors(index: str = rag.INDEX, batch: int = 1000) -> Tuple[List[str], List[List[float]]]:
+    """All (_id, dense_vec) pairs in the index, for exact-kNN ground truth."""
+    from .embed_dense import open_pit, close_pit
+    pit_id = open_pit(index)
+    body = {"size": batch, "sort": [{"_shard_doc": "asc"}], "_source": ["dense_vec"],
+            "query": {"exists": {"field": "dense_vec"}}, "pit": {"id": pit_id, "keep_alive": "5m"}}
+    ids, vecs = [], []
+    try:
+        while True:
+            r = es.post("/_search", body, timeout=60)
+            r.raise_for_status()
+            resp = r.json()
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            body["pit"]["id"] = pit_id = resp.get("pit_id", pit_id)
+            body["search_after"] = hits[-1]["sort"]
+            for h in hits:
+                ids.append(h["_id"]); vecs.append(h["_source"]["dense_vec"])
+    finally:
+        close_pit(pit_id)
+    return ids, vecs
+
+# ---------------- benchmark ----------------
+def load_queries(path: str) -> List[Dict]:
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                rel = item.get("relevant") or {}
+                item["relevant"] = {r: 1.0 for r in rel} if isinstance(rel, list) else {k: float(v) for k, v in rel.items()}
+                out.append(item)
+    return out
+
+def _hybrid_at(depth: int) -> Callable:
+    def run(query: str, size: int):
+        return rag.hybrid(query, size=size, depth=depth)
+    return run
+
+def _dense_at(k: int, num_candidates: int) -> Callable:
+    def run(query: str, size: int):
+        hits, ms = rag._timed(rag.q_dense, query, size=size, k=k, num_candidates=num_candidates)
+        return hits, {"dense": ms}
+    return run
+
+def _runners(modes: Sequence[str], knn: Sequence[Tuple[int, int]], depths: Sequence[int]) -> Dict[str, Callable]:
+    runners = {m: (lambda q, size, m=m: rag.retrieve(q, mode=m, size=size)) for m in modes}
+    runners.update({f"dense@k={k},nc={nc}": _dense_at(k, nc) for k, nc in knn})
+    runners.update({f"hybrid@depth={d}": _hybrid_at(d) for d in depths})
+    return runners
+
+def evaluate(queries: List[Dict], k: int = 5, modes: Sequence[str] = MODES,
+             knn: Sequence[Tuple[int, int]] = (), depths: Sequence[int] = (),
+             corpus: Optional[Dict] = None, query_vectors: Optional[Dict[str, List[float]]] = None) -> Dict:
+    """
+    Run every query through each mode / variant. corpus = {"ids", "vectors"} enables
+    "knn_recall@k" (overlap with exact neighbours) for dense variants.
+    """
+    truth = {}
+    if corpus and corpus.get("ids") and query_vectors:
+        qs = [q["query"] for q in queries]
+        vecs = [query_vectors.get(q) or rag.encode_query(q) for q in qs]
+        truth = dict(zip(qs, exact_knn(vecs, corpus["vectors"], corpus["ids"], k)))
+
+    report = {}
+    for name, run in _runners(modes, knn, depths).items():
+        sums = {f"recall@{k}": 0.0, "mrr": 0.0, f"ndcg@{k}": 0.0}
+        knn_recall, stages, errors = [], {}, 0
+        for q in queries:
+            try:
+                hits, timings = run(q["query"], k)
+            except Exception as e:
+                errors += 1
+                print(f"{name}: {q['query']!r} failed: {e}", file=sys.stderr)
+                continue
+            ranked = [h["_id"] for h in hits]
+            sums[f"recall@{k}"] += recall_at_k(ranked, q["relevant"], k)
+            sums["mrr"] += mrr(ranked, q["relevant"])
+            sums[f"ndcg@{k}"] += ndcg_at_k(ranked, q["relevant"], k)
+            if name.startswith("dense") and q["query"] in truth:
+                exact = truth[q["query"]]
+                knn_recall.append(len(set(ranked[:k]) & set(exact)) / float(len(exact) or 1))
+            for stage, ms in timings.items():
+                stages.setdefault(stage, []).append(ms)
+        n = max(1, len(queries) - errors)
+        out = {m: round(v / n, 4) for m, v in sums.items()}
+        if knn_recall:
+            out[f"knn_recall@{k}"] = round(sum(knn_recall) / len(knn_recall), 4)
+        out["latency_ms"] = {stage: percentiles(v) for stage, v in stages.items()}
+        out["errors"] = errors
+        report[name] = out
+    return report
+
+def _parse_knn(spec: str) -> List[Tuple[int, int]]:
+    return [tuple(int(x) for x in part.split(":")) for part in spec.split(",") if part]
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    ap = argparse.ArgumentParser(description="Offline retrieval evaluation + latency benchmark")
+    ap.add_argument("--queries", required=True, help="labeled queries (jsonl)")
+    ap.add_argument("--fixture", help="recorded ES responses (replayed unless --record)")
+    ap.add_argument("--record", action="store_true", help="run against live ES and write --fixture")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--knn", default="50:750", help="dense k:num_candidates settings to compare, e.g. 10:100,50:750")
+    ap.add_argument("--depths", default="", help="hybrid leg depths to compare, e.g. 10,20,50")
+    ap.add_argument("--out", help="write results JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    queries = load_queries(args.queries)
+    fixture, recorder = None, None
+    if args.fixture and not args.record:
+        fixture = load_fixture(args.fixture)
+        use_fixture(fixture)
+
+    if fixture is not None:
+        corpus, qvecs = fixture.get("corpus"), fixture.get("query_vectors")
+    else:
+        qvecs = {q["query"]: rag.encode_query(q["query"]) for q in queries}
+        ids, vecs = scan_vectors()
+        corpus = {"ids": ids, "vectors": vecs}
+    if args.record:
+        # Installed after the corpus scan: only the benchmark's own searches go into the fixture.
+        transport = es.get_transport()
+        recorder = RecordingSession(transport.session)
+        transport.session = recorder
+
+    t0 = time.perf_counter()
+    results = evaluate(queries, k=args.k, modes=[m for m in args.modes.split(",") if m],
+                       knn=_parse_knn(args.knn), depths=[int(d) for d in args.depths.split(",") if d],
+                       corpus=corpus, query_vectors=qvecs)
+    out = {"meta": {"queries": len(queries), "k": args.k, "fixture": args.fixture if fixture else None,
+                    "model": model_id(rag.DENSE_MODEL), "seconds": round(time.perf_counter() - t0, 2)},
+           "results": results}
+
+    if recorder is not None and args.fixture:
+        save_fixture({"responses": recorder.responses, "query_vectors": qvecs, "corpus": corpus}, args.fixture)
+        print(f"Recorded {len(recorder.responses)} responses -> {args.fixture}", file=sys.stderr)
+
+    text = json.dumps(out, indent=1, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return out
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,13 @@ import os
 import argparse
 import subprocess
 import glob
-import fitz
-import json
-import requests
-from requests.auth import HTTPBasicAuth
 
-# Elastic config
-ES_URL   = os.getenv("ES_URL", "http://localhost:9200")
-ES_USER  = os.getenv("ES_USERNAME", "elastic")
-ES_PASS  = os.getenv("ES_PASSWORD", "elastic")
+from .bulk import BulkIndexer, index_action
+
+# Elastic config (connection settings live in es.py; BulkIndexer uses the shared transport)
 INDEX    = os.getenv("ES_INDEX", "docs_rag")
 PIPELINE_ID = "elser_enrich"
 
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
-
 # Local download path
 DATA_DIR = "data/pdfs/_drive_sync"
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -50,6 +43,7 @@ def chunk_text(text: str, max_tokens: int, overlap: int):
     return chunks
 
 def extract_pdf(path: str, drive_url: str):
+    import fitz
     doc = fitz.open(path)
     out, base, title = [], os.path.basename(path), os.path.splitext(os.path.basename(path))[0]
     for page_no in range(len(doc)):
@@ -69,25 +63,7 @@ def extract_pdf(path: str, drive_url: str):
 
 def bulk_index(docs):
     if not docs: return
-    lines = []
-    for d in docs:
-        lines.append(json.dumps({"index": {"_index": INDEX}}))
-        lines.append(json.dumps(d, ensure_ascii=False))
-    ndjson = "\n".join(lines) + "\n"
-
-    url = f"{ES_URL}/_bulk?pipeline={PIPELINE_ID}&refresh=true"
-    r = requests.post(url, data=ndjson.encode("utf-8"),
-                      headers={"Content-Type":"application/x-ndjson"}, auth=auth)
-    try:
-        resp = r.json()
-    except:
-        print("Bulk index error:", r.status_code, r.text)
-        return
-
-    if r.status_code != 200 or resp.get("errors"):
-        print("Bulk index completed with errors.")
-    else:
-        print(f"Bulk index OK: {len(docs)} docs")
+    BulkIndexer(pipeline=PIPELINE_ID).index(index_action(INDEX, d) for d in docs)
 
 def main(url: str):
     if not download_drive_folder(url, DATA_DIR):
@@ -98,12 +74,16 @@ def main(url: str):
         print("No PDFs found after download.")
         return
     total = 0
-    for p in pdf_paths:
-        print(f"Processing {p}")
-        docs = extract_pdf(p, url)
-        total += len(docs)
-        for i in range(0, len(docs), 200):
-            bulk_index(docs[i:i+200])
+    def actions():
+        nonlocal total
+        for p in pdf_paths:
+            print(f"Processing {p}")
+            docs = extract_pdf(p, url)
+            total += len(docs)
+            for d in docs:
+                yield index_action(INDEX, d)
+
+    BulkIndexer(pipeline=PIPELINE_ID).index(actions())
     print(f"Done. Total chunks indexed: {total}")
 
 if __name__ == "__main__":
@@ -1,21 +1,29 @@
 # src/ingest_pdfs.py
-import os, glob, json
-from typing import List, Dict
-import fitz
-import requests
-from requests.auth import HTTPBasicAuth
-
-ES_URL = os.getenv("ES_URL", "http://localhost:9200")
-ES_USER = os.getenv("ES_USERNAME", "elastic")
-ES_PASS = os.getenv("ES_PASSWORD", "elastic")
+import os, glob, json, hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Dict, Iterator, Optional, Tuple
+from . import es
+from .bulk import BulkIndexer, index_action
+
+# Heavy deps (fitz, numpy via embed_store, the embedding model) are imported on first use,
+# so `import src.api` and the CLIs start fast.
+
 INDEX   = os.getenv("ES_INDEX", "docs_rag")
 PIPELINE_ID = "elser_enrich"
 
 DATA_DIR = os.getenv("DATA_DIR", "data/pdfs/_drive_sync")
 CHUNK_TOKENS  = int(os.getenv("CHUNK_TOKENS", "300"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "60"))
-
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
+# 0 -> one worker per core; 1 -> extract in-process (old behaviour)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+# Large PDFs are split into page ranges of this size so one file can use several cores
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "64"))
+# Incremental mode: skip files whose content hash and chunker params are unchanged
+INGEST_INCREMENTAL = os.getenv("INGEST_INCREMENTAL", "1") == "1"
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST", "data/ingest_manifest.json")
+# Encode dense_vec in-process while indexing, so each chunk is written once (no second ES pass)
+INGEST_INLINE_DENSE = os.getenv("INGEST_INLINE_DENSE", "1") == "1"
 
 def tokenize(text: str) -> List[str]:
     return text.split()
@@ -32,70 +40,241 @@ def chunk_text(text: str, max_tokens: int, overlap: int) -> List[str]:
         i += step
     return chunks
 
-def extract_pdf(path: str) -> List[Dict]:
+def doc_key(rel_path: str) -> str:
+    """Stable per-file prefix for chunk ids (relative path, so subfolders don't collide)."""
+    return hashlib.sha1(rel_path.replace(os.sep, "/").encode("utf-8")).hexdigest()[:16]
+
+def chunk_id(key: str, page: int, ordinal: int) -> str:
+    return f"{key}:{page}:{ordinal}"
+
+def extract_pdf(path: str, page_start: int = 0, page_end: Optional[int] = None,
+                key: Optional[str] = None) -> List[Dict]:
+    import fitz
+    key = key or doc_key(os.path.basename(path))
     doc = fitz.open(path)
     out = []
     base = os.path.basename(path)
     title = os.path.splitext(base)[0]
     drive_url = os.getenv("DRIVE_FOLDER_URL", "")
-    for page_no in range(len(doc)):
+    end = len(doc) if page_end is None else min(page_end, len(doc))
+    for page_no in range(page_start, end):
         page = doc.load_page(page_no)
         text = page.get_text("text")
         if not text or not text.strip():
             continue
-        for chunk in chunk_text(text, CHUNK_TOKENS, CHUNK_OVERLAP):
+        for i, chunk in enumerate(chunk_text(text, CHUNK_TOKENS, CHUNK_OVERLAP)):
             out.append({
                 "title": title,
                 "source": base,
                 "page": page_no + 1,
                 "content": chunk,
-                "drive_url": drive_url
+                "drive_url": drive_url,
+                "chunk_id": chunk_id(key, page_no + 1, i),
             })
     doc.close()
     return out
 
+# ---------------- parallel extraction ----------------
+Task = Tuple[str, int, int, str]   # (path, page_start, page_end, doc_key)
+
+def plan_tasks(pdf_paths: List[str], pages_per_task: int = PAGES_PER_TASK,
+               data_dir: Optional[str] = None) -> List[Task]:
+    import fitz
+    tasks = []
+    for p in pdf_paths:
+        key = doc_key(os.path.relpath(p, data_dir) if data_dir else os.path.basename(p))
+        try:
+            with fitz.open(p) as doc:
+                n = len(doc)
+        except Exception as e:
+            print(f"Skipping unreadable PDF {p}: {e}")
+            continue
+        step = max(1, pages_per_task)
+        tasks.extend((p, start, min(start + step, n), key) for start in range(0, n, step))
+    return tasks
+
+def _extract_task(task: Task) -> Tuple[Task, List[Dict]]:
+    return task, extract_pdf(*task)
+
+def iter_extracted(pdf_paths: List[str], workers: int = INGEST_WORKERS, data_dir: Optional[str] = None,
+                   pages_per_task: int = PAGES_PER_TASK) -> Iterator[Tuple[Task, List[Dict]]]:
+    """
+    Yield (task, chunks) per page range as workers finish them (completion order).
+    At most 2 x workers ranges are in flight, so memory stays bounded while the
+    single consumer (the bulk writer) keeps up.
+    """
+    tasks = plan_tasks(pdf_paths, pages_per_task=pages_per_task, data_dir=data_dir)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        for t in tasks:
+            yield _extract_task(t)
+        return
+
+    pending_tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as ex:
+        in_flight = set()
+        for t in pending_tasks:
+            in_flight.add(ex.submit(_extract_task, t))
+            if len(in_flight) >= 2 * workers:
+                break
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+                nxt = next(pending_tasks, None)
+                if nxt is not None:
+                    in_flight.add(ex.submit(_extract_task, nxt))
+
 def bulk_index(docs: List[Dict]) -> None:
     if not docs: return
-    lines = []
-    for d in docs:
-        lines.append(json.dumps({"index": {"_index": INDEX}}))
-        lines.append(json.dumps(d, ensure_ascii=False))
-    ndjson = "\n".join(lines) + "\n"
-    url = f"{ES_URL}/_bulk?pipeline={PIPELINE_ID}&refresh=true"
-    headers = {"Content-Type": "application/x-ndjson"}
-    r = requests.post(url, data=ndjson.encode("utf-8"), headers=headers, auth=auth)
+    BulkIndexer(pipeline=PIPELINE_ID).index(index_action(INDEX, d) for d in docs)
+
+# ---------------- incremental ingestion ----------------
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _params(index: str) -> Dict:
+    # Anything that changes the produced chunks/ids invalidates every manifest entry.
+    return {"index": index, "pipeline": PIPELINE_ID, "chunk_tokens": CHUNK_TOKENS, "chunk_overlap": CHUNK_OVERLAP}
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict:
     try:
-        resp = r.json()
-    except Exception:
-        print("Bulk index error:", r.status_code, r.text)
-        return
-    if r.status_code != 200 or resp.get("errors"):
-        first_err = None
-        for item in resp.get("items", []):
-            err = item.get("index", {}).get("error")
-            if err:
-                first_err = err; break
-        print("Bulk index completed with errors:", json.dumps(first_err, indent=2))
-    else:
-        took = resp.get("took")
-        print(f"Bulk index OK: {len(docs)} docs (took {took} ms)")
-
-def main(return_count: bool = False) -> int:
-    pdf_paths = sorted(glob.glob(os.path.join(DATA_DIR, "**", "*.pdf"), recursive=True))
-    if not pdf_paths:
-        print(f"No PDFs found in {DATA_DIR}. Put files there and rerun.")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(manifest: Dict, path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def delete_by_query(index: str, query: Dict) -> int:
+    # No refresh=true here: a cleanup pass issues many of these, ingest_folder refreshes once after them.
+    r = es.post(f"/{index}/_delete_by_query?conflicts=proceed", {"query": query}, timeout=600)
+    if r.status_code != 200:
+        print("Delete-by-query failed:", r.status_code, r.text)
         return 0
-    total = 0
-    for p in pdf_paths:
-        print(f"Processing: {p}")
-        docs = extract_pdf(p)
-        print(f"  -> {len(docs)} chunks")
-        total += len(docs)
-        BATCH = 500
-        for i in range(0, len(docs), BATCH):
-            bulk_index(docs[i:i+BATCH])
-    print(f"Done. Total chunks indexed: {total}")
-    return total if return_count else 0
+    return r.json().get("deleted", 0)
+
+def refresh_index(index: str) -> None:
+    r = es.post(f"/{index}/_refresh", timeout=120)
+    if r.status_code != 200:
+        print("Refresh failed:", r.status_code, r.text)
+
+def _stale_chunks_query(key: str, keep_ids: List[str]) -> Dict:
+    q = {"bool": {"filter": [{"prefix": {"chunk_id": f"{key}:"}}]}}
+    if keep_ids:
+        q["bool"]["must_not"] = [{"ids": {"values": keep_ids}}]
+    return q
+
+def add_dense_vectors(docs: List[Dict]) -> int:
+    """Fill dense_vec on docs in place (one encode call per page range); returns vectors added."""
+    # Imported here so spawned extraction workers never load the embedding stack.
+    from .embeddings import get_model
+    from .embed_store import encode_with_store
+    todo = [d for d in docs if (d.get("content") or "").strip()]
+    if not todo:
+        return 0
+    encode = lambda texts: get_model().encode(texts, normalize_embeddings=True).tolist()
+    # Chunks embedded by an earlier run (same model + text) come from the local store.
+    vecs = encode_with_store([d["content"] for d in todo], encode)
+    for d, vec in zip(todo, vecs):
+        d["dense_vec"] = vec
+    return len(todo)
+
+def ingest_folder(data_dir: str = DATA_DIR, index: str = INDEX, incremental: bool = INGEST_INCREMENTAL,
+                  workers: int = INGEST_WORKERS, manifest_path: str = MANIFEST_PATH,
+                  inline_dense: bool = INGEST_INLINE_DENSE, fresh_index: bool = False,
+                  progress: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, int]:
+    """
+    Index the PDFs under data_dir. Chunks get deterministic ids (chunk_id == _id), so:
+      - unchanged files (same sha256 + same chunker params) are skipped,
+      - changed files are upserted, then their leftover chunks are deleted,
+      - files that disappeared since the last run have their chunks deleted.
+    Without a usable manifest (first run, params changed, incremental=False) every file is
+    (re)indexed and legacy chunks without a chunk_id are removed.
+    With inline_dense, dense_vec is encoded here and indexed with the chunk, so
+    embed_dense has nothing left to backfill.
+    fresh_index: index was just created (reindex.py), so there is nothing to clean up and the
+    delete-by-query pass is skipped entirely.
+    progress(stage, stats) is called as work completes (see jobs.py); it may raise to abort.
+    """
+    pdf_paths = sorted(glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True))
+    stats = {"files": len(pdf_paths), "changed": 0, "skipped": 0, "removed": 0, "chunks": 0, "vectors": 0,
+             "deleted": 0, "failed": 0}
+    report = (lambda: progress("ingest", dict(stats))) if progress else (lambda: None)
+    if not pdf_paths:
+        # Never treat an empty folder (e.g. a failed download) as "every file was removed".
+        print(f"No PDFs found in {data_dir}. Put files there and rerun.")
+        report()
+        return stats
+
+    params = _params(index)
+    manifest = load_manifest(manifest_path) if incremental else {}
+    full = manifest.get("params") != params
+    known = manifest.get("files", {})
+
+    current = {os.path.relpath(p, data_dir).replace(os.sep, "/"): p for p in pdf_paths}
+    hashes = {rel: file_sha256(p) for rel, p in current.items()}
+    changed = [rel for rel in current if full or known.get(rel, {}).get("sha256") != hashes[rel]]
+    removed = [rel for rel in known if rel not in current]
+    stats["changed"], stats["skipped"], stats["removed"] = len(changed), len(current) - len(changed), len(removed)
+    print(f"Ingest plan: {len(changed)} to index, {stats['skipped']} unchanged, {len(removed)} removed"
+          f"{' (full rebuild)' if full else ''}")
+    report()
+
+    new_ids: Dict[str, List[str]] = {doc_key(rel): [] for rel in changed}
+    def actions():
+        for (path, start, end, key), docs in iter_extracted([current[r] for r in changed], workers=workers,
+                                                            data_dir=data_dir):
+            print(f"Processed: {path} pages {start + 1}-{end} -> {len(docs)} chunks")
+            stats["chunks"] += len(docs)
+            if inline_dense:
+                # Encoding here overlaps with extraction (worker processes) and writing (bulk threads).
+                stats["vectors"] += add_dense_vectors(docs)
+            for d in docs:
+                new_ids[key].append(d["chunk_id"])
+                yield index_action(index, d, _id=d["chunk_id"])
+            report()
+
+    if changed:
+        bulk = BulkIndexer(pipeline=PIPELINE_ID).index(actions())
+        stats["failed"] = bulk["failed"]
+        if inline_dense:
+            from .embed_store import get_store
+            if get_store() is not None:
+                get_store().flush()
+
+    # Clean up: chunks a changed file no longer produces, chunks of removed files, legacy auto-id chunks.
+    if not fresh_index:
+        for key, ids in new_ids.items():
+            stats["deleted"] += delete_by_query(index, _stale_chunks_query(key, ids))
+        for rel in removed:
+            stats["deleted"] += delete_by_query(index, _stale_chunks_query(doc_key(rel), []))
+        if full:
+            stats["deleted"] += delete_by_query(index, {"bool": {"must_not": {"exists": {"field": "chunk_id"}}}})
+        if stats["deleted"]:
+            refresh_index(index)
+
+    # A run with failed items keeps the old hashes so those files are retried next time.
+    files = {rel: known[rel] for rel in current if rel in known and not full}
+    if not stats["failed"]:
+        files.update({rel: {"sha256": hashes[rel], "chunks": len(new_ids[doc_key(rel)])} for rel in changed})
+    save_manifest({"params": params, "files": files}, manifest_path)
+    report()
+    return stats
+
+def main(return_count: bool = False, workers: int = INGEST_WORKERS) -> int:
+    stats = ingest_folder(data_dir=os.getenv("DATA_DIR", DATA_DIR), workers=workers)
+    print(f"Done. Total chunks indexed: {stats['chunks']}, with dense vectors: {stats['vectors']} ({stats})")
+    return stats["chunks"] if return_count else 0
 
 if __name__ == "__main__":
     main()
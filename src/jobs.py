@@ -0,0 +1,294 @@
+# src/jobs.py
+import os, time, uuid, queue, shutil, threading, traceback
+import multiprocessing as mp
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Ingestion runs in its own process so its CPU work (PDF parsing, MiniLM encoding) and the
+# GIL never compete with /query in the API worker.
+INGEST_TORCH_THREADS = int(os.getenv("INGEST_TORCH_THREADS", "2"))    # intra-op threads in the job process
+INGEST_NICE          = int(os.getenv("INGEST_NICE", "10"))            # 0 = same priority as the API
+JOB_CANCEL_GRACE     = float(os.getenv("JOB_CANCEL_GRACE", "10"))     # seconds before a cancelled job is killed
+JOB_HISTORY          = int(os.getenv("JOB_HISTORY", "50"))            # finished jobs kept for GET /ingest/{id}
+
+RATE_KEYS = {"download": ("files",), "ingest": ("chunks", "vectors"), "embed": ("vectors",)}   # -> <key>_per_s
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---------------- job process ----------------
+def download_drive_folder(folder_url: str, out_dir: Path) -> int:
+    """
+    Download a *public* Google Drive folder to out_dir using gdown.
+    Returns number of files it reported.
+    """
+    try:
+        import gdown   # optional, and slow to import: only load it when a download is requested
+    except Exception:
+        raise RuntimeError("gdown is not installed. Add to requirements.txt and pip install.")
+    # Download into a staging dir, then swap it in: the folder mirrors Drive (removed files
+    # disappear) and a failed download leaves the previous copy untouched.
+    staging = out_dir.with_name(out_dir.name + ".staging")
+    if staging.exists():
+        shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True, exist_ok=True)
+    saved = gdown.download_folder(url=folder_url, output=str(staging), quiet=False, use_cookies=False)
+    if not saved:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise RuntimeError("gdown downloaded no files")
+    if out_dir.exists():
+        shutil.rmtree(out_dir, ignore_errors=True)
+    staging.rename(out_dir)
+    return len(saved) if isinstance(saved, list) else 0
+
+def _limit_resources(threads: int = INGEST_TORCH_THREADS, nice: int = INGEST_NICE) -> None:
+    # Must run before torch / onnxruntime / BLAS are imported: they size their pools at import.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(max(1, threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+def run_ingest_job(params: Dict[str, Any], events, cancel) -> None:
+    """
+    Job process entry point: download (optional) -> ingest_folder -> embed backfill,
+    or download (optional) -> reindex when params["reindex"] is set; then the local
+    dense index (vector_index.py) is refreshed and, with BM25_REBUILD=1, the embedded
+    BM25 index (bm25_index.py) rebuilt.
+    Sends ("stage", name, counters), then ("done", result) / ("error", msg) / ("cancelled", None).
+    """
+    _limit_resources()
+
+    def progress(stage: str, counters: Dict) -> None:
+        events.put(("stage", stage, counters))
+        if cancel.is_set():
+            raise JobCancelled()
+
+    try:
+        from .ingest_pdfs import ingest_folder
+        from .embed_dense import main as embed_dense_main
+        from .reindex import reindex
+        from .vector_index import LOCAL_DENSE, get_local_index
+        from .bm25_index import BM25_REBUILD, build_from_folder as build_bm25
+
+        data_dir = Path(params["data_dir"])
+        result = {"downloaded": 0, "data_dir": str(data_dir)}
+        if params.get("folder_url"):
+            progress("download", {"files": 0})
+            result["downloaded"] = download_drive_folder(params["folder_url"], data_dir)
+            progress("download", {"files": result["downloaded"]})
+
+        if params.get("reindex"):
+            # Full rebuild into a new versioned index, swapped in behind the alias when done.
+            ingest_stats = reindex(data_dir=str(data_dir), progress=progress)
+            backfilled = 0
+        else:
+            ingest_stats = ingest_folder(data_dir=str(data_dir), progress=progress)
+            # Inline mode already wrote dense_vec with each chunk; the backfill only picks up
+            # stragglers (legacy docs, INGEST_INLINE_DENSE=0).
+            backfilled = embed_dense_main(progress=progress) or 0
+        if LOCAL_DENSE:
+            # Only new/changed vectors are fetched; the API process switches over on its next query.
+            progress("local-index", {})
+            try:
+                result["local_index"] = get_local_index().refresh()
+            except Exception as e:   # ES already has the data; a stale local index is not fatal
+                traceback.print_exc()
+                result["local_index"] = {"error": f"{type(e).__name__}: {e}"}
+            progress("local-index", {"vectors": result["local_index"].get("vectors", 0)})
+        if BM25_REBUILD:
+            progress("bm25-local", {})
+            result["bm25_local"] = build_bm25(str(data_dir))
+        result.update({"ingested_chunks": ingest_stats["chunks"],
+                       "embedded_vectors": ingest_stats["vectors"] + backfilled,
+                       "ingest": ingest_stats})
+        events.put(("done", result))
+    except JobCancelled:
+        events.put(("cancelled", None))
+    except Exception as e:
+        traceback.print_exc()
+        events.put(("error", f"{type(e).__name__}: {e}"))
+
+
+# ---------------- job manager (API process) ----------------
+class IngestJobs:
+    """
+    Runs ingestion jobs one at a time, each in a fresh (spawned) worker process.
+
+    submit() returns immediately with a queued job; get() reports status and per-stage
+    progress (counters, elapsed_s, throughput as <counter>_per_s). cancel() asks the job process to stop
+    at its next progress report and kills it after JOB_CANCEL_GRACE seconds.
+    on_finish(job) runs in the API process once a job that reached the ingest stage ends,
+    whatever its outcome (the index may have changed), before its status becomes final: a client
+    that sees "succeeded" never gets an answer cached from the old index.
+    """
+    def __init__(self, on_finish: Optional[Callable[[Dict], None]] = None,
+                 target: Callable = run_ingest_job, history: int = JOB_HISTORY,
+                 cancel_grace: float = JOB_CANCEL_GRACE):
+        self.on_finish = on_finish
+        self.target = target
+        self.history = history
+        self.cancel_grace = cancel_grace
+        self._ctx = mp.get_context("spawn")
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cancel: Dict[str, Any] = {}
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._proc = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ---------- public ----------
+    def submit(self, params: Dict[str, Any]) -> Dict:
+        job_id = uuid.uuid4().hex[:12]
+        job = {"id": job_id, "status": "queued", "params": params, "created": time.time(),
+               "started": None, "finished": None, "stages": {}, "result": None, "error": None}
+        with self._lock:
+            self._jobs[job_id] = job
+            self._cancel[job_id] = self._ctx.Event()
+            self._trim()
+        self._ensure_started()
+        self._pending.put(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            out = {**job, "stages": {k: dict(v) for k, v in job["stages"].items()}}
+        end = out["finished"] or time.time()
+        out["elapsed_s"] = round(end - out["started"], 2) if out["started"] else 0.0
+        return out
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            ids = list(self._jobs)
+        return [self.get(i) for i in reversed(ids)]
+
+    def active(self) -> Optional[Dict]:
+        with self._lock:
+            ids = [i for i, j in self._jobs.items() if j["status"] not in FINISHED]
+        return self.get(ids[0]) if ids else None
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                self._finish(job, "cancelled")
+            elif job["status"] == "running":
+                job["status"] = "cancelling"
+                self._cancel[job_id].set()
+        return self.get(job_id)
+
+    def shutdown(self) -> None:
+        """Called on API shutdown: don't leave an orphaned job process behind."""
+        proc = self._proc
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+            proc.join(timeout=self.cancel_grace)
+
+    # ---------- internals ----------
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="ingest-jobs", daemon=True)
+                    self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            job_id = self._pending.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                job["status"], job["started"] = "running", time.time()
+            try:
+                kind, payload = self._run(job)
+            except Exception as e:
+                traceback.print_exc()
+                kind, payload = "error", str(e)
+            if self.on_finish is not None and "ingest" in job["stages"]:
+                try:
+                    self.on_finish(self.get(job_id))
+                except Exception:
+                    traceback.print_exc()
+            with self._lock:
+                if kind == "done":
+                    self._finish(job, "succeeded", result=payload)
+                elif kind == "cancelled":
+                    self._finish(job, "cancelled")
+                else:
+                    self._finish(job, "failed", error=payload)
+            print(f"Ingest job {job_id} {job['status']} in {time.time() - job['started']:.1f}s")
+
+    def _run(self, job: Dict) -> Tuple[str, Any]:
+        """Run the job process to its end; returns the outcome ("done" | "cancelled" | "error", payload)."""
+        events = self._ctx.Queue()
+        cancel = self._cancel[job["id"]]
+        proc = self._ctx.Process(target=self.target, args=(job["params"], events, cancel),
+                                 name=f"ingest-{job['id']}")
+        proc.start()
+        self._proc = proc
+        outcome, cancel_deadline = None, None
+        while outcome is None:
+            try:
+                msg = events.get(timeout=0.5)
+            except queue.Empty:
+                msg = None
+            if msg is not None and msg[0] == "stage":
+                self._progress(job, msg[1], msg[2])
+            elif msg is not None:
+                outcome = msg
+                continue
+            if cancel.is_set():
+                cancel_deadline = cancel_deadline or time.monotonic() + self.cancel_grace
+                if time.monotonic() > cancel_deadline:   # stuck in a long download/encode call
+                    proc.terminate()
+                    outcome = ("cancelled", None)
+            elif msg is None and not proc.is_alive() and events.empty():
+                outcome = ("error", f"job process exited with code {proc.exitcode}")
+        proc.join(timeout=self.cancel_grace)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+        self._proc = None
+        return outcome
+
+    def _progress(self, job: Dict, stage: str, counters: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            for name, prev in job["stages"].items():   # a new stage means the previous ones are done
+                if name != stage and prev["state"] == "running":
+                    prev["state"] = "done"
+            cur = job["stages"].setdefault(stage, {"state": "running", "started": now})
+            cur.update(counters)
+            elapsed = max(now - cur["started"], 1e-6)
+            cur["elapsed_s"] = round(elapsed, 2)
+            for key in RATE_KEYS.get(stage, ()):
+                if isinstance(counters.get(key), (int, float)):
+                    cur[f"{key}_per_s"] = round(counters[key] / elapsed, 1)
+
+    def _finish(self, job: Dict, status: str, result: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        # caller holds self._lock
+        job["status"], job["finished"] = status, time.time()
+        job["result"], job["error"] = result, error
+        for st in job["stages"].values():
+            if st["state"] == "running":
+                st["state"] = "done" if status == "succeeded" else status
+        self._cancel.pop(job["id"], None)
+
+    def _trim(self) -> None:
+        done = [i for i, j in self._jobs.items() if j["status"] in FINISHED]
+        for job_id in done[:max(0, len(done) - self.history)]:
+            self._jobs.pop(job_id, None)
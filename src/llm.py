@@ -1,10 +1,17 @@
 # src/llm.py
-import os, requests
-from typing import List, Dict, Optional
+import os, json, requests
+import httpx
+from typing import AsyncIterator, List, Dict, Optional
+from requests.adapters import HTTPAdapter
 
 PROVIDER = os.getenv("LLM_PROVIDER", "ollama").lower()   # "ollama"
 OLLAMA  = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
 MODEL   = os.getenv("OLLAMA_MODEL", "llama3.2")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "180"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+# How long Ollama keeps the model (and its prompt cache) loaded after a call: "30m", "2h", or seconds (-1 = forever).
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE) if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit() else OLLAMA_KEEP_ALIVE
 
 SYS_PROMPT = """You are a precise assistant for a RAG system.
 Use ONLY the provided context to answer. If the answer is not clearly supported, reply exactly: "I don’t know."
@@ -32,51 +39,159 @@ def _format_context(blocks: List[Dict]) -> str:
         lines.append(f"[{title} p.{page}] {snippet}")
     return "\n\n".join(lines) if lines else "NO CONTEXT"
 
-def _format_history(history: Optional[List[Dict]]) -> str:
-    """history like: [{"user":"...", "answer":"..."}, ...] most-recent last."""
-    if not history:
-        return ""
-    # take last 4 turns, trim long content
-    turns = history[-4:]
-    safe = []
-    for t in turns:
-        uq = (t.get("user") or "").strip()
-        aa = (t.get("answer") or "").strip()
-        if len(uq) > 400: uq = uq[:400] + "…"
-        if len(aa) > 400: aa = aa[:400] + "…"
-        safe.append(f"User: {uq}\nAssistant: {aa}")
-    return "\n\n".join(safe)
-
-def answer_with_llm(question: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None) -> str:
-    if is_unsafe(question):
-        return "I can’t help with that request."
+def _trim(text: Optional[str], limit: int = 400) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit] + "…"
 
-    ctx = _format_context(context_blocks)
-    hist = _format_history(history)
+def _history_messages(history: Optional[List[Dict]]) -> List[Dict]:
+    """history like: [{"user":"...", "answer":"..."}, ...] most-recent last -> chat turns (last 4, trimmed)."""
+    out = []
+    for t in (history or [])[-4:]:
+        out.append({"role": "user", "content": _trim(t.get("user"))})
+        out.append({"role": "assistant", "content": _trim(t.get("answer"))})
+    return out
 
+def build_messages(question: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    [system, history turns..., user]. The system message is the same bytes on every call and the
+    per-query context goes last, so Ollama can reuse the KV cache for everything before it.
+    """
     user_prompt = f"""Question:
 {question}
 
-Conversation history (use only for reference resolution):
-{hist if hist else "(none)"}
-
 Context:
-{ctx}
+{_format_context(context_blocks)}
 
 Answer (with citations):"""
+    return [{"role": "system", "content": SYS_PROMPT}, *_history_messages(history),
+            {"role": "user", "content": user_prompt}]
+
+def _chat_payload(messages: List[Dict], stream: bool = False, **options) -> dict:
+    return {
+        "model": MODEL,
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": _KEEP_ALIVE,
+        "options": {"temperature": 0.2, **options},
+    }
+
+def _record_usage(usage: Optional[Dict], resp: Dict) -> None:
+    # Ollama's counters for the call: prompt tokens actually evaluated (a cached prefix is not) and prefill time.
+    if usage is not None:
+        usage["prompt_eval_count"] = resp.get("prompt_eval_count", 0)
+        usage["prompt_eval_ms"] = round(resp.get("prompt_eval_duration", 0) / 1e6, 1)
+        usage["eval_count"] = resp.get("eval_count", 0)
+        usage["load_ms"] = round(resp.get("load_duration", 0) / 1e6, 1)
+
+# ---------------- sync client ----------------
+_session: Optional[requests.Session] = None
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONNECTIONS, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+def answer_with_llm(question: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None,
+                    usage: Optional[Dict] = None) -> str:
+    if is_unsafe(question):
+        return "I can’t help with that request."
+
+    messages = build_messages(question, context_blocks, history)
+
+    try:
+        if PROVIDER == "ollama":
+            r = get_session().post(f"{OLLAMA}/api/chat", json=_chat_payload(messages), timeout=LLM_TIMEOUT)
+            r.raise_for_status()
+            resp = r.json()
+            _record_usage(usage, resp)
+            return ((resp.get("message") or {}).get("content") or "").strip() or "I don’t know."
+    except Exception as e:
+        return f"I don’t know. (LLM error: {e})"
+
+    return "I don’t know."
+
+# ---------------- async client (used by the async API path) ----------------
+_aclient: Optional[httpx.AsyncClient] = None
+def get_async_client() -> httpx.AsyncClient:
+    global _aclient
+    if _aclient is None:
+        _aclient = httpx.AsyncClient(
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        )
+    return _aclient
+
+async def aclose():
+    global _aclient
+    if _aclient is not None:
+        await _aclient.aclose()
+        _aclient = None
+
+async def awarm_up() -> Dict:
+    """
+    Load the model (kept resident for OLLAMA_KEEP_ALIVE) and prefill the system prompt, so the first
+    query neither waits for a cold load nor re-evaluates the shared prefix.
+    """
+    if PROVIDER != "ollama":
+        return {}
+    messages = [{"role": "system", "content": SYS_PROMPT}, {"role": "user", "content": "Ready?"}]
+    r = await get_async_client().post(f"{OLLAMA}/api/chat", json=_chat_payload(messages, num_predict=1))
+    r.raise_for_status()
+    usage: Dict = {}
+    _record_usage(usage, r.json())
+    return usage
+
+async def answer_with_llm_async(question: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None,
+                                usage: Optional[Dict] = None) -> str:
+    if is_unsafe(question):
+        return "I can’t help with that request."
+
+    messages = build_messages(question, context_blocks, history)
 
     try:
         if PROVIDER == "ollama":
-            payload = {
-                "model": MODEL,
-                "prompt": f"{SYS_PROMPT}\n\n{user_prompt}",
-                "stream": False,
-                "options": {"temperature": 0.2}
-            }
-            r = requests.post(f"{OLLAMA}/api/generate", json=payload, timeout=180)
+            r = await get_async_client().post(f"{OLLAMA}/api/chat", json=_chat_payload(messages))
             r.raise_for_status()
-            return (r.json().get("response") or "").strip() or "I don’t know."
+            resp = r.json()
+            _record_usage(usage, resp)
+            return ((resp.get("message") or {}).get("content") or "").strip() or "I don’t know."
     except Exception as e:
         return f"I don’t know. (LLM error: {e})"
 
     return "I don’t know."
+
+async def stream_with_llm_async(question: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None,
+                                usage: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Yield answer text pieces as Ollama produces them (NDJSON stream from /api/chat)."""
+    if is_unsafe(question):
+        yield "I can’t help with that request."
+        return
+
+    messages = build_messages(question, context_blocks, history)
+    emitted = False
+    try:
+        if PROVIDER == "ollama":
+            async with get_async_client().stream("POST", f"{OLLAMA}/api/chat",
+                                                 json=_chat_payload(messages, stream=True)) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    piece = (chunk.get("message") or {}).get("content") or ""
+                    if piece:
+                        emitted = True
+                        yield piece
+                    if chunk.get("done"):
+                        _record_usage(usage, chunk)   # the final line carries the counters
+                        break
+    except Exception as e:
+        yield f"{' ' if emitted else ''}I don’t know. (LLM error: {e})"
+        return
+
+    if not emitted:
+        yield "I don’t know."
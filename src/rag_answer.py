@@ -1,18 +1,33 @@
 # src/rag_answer.py
-import os, json, requests
+import os, json, time, asyncio, requests
+import httpx
 from collections import defaultdict
-from typing import List, Dict, Optional
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 
-from sentence_transformers import SentenceTransformer
-from .llm import answer_with_llm
+from . import es
+from .batching import MicroBatcher
+from .embeddings import get_model, model_id
+from .cache import AnswerCache, EmbeddingCache, get_answer_cache
+from .context import assemble_context, estimate_tokens
+from .llm import answer_with_llm, answer_with_llm_async, build_messages, stream_with_llm_async
 
-ES_URL   = os.getenv("ES_URL", "http://localhost:9200")
-ES_USER  = os.getenv("ES_USERNAME", "elastic")
-ES_PASS  = os.getenv("ES_PASSWORD", "elastic")
 INDEX    = os.getenv("ES_INDEX", "docs_rag")
 ELSER_ID = os.getenv("ELSER_ENDPOINT_ID", "elser-v2-rk-02")
 DENSE_MODEL = os.getenv("DENSE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+DENSE_BATCH_MAX = int(os.getenv("DENSE_BATCH_MAX", "32"))
+DENSE_BATCH_WINDOW_MS = float(os.getenv("DENSE_BATCH_WINDOW_MS", "2"))
+# Opt-in. "local": ES kNN gets DENSE_KNN_TIMEOUT, and when it errors or times out the query is
+# answered from the in-process index (vector_index.py) if one has been built.
+DENSE_FALLBACK = os.getenv("DENSE_FALLBACK", "").lower()
+DENSE_KNN_TIMEOUT = float(os.getenv("DENSE_KNN_TIMEOUT", "2"))
+# Hybrid legs return only _id + score, this many per leg; one _mget then loads _source for the
+# fused top-k. Deeper legs improve fusion and cost a few bytes per extra candidate.
+HYBRID_LEG_SIZE = int(os.getenv("HYBRID_LEG_SIZE", "50"))
+
+# Every mode retrieve()/aretrieve() accept ("hybrid" is also the fallback for unknown names).
+MODES = ("hybrid", "hybrid-msearch", "elser", "dense", "dense-local", "bm25", "bm25-local")
 
 UNSAFE_KEYWORDS = [
     "build a bomb", "make a bomb", "malware", "ransomware", "suicide", "self harm",
@@ -22,47 +37,326 @@ def is_unsafe(q: str) -> bool:
     ql = (q or "").lower()
     return any(k in ql for k in UNSAFE_KEYWORDS)
 
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
-_session = requests.Session()
-HEADERS = {"Content-Type": "application/json"}
-
-_model = None
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(DENSE_MODEL)
-    return _model
+SOURCE_FIELDS = ["title","source","page","content","drive_url"]
+# Response trimming for id-only legs (_source: false): drop _index, shards, took, ...
+IDS_FILTER = "filter_path=hits.hits._id,hits.hits._score"
+MSEARCH_IDS_FILTER = "filter_path=responses.hits.hits._id,responses.hits.hits._score,responses.error"
 
-def q_bm25(query: str, size: int = 10):
-    body = {
+def _bm25_body(query: str, size: int, source=SOURCE_FIELDS) -> dict:
+    return {
         "size": size,
-        "_source": ["title","source","page","content","drive_url"],
+        "_source": source,
         "query": {"multi_match": {"query": query, "fields": ["title^2","content"]}}
     }
-    r = _session.post(f"{ES_URL}/{INDEX}/_search", auth=auth, headers=HEADERS, data=json.dumps(body), timeout=30)
-    r.raise_for_status()
-    return r.json()["hits"]["hits"]
 
-def q_elser(query: str, size: int = 10):
-    body = {
+def _elser_body(query: str, size: int, source=SOURCE_FIELDS) -> dict:
+    return {
         "size": size,
-        "_source": ["title","source","page","content","drive_url"],
+        "_source": source,
         "query": {"text_expansion": {"ml.tokens": {"model_id": ELSER_ID, "model_text": query}}}
     }
-    r = _session.post(f"{ES_URL}/{INDEX}/_search", auth=auth, headers=HEADERS, data=json.dumps(body), timeout=30)
-    r.raise_for_status()
-    return r.json()["hits"]["hits"]
 
-def q_dense(query: str, size: int = 10, k: int = 50, num_candidates: int = 750):
-    vec = get_model().encode([query], normalize_embeddings=True)[0].tolist()
-    body = {
+def _dense_body(vec: List[float], size: int, k: int, num_candidates: int, source=SOURCE_FIELDS) -> dict:
+    k = max(k, size)   # kNN never returns more than k hits
+    return {
         "size": size,
-        "_source": ["title","source","page","content","drive_url"],
-        "knn": {"field": "dense_vec", "query_vector": vec, "k": k, "num_candidates": num_candidates}
+        "_source": source,
+        "knn": {"field": "dense_vec", "query_vector": vec, "k": k, "num_candidates": max(num_candidates, k)}
     }
-    r = _session.post(f"{ES_URL}/{INDEX}/_search", auth=auth, headers=HEADERS, data=json.dumps(body), timeout=30)
+
+# Repeated / near-identical questions (reruns, retries, FAQs) skip the CPU encode.
+embedding_cache = EmbeddingCache()
+
+def _encode_batch(texts: List[str]) -> List[List[float]]:
+    return get_model().encode(texts, normalize_embeddings=True, batch_size=len(texts)).tolist()
+
+# Concurrent dense legs share one encode call instead of each running a batch of one.
+query_batcher = MicroBatcher(_encode_batch, max_batch=DENSE_BATCH_MAX,
+                             window_ms=DENSE_BATCH_WINDOW_MS, name="dense-query-batcher")
+
+def _encode(text: str) -> List[float]:
+    if DENSE_BATCH_WINDOW_MS <= 0:
+        return _encode_batch([text])[0]
+    return query_batcher(text)
+
+def encode_query(query: str) -> List[float]:
+    return embedding_cache.get_or_compute(query, model_id(DENSE_MODEL), _encode)
+
+def _search_path(body: dict) -> str:
+    return f"/{INDEX}/_search?{IDS_FILTER}" if body.get("_source") is False else f"/{INDEX}/_search"
+
+def _search(body: dict, timeout: float = 30) -> List[Dict]:
+    r = es.post(_search_path(body), body, timeout=timeout)
+    r.raise_for_status()
+    return r.json().get("hits", {}).get("hits", [])   # filter_path drops "hits" entirely when empty
+
+def _source(ids_only: bool):
+    return False if ids_only else SOURCE_FIELDS
+
+def q_bm25(query: str, size: int = 10, ids_only: bool = False):
+    return _search(_bm25_body(query, size, _source(ids_only)))
+
+def q_elser(query: str, size: int = 10, ids_only: bool = False):
+    return _search(_elser_body(query, size, _source(ids_only)))
+
+def q_bm25_local(query: str, size: int = 10):
+    """Embedded BM25 (bm25_index.py): no Elasticsearch needed."""
+    from .bm25_index import get_bm25_index
+    return get_bm25_index().search(query, size=size)
+
+# ---------------- local dense index ----------------
+dense_fallbacks = 0
+
+def _local_index():
+    """The in-process index, or None if it has not been built (numpy stays unimported until used)."""
+    from .vector_index import get_local_index
+    index = get_local_index()
+    return index if index.available() else None
+
+def q_dense_local(query: str, size: int = 10, vec: Optional[List[float]] = None):
+    from .vector_index import get_local_index
+    return get_local_index().search(vec if vec is not None else encode_query(query), size=size)
+
+def _fallback_index():
+    """Only resolved once ES has failed; an index that can't be loaded just means no fallback."""
+    try:
+        return _local_index()
+    except Exception as e:
+        print(f"Local dense index unavailable ({type(e).__name__}: {e})")
+        return None
+
+def _dense_fallback(vec: List[float], size: int, error: Exception) -> List[Dict]:
+    global dense_fallbacks
+    index = _fallback_index()
+    if index is None:
+        raise error
+    dense_fallbacks += 1
+    print(f"ES kNN failed or slow ({type(error).__name__}: {error}); answering from the local dense index")
+    return index.search(vec, size=size)
+
+def q_dense(query: str, size: int = 10, k: int = 50, num_candidates: int = 750, ids_only: bool = False):
+    vec = encode_query(query)
+    body = _dense_body(vec, size, k, num_candidates, _source(ids_only))
+    if DENSE_FALLBACK != "local":
+        return _search(body)
+    try:
+        return _search(body, timeout=DENSE_KNN_TIMEOUT)
+    except requests.RequestException as e:
+        return _dense_fallback(vec, size, e)   # local hits carry _source; hydrate() skips them
+
+# ---------------- two-phase hybrid: ids per leg, then hydrate the fused top-k ----------------
+def leg_size(size: int, depth: Optional[int] = None) -> int:
+    return max(size, depth or HYBRID_LEG_SIZE)
+
+def _mget_body(hits: List[Dict]) -> Optional[dict]:
+    ids = [h["_id"] for h in hits if "_source" not in h]
+    return {"docs": [{"_id": _id, "_source": SOURCE_FIELDS} for _id in ids]} if ids else None
+
+def _apply_sources(hits: List[Dict], resp: dict) -> List[Dict]:
+    """Attach the fetched _source to each hit, keeping fused order; ids deleted meanwhile are dropped."""
+    found = {d["_id"]: d.get("_source") or {} for d in resp.get("docs", []) if d.get("found")}
+    out = []
+    for h in hits:
+        if "_source" in h:
+            out.append(h)
+        elif h["_id"] in found:
+            out.append({**h, "_source": found[h["_id"]]})
+    return out
+
+def hydrate(hits: List[Dict]) -> List[Dict]:
+    body = _mget_body(hits)
+    if body is None:
+        return hits
+    r = es.post(f"/{INDEX}/_mget", body)
     r.raise_for_status()
-    return r.json()["hits"]["hits"]
+    return _apply_sources(hits, r.json())
+
+def hybrid(query: str, size: int = 5, depth: Optional[int] = None) -> Tuple[List[Dict], Dict[str, float]]:
+    """ELSER + BM25 + kNN legs (ids + scores only, run concurrently), RRF, then one _mget for the top `size`."""
+    n = leg_size(size, depth)
+    legs, timings = run_legs({
+        "elser": lambda: q_elser(query, size=n, ids_only=True),
+        "bm25":  lambda: q_bm25(query, size=n, ids_only=True),
+        "dense": lambda: q_dense(query, size=n, ids_only=True),
+    })
+    fused = rrf_merge(legs["elser"], legs["bm25"], legs["dense"], k=60)[:size]
+    hits, timings["hydrate"] = _timed(hydrate, fused)
+    return hits, timings
+
+# ---------------- single round-trip hybrid (_msearch) ----------------
+def _hybrid_bodies(query: str, vec: List[float], size: int, k: int = 50, num_candidates: int = 750,
+                   source=False) -> Dict[str, dict]:
+    return {
+        "elser": _elser_body(query, size, source),
+        "bm25":  _bm25_body(query, size, source),
+        "dense": _dense_body(vec, size, k, num_candidates, source),
+    }
+
+def _msearch_payload(bodies: Dict[str, dict]) -> bytes:
+    lines = []
+    for body in bodies.values():
+        lines.append("{}")                 # header: index comes from the URL
+        lines.append(json.dumps(body))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def _split_msearch(names: List[str], resp: dict) -> Dict[str, List[Dict]]:
+    out = {}
+    for name, item in zip(names, resp.get("responses", [])):
+        if "error" in item:
+            raise RuntimeError(f"_msearch {name} leg failed: {json.dumps(item['error'])}")
+        out[name] = item.get("hits", {}).get("hits", [])
+    return out
+
+def q_hybrid_msearch(query: str, size: int = 10, vec: Optional[List[float]] = None) -> Dict[str, List[Dict]]:
+    """BM25 + ELSER + kNN in one _msearch request; returns {"elser", "bm25", "dense"} ranked lists of ids + scores."""
+    bodies = _hybrid_bodies(query, vec if vec is not None else encode_query(query), size)
+    r = es.post(f"/{INDEX}/_msearch?{MSEARCH_IDS_FILTER}", _msearch_payload(bodies))
+    r.raise_for_status()
+    return _split_msearch(list(bodies), r.json())
+
+# ---------------- async search (used by the async API path) ----------------
+async def _asearch(body: dict, timeout: float = 30) -> List[Dict]:
+    r = await es.apost(_search_path(body), body, timeout=timeout)
+    r.raise_for_status()
+    return r.json().get("hits", {}).get("hits", [])
+
+async def ahydrate(hits: List[Dict]) -> List[Dict]:
+    body = _mget_body(hits)
+    if body is None:
+        return hits
+    r = await es.apost(f"/{INDEX}/_mget", body)
+    r.raise_for_status()
+    return _apply_sources(hits, r.json())
+
+async def aencode_query(query: str) -> List[float]:
+    # Cache lookup inline; a miss waits on the shared batcher without holding a _pool thread, so
+    # concurrent queries fill whole batches and the retrieval legs keep the pool.
+    key, norm, vec = embedding_cache.lookup(query, model_id(DENSE_MODEL))
+    if vec is not None:
+        return vec
+    if DENSE_BATCH_WINDOW_MS <= 0:
+        vec = (await asyncio.get_running_loop().run_in_executor(_pool, _encode_batch, [norm]))[0]
+    else:
+        vec = await asyncio.wrap_future(query_batcher.submit(norm))
+    return embedding_cache.store(key, vec)
+
+async def aq_hybrid_msearch(query: str, size: int = 10) -> Dict[str, List[Dict]]:
+    bodies = _hybrid_bodies(query, await aencode_query(query), size)
+    r = await es.apost(f"/{INDEX}/_msearch?{MSEARCH_IDS_FILTER}", _msearch_payload(bodies))
+    r.raise_for_status()
+    return _split_msearch(list(bodies), r.json())
+
+async def aq_bm25(query: str, size: int = 10, ids_only: bool = False):
+    return await _asearch(_bm25_body(query, size, _source(ids_only)))
+
+async def aq_elser(query: str, size: int = 10, ids_only: bool = False):
+    return await _asearch(_elser_body(query, size, _source(ids_only)))
+
+async def aq_dense(query: str, size: int = 10, k: int = 50, num_candidates: int = 750, ids_only: bool = False):
+    vec = await aencode_query(query)
+    body = _dense_body(vec, size, k, num_candidates, _source(ids_only))
+    if DENSE_FALLBACK != "local":
+        return await _asearch(body)
+    try:
+        return await _asearch(body, timeout=DENSE_KNN_TIMEOUT)
+    except httpx.HTTPError as e:
+        return await asyncio.get_running_loop().run_in_executor(_pool, _dense_fallback, vec, size, e)
+
+async def aq_bm25_local(query: str, size: int = 10):
+    return await asyncio.get_running_loop().run_in_executor(_pool, q_bm25_local, query, size)
+
+async def aq_dense_local(query: str, size: int = 10):
+    vec = await aencode_query(query)
+    return await asyncio.get_running_loop().run_in_executor(_pool, q_dense_local, query, size, vec)
+
+# ---------------- concurrent retrieval ----------------
+# One pool shared by all requests; each hybrid query puts its legs on it so the
+# ES round trips (and the dense encode) overlap instead of adding up.
+_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+def _timed(fn: Callable, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, round((time.perf_counter() - t0) * 1000.0, 1)
+
+def run_legs(legs: Dict[str, Callable[[], List[Dict]]]) -> Tuple[Dict[str, List[Dict]], Dict[str, float]]:
+    """
+    Run retrieval legs concurrently on the shared pool.
+    legs: {"elser": fn, "bm25": fn, ...} (zero-arg callables returning hits)
+    Returns ({leg: hits}, {leg: wall_ms}). The first leg error is re-raised.
+    """
+    futures = {name: _pool.submit(_timed, fn) for name, fn in legs.items()}
+    hits, timings = {}, {}
+    for name, fut in futures.items():
+        hits[name], timings[name] = fut.result()
+    return hits, timings
+
+def retrieve(query: str, mode: str = "hybrid", size: int = 5) -> Tuple[List[Dict], Dict[str, float]]:
+    """Return (hits, timings_ms) for a retrieval mode. Hybrid legs run concurrently."""
+    t0 = time.perf_counter()
+    if mode == "bm25":
+        hits, timings = run_legs({"bm25": lambda: q_bm25(query, size=size)})
+        hits = hits["bm25"]
+    elif mode == "elser":
+        hits, timings = run_legs({"elser": lambda: q_elser(query, size=size)})
+        hits = hits["elser"]
+    elif mode == "dense":
+        hits, timings = run_legs({"dense": lambda: q_dense(query, size=size)})
+        hits = hits["dense"]
+    elif mode == "bm25-local":
+        hits, timings = run_legs({"bm25-local": lambda: q_bm25_local(query, size=size)})
+        hits = hits["bm25-local"]
+    elif mode == "dense-local":
+        hits, timings = run_legs({"dense-local": lambda: q_dense_local(query, size=size)})
+        hits = hits["dense-local"]
+    elif mode == "hybrid-msearch":
+        vec, enc_ms = _timed(encode_query, query)
+        legs, msearch_ms = _timed(q_hybrid_msearch, query, size=leg_size(size), vec=vec)
+        timings = {"encode": enc_ms, "msearch": msearch_ms}
+        fused = rrf_merge(legs["elser"], legs["bm25"], legs["dense"], k=60)[:size]
+        hits, timings["hydrate"] = _timed(hydrate, fused)
+    else:
+        hits, timings = hybrid(query, size=size)
+    timings["retrieval"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return hits, timings
+
+async def _atimed(coro):
+    t0 = time.perf_counter()
+    out = await coro
+    return out, round((time.perf_counter() - t0) * 1000.0, 1)
+
+async def arun_legs(legs: Dict[str, Awaitable[List[Dict]]]) -> Tuple[Dict[str, List[Dict]], Dict[str, float]]:
+    """Async counterpart of run_legs: legs maps leg name -> coroutine."""
+    names = list(legs)
+    results = await asyncio.gather(*(_atimed(legs[n]) for n in names))
+    hits = {n: r[0] for n, r in zip(names, results)}
+    timings = {n: r[1] for n, r in zip(names, results)}
+    return hits, timings
+
+async def aretrieve(query: str, mode: str = "hybrid", size: int = 5) -> Tuple[List[Dict], Dict[str, float]]:
+    """Async counterpart of retrieve()."""
+    t0 = time.perf_counter()
+    if mode in ("bm25", "elser", "dense", "dense-local", "bm25-local"):
+        leg = {"bm25": aq_bm25, "elser": aq_elser, "dense": aq_dense, "dense-local": aq_dense_local,
+               "bm25-local": aq_bm25_local}[mode]
+        legs, timings = await arun_legs({mode: leg(query, size=size)})
+        hits = legs[mode]
+    elif mode == "hybrid-msearch":
+        legs, timings = await arun_legs({"msearch": aq_hybrid_msearch(query, size=leg_size(size))})
+        legs = legs["msearch"]
+        fused = rrf_merge(legs["elser"], legs["bm25"], legs["dense"], k=60)[:size]
+        hits, timings["hydrate"] = await _atimed(ahydrate(fused))
+    else:
+        n = leg_size(size)
+        legs, timings = await arun_legs({
+            "elser": aq_elser(query, size=n, ids_only=True),
+            "bm25":  aq_bm25(query, size=n, ids_only=True),
+            "dense": aq_dense(query, size=n, ids_only=True),
+        })
+        fused = rrf_merge(legs["elser"], legs["bm25"], legs["dense"], k=60)[:size]
+        hits, timings["hydrate"] = await _atimed(ahydrate(fused))
+    timings["retrieval"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return hits, timings
 
 def rrf_merge(*rankings, k: int = 60):
     scores = defaultdict(float); id2hit = {}
@@ -79,19 +373,12 @@ def _snippet(text: str, limit: int = 280) -> str:
     text = text.strip().replace("\n", " ")
     return text if len(text) <= limit else (text[:limit] + "…")
 
-def pack_for_llm(hits: List[Dict], top: int = 5) -> List[Dict]:
-    blocks = []
-    for h in hits[:top]:
-        s = h.get("_source", {})
-        blocks.append({
-            "id": h.get("_id"),
-            "title": s.get("title"),
-            "page": s.get("page"),
-            "source": s.get("source"),
-            "drive_url": s.get("drive_url"),
-            "snippet": s.get("content",""),
-        })
-    return blocks
+def pack_for_llm(query: str, hits: List[Dict], top: int = 5,
+                 history: Optional[List[Dict]] = None) -> Tuple[List[Dict], Dict]:
+    """Token-budgeted LLM context (context.py) for the top hits, plus its token accounting."""
+    blocks, stats = assemble_context(hits[:top])
+    stats["prompt_tokens"] = sum(estimate_tokens(m["content"]) for m in build_messages(query, blocks, history))
+    return blocks, stats
 
 def pack_for_ui(hits: List[Dict], top: int = 5) -> List[Dict]:
     out = []
@@ -118,29 +405,10 @@ def is_idk_or_refusal(text: str) -> bool:
         or t.startswith("i can't help")
     )
 
-def answer(query: str, mode: str = "hybrid", size: int = 5, history: Optional[List[Dict]] = None) -> dict:
-    # Early guardrail
-    if is_unsafe(query):
-        return {"mode": mode, "query": query, "answer": "I can’t help with that request.", "results": [], "citations": []}
-
-    # retrieval
-    if mode == "bm25":
-        hits = q_bm25(query, size=size)
-    elif mode == "elser":
-        hits = q_elser(query, size=size)
-    elif mode == "dense":
-        hits = q_dense(query, size=size)
-    else:
-        h1 = q_elser(query, size=min(10, max(5, size)))
-        h2 = q_bm25(query, size=min(10, max(5, size)))
-        h3 = q_dense(query, size=min(10, max(5, size)))
-        hits = rrf_merge(h1, h2, h3, k=60)[:size]
-
-    ctx_blocks = pack_for_llm(hits, top=min(5, size))
-    ui_blocks  = pack_for_ui(hits,  top=size)
-
-    text = answer_with_llm(query, ctx_blocks, history=history)
+def _refusal(query: str, mode: str) -> dict:
+    return {"mode": mode, "query": query, "answer": "I can’t help with that request.", "results": [], "citations": []}
 
+def _citations(ctx_blocks: List[Dict]) -> List[Dict]:
     # dedupe citations by (title,page)
     raw_citations = [
         {"title": b.get("title"), "page": b.get("page"),
@@ -152,9 +420,129 @@ def answer(query: str, mode: str = "hybrid", size: int = 5, history: Optional[Li
         key = (c.get("title"), c.get("page"))
         if key not in seen:
             seen.add(key); citations.append(c)
+    return citations
 
+def _llm_usage(usage: Dict, timings: Dict, ctx_stats: Dict) -> None:
+    # Ollama's own counts: tokens it actually prefilled (the cached prompt prefix is skipped) and how long that took.
+    if usage:
+        timings["llm_prefill"] = usage["prompt_eval_ms"]
+        ctx_stats["llm_prompt_tokens"] = usage["prompt_eval_count"]
+
+def _finalize(query: str, mode: str, text: str, ctx_blocks: List[Dict], ui_blocks: List[Dict], timings: Dict,
+              context: Optional[Dict] = None) -> dict:
+    citations = _citations(ctx_blocks)
     if is_idk_or_refusal(text):
         citations = []
         ui_blocks = []
 
-    return {"mode": mode, "query": query, "answer": text or "I don’t know.", "results": ui_blocks, "citations": citations}
+    return {"mode": mode, "query": query, "answer": text or "I don’t know.", "results": ui_blocks, "citations": citations,
+            "timings": timings, "context": context}
+
+# ---------------- answer cache ----------------
+# Keyed by normalized query/mode/size/history; /ingest bumps the generation so
+# answers computed against the old index stop matching.
+answer_cache = get_answer_cache()
+
+def _cache_get(query: str, mode: str, size: int, history: Optional[List[Dict]]):
+    """Return (key, generation, cached_answer_or_None)."""
+    if answer_cache is None:
+        return None, None, None
+    t0 = time.perf_counter()
+    key = AnswerCache.key(query, mode, size, history)
+    generation = answer_cache.generation()
+    hit = answer_cache.get(key)
+    if hit is not None:
+        hit = {**hit, "cached": True, "timings": {"cache": round((time.perf_counter() - t0) * 1000.0, 2)}}
+    return key, generation, hit
+
+def _cache_put(key: Optional[str], generation: Optional[int], out: dict) -> None:
+    # LLM/transport failures are transient; don't pin them in the cache.
+    if answer_cache is None or key is None or "LLM error" in (out.get("answer") or ""):
+        return
+    answer_cache.put(key, out, generation)
+
+def answer(query: str, mode: str = "hybrid", size: int = 5, history: Optional[List[Dict]] = None) -> dict:
+    # Early guardrail
+    if is_unsafe(query):
+        return _refusal(query, mode)
+
+    key, generation, cached = _cache_get(query, mode, size, history)
+    if cached is not None:
+        return cached
+
+    # retrieval (hybrid legs run concurrently; timings are per-leg wall ms)
+    hits, timings = retrieve(query, mode=mode, size=size)
+
+    ctx_blocks, ctx_stats = pack_for_llm(query, hits, top=min(5, size), history=history)
+    ui_blocks  = pack_for_ui(hits,  top=size)
+
+    usage = {}
+    text, timings["llm"] = _timed(answer_with_llm, query, ctx_blocks, history=history, usage=usage)
+    _llm_usage(usage, timings, ctx_stats)
+    out = _finalize(query, mode, text, ctx_blocks, ui_blocks, timings, ctx_stats)
+    _cache_put(key, generation, out)
+    return out
+
+async def answer_async(query: str, mode: str = "hybrid", size: int = 5, history: Optional[List[Dict]] = None) -> dict:
+    """Same contract as answer(), but never blocks the event loop on ES or Ollama."""
+    if is_unsafe(query):
+        return _refusal(query, mode)
+
+    key, generation, cached = _cache_get(query, mode, size, history)
+    if cached is not None:
+        return cached
+
+    hits, timings = await aretrieve(query, mode=mode, size=size)
+
+    ctx_blocks, ctx_stats = pack_for_llm(query, hits, top=min(5, size), history=history)
+    ui_blocks  = pack_for_ui(hits,  top=size)
+
+    usage = {}
+    text, timings["llm"] = await _atimed(answer_with_llm_async(query, ctx_blocks, history=history, usage=usage))
+    _llm_usage(usage, timings, ctx_stats)
+    out = _finalize(query, mode, text, ctx_blocks, ui_blocks, timings, ctx_stats)
+    _cache_put(key, generation, out)
+    return out
+
+async def answer_stream_async(query: str, mode: str = "hybrid", size: int = 5,
+                              history: Optional[List[Dict]] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming variant of answer(). Yields (event, data) pairs:
+      ("retrieval", {mode, query, results, citations, timings})  -- as soon as retrieval is done
+      ("token",     {"text": "..."})                             -- one per LLM piece
+      ("done",      <same dict answer() returns>)                 -- final, guardrails applied
+    """
+    if is_unsafe(query):
+        out = _refusal(query, mode)
+        yield "retrieval", {**out, "answer": None}
+        yield "token", {"text": out["answer"]}
+        yield "done", out
+        return
+
+    key, generation, cached = _cache_get(query, mode, size, history)
+    if cached is not None:
+        yield "retrieval", {**cached, "answer": None}
+        yield "token", {"text": cached["answer"]}
+        yield "done", cached
+        return
+
+    hits, timings = await aretrieve(query, mode=mode, size=size)
+
+    ctx_blocks, ctx_stats = pack_for_llm(query, hits, top=min(5, size), history=history)
+    ui_blocks  = pack_for_ui(hits,  top=size)
+    yield "retrieval", {"mode": mode, "query": query, "results": ui_blocks,
+                        "citations": _citations(ctx_blocks), "timings": dict(timings), "context": dict(ctx_stats)}
+
+    t0 = time.perf_counter()
+    pieces, usage = [], {}
+    async for piece in stream_with_llm_async(query, ctx_blocks, history=history, usage=usage):
+        if not pieces:
+            timings["llm_first_token"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        pieces.append(piece)
+        yield "token", {"text": piece}
+    timings["llm"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    _llm_usage(usage, timings, ctx_stats)
+
+    out = _finalize(query, mode, "".join(pieces).strip(), ctx_blocks, ui_blocks, timings, ctx_stats)
+    _cache_put(key, generation, out)
+    yield "done", out
@@ -0,0 +1,67 @@
+# src/reindex.py
+import os, time
+from typing import Callable, Dict, Optional
+
+from . import setup_es
+from .ingest_pdfs import DATA_DIR, INDEX, MANIFEST_PATH, ingest_folder, load_manifest, save_manifest, _params
+from .embed_dense import main as embed_dense_main
+
+def _is_live(build: str, alias: str) -> bool:
+    # A swap whose response was lost may still have been applied; when unsure, treat build as live.
+    try:
+        return build in setup_es.alias_targets(alias)
+    except Exception:
+        return True
+
+def reindex(data_dir: str = DATA_DIR, alias: str = INDEX, manifest_path: str = MANIFEST_PATH,
+            progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """
+    Zero-downtime full rebuild:
+      1. create {alias}_v{N+1} with bulk-load settings (no refresh, no replicas, async translog),
+      2. ingest every PDF + backfill dense vectors into it (queries keep hitting the alias),
+      3. force-merge, restore live settings and atomically swap the alias (setup_es.finalize_build_index),
+      4. delete old versions beyond the rollback set (setup_es.prune_versions).
+    On any failure before the swap the half-built index is deleted and the alias is left untouched.
+    """
+    t0 = time.perf_counter()
+    build = setup_es.create_build_index(alias)
+    # The build writes its own manifest; it only replaces the live one after the swap.
+    build_manifest = f"{manifest_path}.{build}"
+    try:
+        stats = ingest_folder(data_dir=data_dir, index=build, incremental=False, fresh_index=True,
+                              manifest_path=build_manifest, progress=progress)
+        if not stats["files"]:
+            raise RuntimeError(f"No PDFs in {data_dir}; keeping the current index")
+        if stats["failed"]:
+            raise RuntimeError(f"{stats['failed']} chunks failed to index; keeping the current index")
+        backfilled = embed_dense_main(progress=progress, index=build) or 0
+        if progress:
+            progress("finalize", {"index": build})
+        swap = setup_es.finalize_build_index(build, alias)
+    except BaseException:
+        if _is_live(build, alias):
+            print(f"Reindex failed after {build} went live; keeping it")
+        else:
+            setup_es.delete_index(build)
+            if os.path.exists(build_manifest):
+                os.remove(build_manifest)
+        raise
+
+    # Outside the try: once the alias points at build, a failed cleanup must never delete it.
+    try:
+        swap["deleted"] = setup_es.prune_versions(build, swap["previous"], alias)
+    except Exception as e:
+        print(f"Pruning old versions of {alias} failed (they stay until the next reindex): {e}")
+        swap["deleted"] = []
+
+    manifest = load_manifest(build_manifest)
+    manifest["params"] = _params(alias)   # later incremental runs write through the alias
+    save_manifest(manifest, manifest_path)
+    os.remove(build_manifest)
+    stats["vectors"] += backfilled
+    out = {**stats, **swap, "seconds": round(time.perf_counter() - t0, 1)}
+    print(f"Reindex done: {out}")
+    return out
+
+if __name__ == "__main__":
+    reindex(data_dir=os.getenv("DATA_DIR", DATA_DIR))
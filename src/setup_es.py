@@ -1,8 +1,5 @@
 # src/setup_es.py
 import os
-import json
-import requests
-from requests.auth import HTTPBasicAuth
 
 try:
     from dotenv import load_dotenv
@@ -10,10 +7,9 @@ try:
 except Exception:
     pass
 
+from . import es   # after load_dotenv: es.py reads ES_URL / credentials at import
+
 # -------- ENV / Defaults --------
-ES_URL   = os.getenv("ES_URL", "http://localhost:9200").rstrip("/")
-ES_USER  = os.getenv("ES_USERNAME", "elastic")
-ES_PASS  = os.getenv("ES_PASSWORD", "elastic")
 INDEX    = os.getenv("ES_INDEX", "docs_rag")
 PIPELINE_ID = os.getenv("INGEST_PIPELINE_ID", "elser_enrich")
 
@@ -22,28 +18,29 @@ ELSER_ID = os.getenv("ELSER_ENDPOINT_ID", "elser-v2-rk-02")
 # Built-in model id for ELSER v2 on Elastic 8.x:
 ELSER_MODEL = os.getenv("ELSER_MODEL_ID", ".elser_model_2")
 
-auth = HTTPBasicAuth(ES_USER, ES_PASS)
-HJSON = {"Content-Type": "application/json"}
-
 
 def _ok(r, *codes):
     return r is not None and r.status_code in (codes or (200,))
 
 
-def _get(path):
-    return requests.get(f"{ES_URL}{path}", auth=auth, timeout=30)
+def _get(path, timeout=30):
+    return es.get(path, timeout=timeout)
+
 
+def _head(path, timeout=30):
+    return es.head(path, timeout=timeout)
 
-def _head(path):
-    return requests.head(f"{ES_URL}{path}", auth=auth, timeout=30)
 
+def _put(path, body, timeout=120):
+    return es.put(path, body, timeout=timeout)
 
-def _put(path, body):
-    return requests.put(f"{ES_URL}{path}", auth=auth, headers=HJSON, data=json.dumps(body))
 
+def _post(path, body=None, timeout=120):
+    return es.post(path, body, timeout=timeout)
 
-def _post(path, body):
-    return requests.post(f"{ES_URL}{path}", auth=auth, headers=HJSON, data=json.dumps(body))
+
+def _delete(path, timeout=60):
+    return es.delete(path, timeout=timeout)
 
 
 # ---------- ELSER endpoint ----------
@@ -62,7 +59,7 @@ def ensure_elser_endpoint(endpoint_id=ELSER_ID, model_id=ELSER_MODEL, allocation
             "num_threads": threads,
         }
     }
-    r = _put(f"/_inference/sparse_embedding/{endpoint_id}", body)
+    r = _put(f"/_inference/sparse_embedding/{endpoint_id}", body, timeout=600)   # deploys the model
     if _ok(r, 200):
         print(f"Create ELSER endpoint: {endpoint_id} -> 200")
     else:
@@ -70,19 +67,21 @@ def ensure_elser_endpoint(endpoint_id=ELSER_ID, model_id=ELSER_MODEL, allocation
 
 
 # ---------- Index (mappings + settings) ----------
-def ensure_index(index_name=INDEX):
-    # HEAD to check existence
-    r = _head(f"/{index_name}")
-    if _ok(r, 200):
-        print(f"Index already exists: {index_name}")
-        return
-
-    body = {
+# INDEX is an alias over versioned concrete indices (docs_rag_v1, docs_rag_v2, ...), so a full
+# rebuild can load a fresh index in the background and swap it in atomically (see reindex.py).
+ES_REPLICAS = int(os.getenv("ES_REPLICAS", "1"))
+REINDEX_KEEP = int(os.getenv("REINDEX_KEEP", "1"))   # previous versions kept for rollback
+
+LIVE_SETTINGS = {"refresh_interval": "1s", "number_of_replicas": ES_REPLICAS, "translog.durability": "request"}
+# While loading: nothing is searchable until the swap, so skip refreshes (fewer, larger segments),
+# replicas and per-request fsyncs. Segments flushed along the way still build their own HNSW graph.
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0, "translog.durability": "async"}
+
+def index_body(settings=None):
+    return {
         "settings": {
             # Optional search-time HNSW tweak; you can raise ef_search later per-query too.
-            "index": {
-                "refresh_interval": "1s"
-            }
+            "index": dict(settings or LIVE_SETTINGS)
         },
         "mappings": {
             "properties": {
@@ -111,13 +110,111 @@ def ensure_index(index_name=INDEX):
             }
         }
     }
-    r = _put(f"/{index_name}", body)
+
+
+def versioned_name(alias, version):
+    return f"{alias}_v{version}"
+
+
+def alias_targets(alias=INDEX):
+    """Concrete indices behind alias ([] if the alias does not exist)."""
+    r = _get(f"/_alias/{alias}")
+    return sorted(r.json().keys()) if _ok(r, 200) else []
+
+
+def is_concrete_index(name=INDEX):
+    # Pre-alias installs have a real index called INDEX.
+    return _ok(_head(f"/{name}"), 200) and not alias_targets(name)
+
+
+def versioned_indices(alias=INDEX):
+    """Existing {alias}_v{N} indices, oldest first."""
+    r = _get(f"/_cat/indices/{alias}_v*?format=json&h=index&expand_wildcards=all")
+    found = []
+    for row in (r.json() if _ok(r, 200) else []):
+        suffix = row["index"][len(alias) + 2:]
+        if suffix.isdigit():
+            found.append((int(suffix), row["index"]))
+    return [name for _, name in sorted(found)]
+
+
+def next_version(alias=INDEX):
+    existing = versioned_indices(alias)
+    return int(existing[-1][len(alias) + 2:]) + 1 if existing else 1
+
+
+def ensure_index(index_name=INDEX):
+    """Create {index_name}_v1 behind the index_name alias (no-op if either already exists)."""
+    # HEAD to check existence (true for both an alias and a legacy concrete index)
+    r = _head(f"/{index_name}")
+    if _ok(r, 200):
+        print(f"Index already exists: {index_name}")
+        return
+
+    concrete = versioned_name(index_name, next_version(index_name))
+    body = index_body()
+    body["aliases"] = {index_name: {}}
+    r = _put(f"/{concrete}", body)
     if _ok(r, 200):
-        print(f"Create index: {index_name} -> 200")
+        print(f"Create index: {concrete} (alias {index_name}) -> 200")
     else:
         print(f"Create index FAILED: {r.status_code} {r.text}")
 
 
+def create_build_index(alias=INDEX):
+    """New, not-yet-aliased version of alias with bulk-load settings; returns its name."""
+    name = versioned_name(alias, next_version(alias))
+    r = _put(f"/{name}", index_body(BULK_LOAD_SETTINGS))
+    if not _ok(r, 200):
+        raise RuntimeError(f"Create index {name} failed: {r.status_code} {r.text}")
+    print(f"Create build index: {name} (bulk-load settings)")
+    return name
+
+
+def finalize_build_index(name, alias=INDEX):
+    """
+    Make a loaded build index live: refresh, force-merge to one segment, restore live settings,
+    then atomically point alias at it. dense_vec is indexed as the docs arrive, so every segment
+    written during the load gets its own HNSW graph; only the force-merge consolidates them into
+    one graph (rebuilt over all vectors, the per-segment graphs are discarded).
+    The alias swap is the last call: if this raises, name is not live. Returns {"index", "previous"}.
+    """
+    _post(f"/{name}/_refresh", timeout=600).raise_for_status()
+    _post(f"/{name}/_forcemerge?max_num_segments=1", timeout=3600).raise_for_status()
+    _put(f"/{name}/_settings", {"index": LIVE_SETTINGS}, timeout=60).raise_for_status()
+    _get(f"/_cluster/health/{name}?wait_for_status=yellow&timeout=120s", timeout=130).raise_for_status()
+
+    previous = alias_targets(alias)
+    actions = [{"remove": {"index": p, "alias": alias}} for p in previous]
+    if is_concrete_index(alias):
+        # Migrating from the pre-alias layout: the old index has to go for the alias to take its name.
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": name, "alias": alias}})
+    r = _post("/_aliases", {"actions": actions})
+    if not _ok(r, 200):
+        raise RuntimeError(f"Alias swap failed: {r.status_code} {r.text}")
+    print(f"Alias {alias}: {previous or '-'} -> {name}")
+    return {"index": name, "previous": previous}
+
+
+def prune_versions(live, previous, alias=INDEX, keep=REINDEX_KEEP):
+    """
+    Delete old {alias}_v{N} versions after a swap to live. The indices that were actually live
+    before it (previous) are always kept for rollback; other versions (e.g. builds orphaned by a
+    killed reindex, never served) only fill what is left of `keep`, newest first. Returns the deleted names.
+    """
+    others = [v for v in versioned_indices(alias) if v != live and v not in previous]
+    spare = max(0, keep - len(previous))
+    stale = others[:max(0, len(others) - spare)]
+    for old in stale:
+        _delete(f"/{old}")
+    return stale
+
+
+def delete_index(name):
+    _delete(f"/{name}")
+
+
 def ensure_dense_vec_mapping(index_name=INDEX):
     """
     Safe to call repeatedly; will upsert dense_vec mapping if missing.
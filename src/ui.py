@@ -1,5 +1,6 @@
 # src/ui.py
 import os
+import json
 import time
 import requests
 import streamlit as st
@@ -12,8 +13,9 @@ st.caption("Hybrid retrieval (ELSER + dense + BM25) with grounded answers & cita
 
 # ----- Sidebar controls -----
 with st.sidebar:
-    mode = st.radio("Retrieval mode", ["hybrid", "elser", "dense", "bm25"], horizontal=True, index=0)
+    mode = st.radio("Retrieval mode", ["hybrid", "hybrid-msearch", "elser", "dense", "dense-local", "bm25", "bm25-local"], horizontal=True, index=0)
     size = st.slider("Top K (default 5)", 1, 10, 5)
+    stream = st.toggle("Stream answer", value=True)
     if st.button("Clear chat"):
         st.session_state.messages = []
 
@@ -68,6 +70,58 @@ def _render_results(results, limit=4):
             break
     return "\n\n---\n\n".join(out)
 
+def _render_sources(slot, data):
+    """Citations + top results into slot (an st.empty()), replacing what it showed before."""
+    with slot.container():
+        cits_md = _render_citations(data.get("citations"))
+        if cits_md:
+            with st.expander("Citations"):
+                st.markdown(cits_md)
+        results_md = _render_results(data.get("results"), limit=4)
+        if results_md:
+            with st.expander("Top results"):
+                st.markdown(results_md)
+
+def _iter_sse(resp):
+    """Parse a text/event-stream response into (event, data) pairs."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+def _query_stream(payload, placeholder, sources, started):
+    """
+    Render sources as soon as retrieval is done and tokens into placeholder as they arrive;
+    return (final_data, ttfb_ms).
+    """
+    text, ttfb_ms, final, retrieval = "", None, None, {}
+    with requests.post(f"{API}/query/stream", json=payload, timeout=180, stream=True) as r:
+        r.raise_for_status()
+        for event, data in _iter_sse(r):
+            if event == "retrieval":
+                retrieval = data
+                _render_sources(sources, data)
+            elif event == "token":
+                if ttfb_ms is None:
+                    ttfb_ms = int((time.perf_counter() - started) * 1000)
+                text += data.get("text", "")
+                placeholder.markdown(text + "▌")
+            elif event == "done":
+                final = data
+            elif event == "error":
+                raise RuntimeError(data.get("detail"))
+    if final is None:
+        final = {**retrieval, "answer": text}
+    return final, ttfb_ms
+
 # ----- Replay chat history -----
 for m in st.session_state.messages:
     with st.chat_message(m["role"]):
@@ -82,38 +136,39 @@ if prompt:
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # 2) call API
+    # 2) call API (streamed: tokens render as they arrive)
     payload = {"q": prompt, "mode": mode, "size": size}
     started = time.perf_counter()
-    try:
-        r = requests.post(f"{API}/query", json=payload, timeout=180)
-        r.raise_for_status()
-        data = r.json()
-    except Exception as e:
-        err = f"Request failed: {e}"
-        st.session_state.messages.append({"role": "assistant", "content": err})
-        with st.chat_message("assistant"):
-            st.error(err)
-    else:
-        latency_ms = int((time.perf_counter() - started) * 1000)
-        answer = (data.get("answer") or "I don’t know.").strip()
-
-        # 3) render assistant message
-        with st.chat_message("assistant"):
-            st.markdown(answer)
-
-            # Only show citations & results when it's a grounded answer
-            if not _is_idk_or_refusal(answer):
-                cits_md = _render_citations(data.get("citations"))
-                if cits_md:
-                    with st.expander("Citations"):
-                        st.markdown(cits_md)
-                results_md = _render_results(data.get("results"), limit=4)
-                if results_md:
-                    with st.expander("Top results"):
-                        st.markdown(results_md)
-
-            st.caption(f"Mode: **{data.get('mode', mode)}** • Top K: **{size}** • Latency: **{latency_ms} ms**")
-
-        # append to chat history
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        sources = st.empty()   # filled on the "retrieval" event, before the first token
+        try:
+            if stream:
+                data, ttfb_ms = _query_stream(payload, placeholder, sources, started)
+            else:
+                r = requests.post(f"{API}/query", json=payload, timeout=180)
+                r.raise_for_status()
+                data, ttfb_ms = r.json(), None
+        except Exception as e:
+            err = f"Request failed: {e}"
+            st.session_state.messages.append({"role": "assistant", "content": err})
+            placeholder.error(err)
+            sources.empty()
+        else:
+            latency_ms = int((time.perf_counter() - started) * 1000)
+            answer = (data.get("answer") or "I don’t know.").strip()
+
+            # 3) render final assistant message
+            placeholder.markdown(answer)
+
+            # Only keep citations & results when it's a grounded answer
+            if _is_idk_or_refusal(answer):
+                sources.empty()
+            else:
+                _render_sources(sources, data)
+
+            ttfb = f" • First token: **{ttfb_ms} ms**" if ttfb_ms is not None else ""
+            st.caption(f"Mode: **{data.get('mode', mode)}** • Top K: **{size}**{ttfb} • Latency: **{latency_ms} ms**")
+
+            # append to chat history
+            st.session_state.messages.append({"role": "assistant", "content": answer})
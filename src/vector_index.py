@@ -0,0 +1,301 @@
+# src/vector_index.py
+import os, re, json, time, threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import es
+from .cache import SqliteKV
+
+INDEX   = os.getenv("ES_INDEX", "docs_rag")
+DENSE_DIMS = int(os.getenv("DENSE_DIMS", "384"))
+
+LOCAL_DENSE_DIR   = os.getenv("LOCAL_DENSE_DIR", "data/local_dense")
+LOCAL_DENSE       = os.getenv("LOCAL_DENSE", "0") == "1"                 # opt-in: refresh after every ingest job
+LOCAL_DENSE_DTYPE = os.getenv("LOCAL_DENSE_DTYPE", "float32").lower()    # float32 | int8 (4x smaller)
+LOCAL_DENSE_ANN   = os.getenv("LOCAL_DENSE_ANN", "").lower()             # "" = exact | hnsw (needs hnswlib)
+LOCAL_DENSE_ANN_MIN = int(os.getenv("LOCAL_DENSE_ANN_MIN", "50000"))     # below this, exact is fast enough
+LOCAL_DENSE_BLOCK = int(os.getenv("LOCAL_DENSE_BLOCK", "4096"))          # rows per block: int8->f32 upcast stays in cache
+FETCH_BATCH = int(os.getenv("LOCAL_DENSE_FETCH_BATCH", "500"))
+
+SOURCE_FIELDS = ["title", "source", "page", "content", "drive_url"]
+_GENERATION_FILE = re.compile(r"^(?:vectors|scales|rows|hnsw)\.(\d+)\.(?:npy|json|bin)$")
+
+
+def quantize(vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: v ~= q * scale."""
+    scale = np.abs(vecs).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(vecs / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+
+class LocalDenseIndex:
+    """
+    In-process kNN over the dense_vec values stored in ES.
+
+    On disk (under `path`), one generation at a time:
+      vectors.<gen>.npy  float32 or int8 matrix [n, dim], memory-mapped for search
+      scales.<gen>.npy   per-row scale (int8 only)
+      rows.<gen>.json    _id and _seq_no per row (seq_no tells refresh() what changed)
+      hnsw.<gen>.bin     optional hnswlib graph (LOCAL_DENSE_ANN=hnsw, n >= LOCAL_DENSE_ANN_MIN)
+      docs.sqlite        _source per _id, so hits look exactly like ES hits
+      meta.json          current generation; readers reload when it changes
+    refresh() (run by the ingest job) only fetches docs that are new or changed since the last
+    generation; the API process picks the new generation up on its next search.
+    """
+    def __init__(self, path: str = LOCAL_DENSE_DIR, dtype: str = LOCAL_DENSE_DTYPE, ann: str = LOCAL_DENSE_ANN):
+        self.path, self.dtype, self.ann = path, dtype, ann
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock = threading.Lock()
+        self._state = None          # (meta, ids, vectors, scales, graph)
+        self._mtime = None
+        self._checked = 0.0
+        self._docs = None
+
+    # ---------- search ----------
+    def available(self) -> bool:
+        return self._load() is not None
+
+    def search(self, vec: List[float], size: int = 10) -> List[Dict]:
+        state = self._load()
+        if state is None:
+            raise RuntimeError(f"Local dense index not built ({self.path}); run python -m src.vector_index")
+        meta, ids, vectors, scales, graph = state
+        if not len(ids):
+            return []
+        q = np.asarray(vec, dtype=np.float32)
+        size = min(size, len(ids))
+        if graph is not None:
+            graph.set_ef(max(50, size * 4))
+            labels, dists = graph.knn_query(q, k=size)
+            rows, scores = labels[0], 1.0 - dists[0]
+        else:
+            rows, scores = self._exact(q, vectors, scales, size)
+        return self._hits([ids[r] for r in rows.tolist()], scores.tolist(), meta)
+
+    def _exact(self, q: np.ndarray, vectors, scales, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = vectors.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, LOCAL_DENSE_BLOCK):
+            block = vectors[start:start + LOCAL_DENSE_BLOCK]
+            s = block.astype(np.float32) @ q if block.dtype != np.float32 else block @ q
+            scores[start:start + len(block)] = s * scales[start:start + len(block)] if scales is not None else s
+        top = np.argpartition(-scores, size - 1)[:size]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+    def _hits(self, ids: List[str], scores: List[float], meta: Dict) -> List[Dict]:
+        docs = self._doc_store()
+        out = []
+        for _id, score in zip(ids, scores):
+            raw = docs.get(_id)
+            out.append({"_id": _id, "_index": meta.get("index"), "_score": float(score),
+                        "_source": json.loads(raw) if raw is not None else {}})
+        return out
+
+    # ---------- loading ----------
+    def _doc_store(self) -> SqliteKV:
+        if self._docs is None:
+            self._docs = SqliteKV(os.path.join(self.path, "docs.sqlite"), table="docs")
+        return self._docs
+
+    def _load(self):
+        now = time.monotonic()
+        if self._state is not None and now - self._checked < 1.0:
+            return self._state
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self._meta_path).st_mtime_ns
+            except FileNotFoundError:
+                return self._state
+            if mtime != self._mtime:
+                self._state, self._mtime = self._open(self._read_meta()), mtime
+        return self._state
+
+    def _open(self, meta: Dict):
+        gen = meta["generation"]
+        with open(self._file("rows", gen, "json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)["ids"]
+        vectors = np.load(self._file("vectors", gen), mmap_mode="r") if ids else np.zeros((0, meta["dim"]), np.float32)
+        scales = np.load(self._file("scales", gen)) if meta["dtype"] == "int8" and ids else None
+        graph = None
+        if meta.get("ann") == "hnsw":
+            import hnswlib
+            graph = hnswlib.Index(space="ip", dim=meta["dim"])
+            graph.load_index(self._file("hnsw", gen, "bin"), max_elements=len(ids))
+        print(f"Local dense index: generation {gen}, {len(ids)} vectors ({meta['dtype']}"
+              f"{', hnsw' if graph is not None else ''})")
+        return meta, ids, vectors, scales, graph
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _file(self, name: str, gen: int, ext: str = "npy") -> str:
+        return os.path.join(self.path, f"{name}.{gen}.{ext}")
+
+    # ---------- refresh (writer side) ----------
+    def refresh(self, index: str = INDEX, full: bool = False) -> Dict[str, int]:
+        """
+        Sync with ES: new/changed docs (by _seq_no) are fetched, deleted ones dropped, the rest copied
+        from the current generation. A different concrete index (alias swap) means a full rebuild.
+        """
+        t0 = time.perf_counter()
+        os.makedirs(self.path, exist_ok=True)
+        meta = self._read_meta()
+        if meta:
+            self._remove_generations_before(meta["generation"])
+        live = scan_seq_nos(index)                        # _id -> (_seq_no, concrete index)
+        concrete = sorted({ix for _, ix in live.values()})
+        old = self._open(meta) if meta else None
+        old_rows = {}
+        if old is not None:
+            with open(self._file("rows", meta["generation"], "json"), "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            old_rows = {_id: (i, seq) for i, (_id, seq) in enumerate(zip(rows["ids"], rows["seq"]))}
+        reusable = not (old is None or full or meta.get("index") != ",".join(concrete) or meta["dtype"] != self.dtype)
+
+        keep = [_id for _id, (seq, _) in live.items()
+                if reusable and _id in old_rows and old_rows[_id][1] == seq]
+        kept = set(keep)
+        fetch = [_id for _id in live if _id not in kept]
+        removed = [_id for _id in old_rows if _id not in live]
+
+        docs = self._doc_store()
+        fetched_ids, fetched_vecs = [], []
+        for i in range(0, len(fetch), FETCH_BATCH):
+            batch = list(fetch_docs(live, fetch[i:i + FETCH_BATCH]))
+            docs.put_many([(_id, json.dumps(src, ensure_ascii=False).encode("utf-8")) for _id, src, _ in batch])
+            fetched_ids.extend(_id for _id, _, _ in batch)
+            fetched_vecs.extend(vec for _, _, vec in batch)
+
+        ids = keep + fetched_ids
+        gen = (meta["generation"] + 1) if meta else 1
+        new_vecs = np.asarray(fetched_vecs, dtype=np.float32).reshape(-1, DENSE_DIMS)
+        self._write_vectors(gen, old, [old_rows[_id][0] for _id in keep], new_vecs)
+        with open(self._file("rows", gen, "json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "seq": [live[_id][0] for _id in ids]}, f)
+        ann = self._build_graph(gen, len(ids))
+
+        new_meta = {"generation": gen, "dim": DENSE_DIMS, "dtype": self.dtype, "count": len(ids),
+                    "index": ",".join(concrete), "ann": ann, "updated": time.time()}
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(new_meta, f)
+        os.replace(tmp, self._meta_path)   # readers switch generation here
+
+        docs.delete_many(removed)
+        stats = {"vectors": len(ids), "kept": len(keep), "fetched": len(fetched_ids), "removed": len(removed),
+                 "generation": gen, "seconds": round(time.perf_counter() - t0, 2)}
+        print(f"Local dense index refreshed: {stats}")
+        return stats
+
+    def _remove_generations_before(self, gen: int) -> None:
+        # The generation just replaced stays on disk until the next refresh: a reader that saw the
+        # old meta.json can still be opening its files.
+        for fname in os.listdir(self.path):
+            m = _GENERATION_FILE.match(fname)
+            if m and int(m.group(1)) < gen:
+                try:
+                    os.remove(os.path.join(self.path, fname))
+                except FileNotFoundError:
+                    pass
+
+    def _write_vectors(self, gen: int, old, keep_rows: List[int], new_vecs: np.ndarray) -> None:
+        n = len(keep_rows) + len(new_vecs)
+        if not n:
+            return
+        dtype = np.int8 if self.dtype == "int8" else np.float32
+        out = np.lib.format.open_memmap(self._file("vectors", gen), mode="w+", dtype=dtype, shape=(n, DENSE_DIMS))
+        scales = np.empty(n, dtype=np.float32) if self.dtype == "int8" else None
+        for start in range(0, len(keep_rows), LOCAL_DENSE_BLOCK):
+            rows = keep_rows[start:start + LOCAL_DENSE_BLOCK]
+            out[start:start + len(rows)] = old[2][rows]
+            if scales is not None:
+                scales[start:start + len(rows)] = old[3][rows]
+        if len(new_vecs):
+            if scales is not None:
+                out[len(keep_rows):], scales[len(keep_rows):] = quantize(new_vecs)
+            else:
+                out[len(keep_rows):] = new_vecs
+        out.flush()
+        del out
+        if scales is not None:
+            np.save(self._file("scales", gen), scales)
+
+    def _build_graph(self, gen: int, n: int) -> str:
+        if self.ann != "hnsw" or n < LOCAL_DENSE_ANN_MIN:
+            return ""
+        try:
+            import hnswlib
+        except ImportError:
+            print("LOCAL_DENSE_ANN=hnsw but hnswlib is not installed; using exact search")
+            return ""
+        vectors = np.load(self._file("vectors", gen), mmap_mode="r")
+        graph = hnswlib.Index(space="ip", dim=DENSE_DIMS)
+        graph.init_index(max_elements=n, M=16, ef_construction=100)
+        scales = np.load(self._file("scales", gen)) if self.dtype == "int8" else None
+        for start in range(0, n, LOCAL_DENSE_BLOCK):
+            block = np.asarray(vectors[start:start + LOCAL_DENSE_BLOCK], dtype=np.float32)
+            if scales is not None:
+                block *= scales[start:start + len(block), None]
+            graph.add_items(block, np.arange(start, start + len(block)))
+        graph.save_index(self._file("hnsw", gen, "bin"))
+        return "hnsw"
+
+
+# ---------------- ES access ----------------
+def scan_seq_nos(index: str = INDEX, batch: int = 5000) -> Dict[str, Tuple[int, str]]:
+    """_id -> (_seq_no, concrete index) for every doc with a dense_vec (no _source transferred)."""
+    from .embed_dense import open_pit, close_pit
+    pit_id = open_pit(index)
+    body = {"size": batch, "sort": [{"_shard_doc": "asc"}], "_source": False, "seq_no_primary_term": True,
+            "query": {"exists": {"field": "dense_vec"}}, "pit": {"id": pit_id, "keep_alive": "5m"}}
+    out = {}
+    try:
+        while True:
+            r = es.post("/_search", body, timeout=60)
+            r.raise_for_status()
+            resp = r.json()
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            body["pit"]["id"] = pit_id = resp.get("pit_id", pit_id)
+            body["search_after"] = hits[-1]["sort"]
+            for h in hits:
+                out[h["_id"]] = (h["_seq_no"], h["_index"])
+    finally:
+        close_pit(pit_id)
+    return out
+
+def fetch_docs(live: Dict[str, Tuple[int, str]], ids: List[str]):
+    """Yield (_id, _source without dense_vec, dense_vec) for ids, via one _mget."""
+    body = {"docs": [{"_index": live[_id][1], "_id": _id, "_source": SOURCE_FIELDS + ["dense_vec"]} for _id in ids]}
+    r = es.post("/_mget", body, timeout=120)
+    r.raise_for_status()
+    for doc in r.json()["docs"]:
+        src = doc.get("_source") or {}
+        vec = src.pop("dense_vec", None)
+        if doc.get("found") and vec is not None:
+            yield doc["_id"], src, vec
+
+
+_index: Optional[LocalDenseIndex] = None
+_index_lock = threading.Lock()
+def get_local_index() -> LocalDenseIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LocalDenseIndex()
+    return _index
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Build / refresh the local dense index from ES dense_vec values")
+    ap.add_argument("--full", action="store_true", help="rebuild from scratch")
+    args = ap.parse_args()
+    get_local_index().refresh(full=args.full)
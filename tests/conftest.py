@@ -5,3 +5,50 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+import gzip, json
+import pytest
+from src import es
+from src.evaluate import _Response
+
+
+class FakeSession:
+    """
+    Stand-in for the requests.Session under es.Transport. handler(method, url, body) gets the
+    decoded request body (gunzipped; a list of lines for _bulk/_msearch) and returns a response
+    body dict, an HTTP status, a (status, body) pair, or an exception to raise.
+    Raw calls are kept in .calls as (method, url, data, headers, timeout).
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        self.calls.append((method, url, data, headers, timeout))
+        out = self.handler(method, url, _decode(url, data))
+        if isinstance(out, BaseException):
+            raise out
+        if isinstance(out, int):
+            out = (out, {})
+        status, body = out if isinstance(out, tuple) else (200, out)
+        return _Response(body, status)
+
+
+def _decode(url, data):
+    if not data:
+        return None
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    lines = [json.loads(l) for l in data.decode("utf-8").splitlines() if l.strip()]
+    return lines if es._endpoint(url) in es.COMPRESSED_ENDPOINTS else lines[0]
+
+
+@pytest.fixture
+def es_session(monkeypatch):
+    """es_session(handler) -> FakeSession installed as the shared es transport (install=False: just build it)."""
+    def make(handler, install=True, **transport_kw):
+        session = FakeSession(handler)
+        if install:
+            monkeypatch.setattr(es, "_transport", es.Transport(session=session, **transport_kw))
+        return session
+    return make
@@ -0,0 +1,40 @@
+import threading
+from src.batching import MicroBatcher
+
+def test_concurrent_submits_share_one_call_and_keep_order():
+    calls = []
+    def fn(items):
+        calls.append(list(items))
+        return [f"v:{x}" for x in items]
+
+    b = MicroBatcher(fn, max_batch=16, window_ms=50)
+    results = {}
+    def worker(i):
+        results[i] = b(i)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert results == {i: f"v:{i}" for i in range(8)}
+    assert len(calls) < 8 and b.stats()["items"] == 8
+
+def test_errors_propagate_to_every_caller():
+    def fn(items):
+        raise ValueError("boom")
+    b = MicroBatcher(fn, max_batch=4, window_ms=1)
+    fut = b.submit("x")
+    try:
+        fut.result(timeout=2)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_result_count_mismatch_fails_every_caller():
+    b = MicroBatcher(lambda items: items[:1], max_batch=4, window_ms=50)
+    futs = [b.submit(i) for i in range(3)]
+    for fut in futs:
+        try:
+            fut.result(timeout=2)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
@@ -0,0 +1,61 @@
+import math
+import os
+import pytest
+from src import bm25_index as bm, rag_answer as rag
+
+DOCS = [
+    {"chunk_id": "a:1:0", "title": "syllabus", "source": "syllabus.pdf", "page": 1,
+     "content": "The final project deadline is May 3. Late submissions lose points."},
+    {"chunk_id": "a:2:0", "title": "syllabus", "source": "syllabus.pdf", "page": 2,
+     "content": "Grading: project 40%, exams 60%. The exam is closed book."},
+    {"chunk_id": "b:1:0", "title": "refunds", "source": "refunds.pdf", "page": 1,
+     "content": "Refunds are processed within ten business days. Refunds need a receipt."},
+]
+
+def _reference(query, field, k1=bm.BM25_K1, b=bm.BM25_B):
+    """Plain-Python Lucene BM25 for one field."""
+    toks = [bm.analyze(d[field]) for d in DOCS]
+    avgdl = sum(map(len, toks)) / len(toks)
+    out = []
+    for t in toks:
+        s = 0.0
+        for term in set(bm.analyze(query)):
+            df = sum(term in x for x in toks)
+            tf = t.count(term)
+            if tf:
+                s += math.log(1 + (len(DOCS) - df + 0.5) / (df + 0.5)) * tf / (tf + k1 * (1 - b + b * len(t) / avgdl))
+        out.append(s)
+    return out
+
+def test_scores_match_reference_bm25(tmp_path):
+    path = str(tmp_path / "bm25.idx")
+    stats = bm.build(DOCS, path)
+    assert stats["docs"] == 3
+    index = bm.BM25Index(path)
+    for q in ["project deadline", "refunds receipt", "exam", "syllabus grading"]:
+        expected = [max(c * bm.FIELDS["content"], t * bm.FIELDS["title"])
+                    for c, t in zip(_reference(q, "content"), _reference(q, "title"))]
+        assert index.scores(q).tolist() == pytest.approx(expected, rel=1e-5)
+
+def test_search_hits_plug_into_fusion_and_ui(tmp_path, monkeypatch):
+    path = str(tmp_path / "bm25.idx")
+    bm.build(DOCS, path)
+    monkeypatch.setattr(bm, "BM25_INDEX_PATH", path)
+    hits = bm.get_bm25_index(path).search("refunds", size=5)
+    assert [h["_id"] for h in hits] == ["b:1:0"]
+    assert bm.get_bm25_index(path).search("nothing matches", size=5) == []
+    ui = rag.pack_for_ui(rag.rrf_merge(hits, bm.get_bm25_index(path).search("project", size=5)))
+    assert ui[0]["title"] and ui[0]["page"] == 1 and "snippet" in ui[0]
+
+    bm.build(DOCS[:1], path)                              # rebuilt file is picked up
+    os.utime(path, ns=(1, 1))
+    assert bm.get_bm25_index(path).n_docs == 1
+
+def test_build_from_pdfs(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    data = tmp_path / "pdfs"; data.mkdir()
+    doc = fitz.open(); doc.new_page().insert_text((72, 72), "alpha beta gamma delta"); doc.save(str(data / "x.pdf"))
+    path = str(tmp_path / "bm25.idx")
+    assert bm.build_from_folder(str(data), path, workers=1)["docs"] == 1
+    hit = bm.BM25Index(path).search("gamma")[0]
+    assert hit["_source"]["source"] == "x.pdf" and hit["_id"].endswith(":1:0")
@@ -0,0 +1,44 @@
+import requests
+from src.bulk import BulkIndexer, index_action
+
+def _bulk_handler(log, reject_b_once=True, timeout_first=False):
+    """Rejects doc 'b' with 429 once (optionally times out the first _bulk), then accepts everything."""
+    state = {"rejected": not reject_b_once, "timed_out": not timeout_first}
+    def handler(method, url, body):
+        if url.endswith("/_refresh"):
+            log.append("REFRESH")
+            return 200
+        if not state["timed_out"]:
+            state["timed_out"] = True
+            log.append("TIMEOUT")
+            return requests.ReadTimeout("read timed out")   # ES may have applied the batch anyway
+        docs = body[1::2]
+        log.append([d["k"] for d in docs])
+        items = []
+        for d in docs:
+            status = 201
+            if d["k"] == "b" and not state["rejected"]:
+                status, state["rejected"] = 429, True
+            items.append({"index": {"status": status}})
+        return {"items": items}
+    return handler
+
+def test_bulk_flushes_by_size_retries_rejected_items_and_refreshes_once(es_session):
+    log = []
+    es_session(_bulk_handler(log))
+    stats = BulkIndexer(max_docs=2, concurrency=1, backoff=0).index(index_action("idx", {"k": k}) for k in "abcde")
+
+    assert stats["ok"] == 5 and stats["failed"] == 0 and stats["retried"] == 1
+    assert log[:3] == [["a", "b"], ["b"], ["c", "d"]]   # only the rejected item is resent
+    assert log.count("REFRESH") == 1 and log[-1] == "REFRESH"
+
+def test_read_timeout_resends_only_batches_with_explicit_ids(es_session):
+    log = []
+    es_session(_bulk_handler(log, reject_b_once=False, timeout_first=True))
+    stats = BulkIndexer(refresh=False, backoff=0).index(index_action("idx", {"k": k}) for k in "ab")
+    assert stats["failed"] == 2 and stats["ok"] == 0 and log == ["TIMEOUT"]   # auto-id: no duplicates
+
+    log = []
+    es_session(_bulk_handler(log, reject_b_once=False, timeout_first=True))
+    stats = BulkIndexer(refresh=False, backoff=0).index(index_action("idx", {"k": k}, _id=k) for k in "ab")
+    assert stats["ok"] == 2 and log == ["TIMEOUT", ["a", "b"]]
@@ -0,0 +1,63 @@
+from src.cache import EmbeddingCache, LRUCache
+
+def test_embedding_cache_hits_on_normalized_query():
+    calls = []
+    def encode(text):
+        calls.append(text)
+        return [0.5, 0.25, 0.125]
+
+    cache = EmbeddingCache(max_entries=8, max_mb=1, ttl=0, disk_dir="")
+    v1 = cache.get_or_compute("What is  the deadline?", "m", encode)
+    v2 = cache.get_or_compute("  What is the deadline? ", "m", encode)
+    assert v1 == v2 == [0.5, 0.25, 0.125]
+    assert calls == ["What is the deadline?"]          # whitespace collapsed, case kept for the encoder
+    assert cache.stats()["hits"] == 1
+
+    # different model name -> different key
+    cache.get_or_compute("What is the deadline?", "other-model", encode)
+    assert len(calls) == 2
+
+def test_case_only_shares_a_key_for_uncased_models():
+    calls = []
+    encode = lambda text: calls.append(text) or [1.0]
+    cache = EmbeddingCache(max_entries=8, max_mb=1, ttl=0, disk_dir="")
+    cache.get_or_compute("Deadline", "cased-model", encode)
+    cache.get_or_compute("deadline", "cased-model", encode)
+    assert calls == ["Deadline", "deadline"]
+
+    uncased = "sentence-transformers/all-MiniLM-L6-v2@onnx"
+    cache.get_or_compute("Deadline", uncased, encode)
+    cache.get_or_compute("deadline", uncased, encode)
+    assert calls[2:] == ["Deadline"]
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    encode = lambda text: [1.0, 2.0]
+    EmbeddingCache(disk_dir=str(tmp_path)).get_or_compute("q", "m", encode)
+    other = EmbeddingCache(disk_dir=str(tmp_path))
+    assert other.get_or_compute("q", "m", lambda t: [9.0]) == [1.0, 2.0]
+    assert other.stats()["disk_hits"] == 1
+
+def test_lru_bounds_entries_and_bytes():
+    lru = LRUCache(max_entries=2, max_bytes=100, sizeof=lambda v: v)
+    lru.put("a", 10); lru.put("b", 10); lru.get("a"); lru.put("c", 10)
+    assert lru.get("b") is None and lru.get("a") == 10
+    lru.put("big", 95)
+    assert lru.stats()["entries"] == 1
+
+def test_answer_cache_invalidated_by_generation_bump(tmp_path):
+    from src.cache import AnswerCache, DiskAnswerBackend, MemoryAnswerBackend
+    for backend in (MemoryAnswerBackend(), DiskAnswerBackend(cache_dir=str(tmp_path))):
+        cache = AnswerCache(backend)
+        key = AnswerCache.key("What is RRF?", "hybrid", 5)
+        assert key == AnswerCache.key("  What is   RRF? ", "hybrid", 5)
+        assert key != AnswerCache.key("what is rrf?", "hybrid", 5)     # the LLM sees the case
+        assert key != AnswerCache.key("What is RRF?", "bm25", 5)
+
+        gen = cache.generation()
+        cache.put(key, {"answer": "fusion"}, gen)
+        assert cache.get(key) == {"answer": "fusion"}
+
+        cache.bump_generation()
+        assert cache.get(key) is None
+        cache.put(key, {"answer": "late"}, gen)   # computed before the bump -> not stored
+        assert cache.get(key) is None
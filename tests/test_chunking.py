@@ -1,4 +1,4 @@
-from src.ingest_pdfs import chunk_text
+from src.ingest_pdfs import chunk_text, doc_key, extract_pdf, iter_extracted
 
 def test_chunk_text_respects_overlap_and_size():
     text = " ".join(f"w{i}" for i in range(1, 1001))  # 1000 tokens
@@ -8,3 +8,26 @@ def test_chunk_text_respects_overlap_and_size():
     for c in chunks[:-1]:
         tok_count = len(c.split())
         assert 240 <= tok_count <= 300
+
+def test_split_extraction_matches_single_process(tmp_path):
+    import fitz
+    path = tmp_path / "multi.pdf"
+    doc = fitz.open()
+    for p in range(5):
+        page = doc.new_page()
+        words = [f"p{p}w{i}" for i in range(420)]   # two chunks per page with the default 300/60
+        for line in range(0, len(words), 12):
+            page.insert_text((36, 36 + 12 * (line // 12)), " ".join(words[line:line + 12]), fontsize=6)
+    doc.save(str(path))
+    doc.close()
+
+    single = extract_pdf(str(path), key=doc_key("multi.pdf"))
+    split = iter_extracted([str(path)], workers=2, data_dir=str(tmp_path), pages_per_task=2)   # spawn pool
+    ranges, chunks = [], []
+    for (_, start, end, _), docs in split:
+        ranges.append((start, end))
+        chunks.extend(docs)
+    chunks.sort(key=lambda d: (d["page"], int(d["chunk_id"].rsplit(":", 1)[1])))
+
+    assert sorted(ranges) == [(0, 2), (2, 4), (4, 5)]
+    assert len(single) == 10 and chunks == single
@@ -0,0 +1,49 @@
+from src.context import assemble_context, estimate_tokens
+from src.ingest_pdfs import chunk_text
+
+def _hit(_id, content, source="a.pdf", page=1):
+    return {"_id": _id, "_source": {"title": source[:-4], "source": source, "page": page,
+                                    "content": content, "drive_url": ""}}
+
+def _page(n_words, tag):
+    return " ".join(f"{tag}{i}" for i in range(n_words))
+
+def test_adjacent_overlapping_chunks_merge_into_one_block():
+    text = _page(500, "w")
+    c0, c1, c2 = chunk_text(text, 300, 60)   # each neighbour repeats 60 words
+    hits = [_hit("k:1:1", c1), _hit("other:3:0", "unrelated words " * 10, "b.pdf", 3), _hit("k:1:0", c0),
+            _hit("k:1:1-dup", c1)]
+    blocks, stats = assemble_context(hits, budget=0)
+
+    assert [b["title"] for b in blocks] == ["a", "b"]               # ordered by best rank
+    assert blocks[0]["snippet"] == " ".join(text.split()[:540])      # c0 + c1 without the repeated 60 words
+    assert blocks[0]["ids"] == ["k:1:1", "k:1:0"] and blocks[0]["page"] == 1
+    assert stats["merged"] == 1 and stats["deduped"] == 1 and stats["dropped"] == 0
+    assert stats["context_tokens"] < stats["context_tokens_raw"]
+
+def test_budget_trims_lowest_ranked_first():
+    hits = [_hit(f"k{i}:{i}:0", _page(100, f"p{i}_"), page=i) for i in range(4)]
+    per_hit = estimate_tokens(_page(100, "x"))
+    blocks, stats = assemble_context(hits, budget=2 * per_hit + 10)   # too little room left to cut a third
+
+    assert [b["page"] for b in blocks] == [0, 1]
+    assert stats["dropped"] == 2 and stats["truncated"] == 0
+    assert stats["context_tokens"] <= 2 * per_hit + 10
+
+    blocks, stats = assemble_context(hits[:1], budget=40)            # the top hit is always kept, cut to fit
+    assert len(blocks) == 1 and stats["truncated"] == 1 and blocks[0]["tokens"] <= 40
+
+def test_short_page_tail_is_sent_once_whichever_chunk_ranks_first():
+    text = _page(726, "w")
+    chunks = chunk_text(text, 300, 60)
+    assert len(chunks[-1].split()) == 6                              # shorter than CONTEXT_MIN_OVERLAP
+    tail, prev = _hit("k:1:3", chunks[3]), _hit("k:1:2", chunks[2])
+    whole = " ".join(text.split()[480:])
+
+    for hits in ([tail, prev], [prev, tail]):
+        blocks, stats = assemble_context(hits, budget=0)
+        assert [b["snippet"] for b in blocks] == [whole] and stats["deduped"] == 1
+        assert stats["context_tokens"] == estimate_tokens(whole)
+
+    blocks, _ = assemble_context([_hit(f"k:1:{i}", c) for i, c in enumerate(chunks)][::-1], budget=0)
+    assert [b["snippet"] for b in blocks] == [text]                  # contiguous, no repeated tail
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import requests
+from src import embed_dense, embed_store
+
+class FakeES:
+    """PIT + search_after over `pages` (lists of ids); a page given as an int is answered with that status."""
+    def __init__(self, pages):
+        self.pages, self.searches, self.closed = list(pages), [], []
+    def __call__(self, method, url, body):
+        if url.endswith("/_pit?keep_alive=" + embed_dense.PIT_KEEP_ALIVE):
+            return {"id": "pit-0"}
+        if method == "DELETE":
+            self.closed.append(body["id"])
+            return 200
+        self.searches.append(body)
+        page = self.pages.pop(0) if self.pages else []
+        if isinstance(page, int):
+            return page
+        hits = [{"_id": i, "_source": {"content": f"text {i}"}, "sort": [i]} for i in page]
+        return {"pit_id": f"pit-{len(self.searches)}", "hits": {"hits": hits}}
+
+class RecordingBulk:
+    written = []
+    def __init__(self, **kw): pass
+    def index(self, actions):
+        for meta, doc in actions:
+            RecordingBulk.written.append((meta["update"]["_id"], doc["doc"]["dense_vec"]))
+        return {"ok": len(RecordingBulk.written), "failed": 0}
+
+class Model:
+    def __init__(self, fail=False):
+        self.fail = fail
+    def encode(self, texts, **kw):
+        if self.fail:
+            raise ValueError("encoder crashed")
+        return np.ones((len(texts), 2))
+
+@pytest.fixture
+def fake(monkeypatch, es_session):
+    def install(pages, model=None):
+        es_fake = FakeES(pages)
+        es_session(es_fake)
+        monkeypatch.setattr(embed_dense, "get_model", lambda: model or Model())
+        monkeypatch.setattr(embed_dense, "BulkIndexer", RecordingBulk)
+        monkeypatch.setattr(embed_dense, "EMBED_QUEUE_DEPTH", 1)
+        monkeypatch.setattr(embed_store, "EMBED_STORE_DIR", "")
+        RecordingBulk.written = []
+        return es_fake
+    return install
+
+def test_backfill_pages_with_search_after_and_closes_the_latest_pit(fake):
+    es_fake = fake([["a", "b"], ["c"], []])
+    assert embed_dense.main(index="docs") == 3
+    assert [i for i, _ in RecordingBulk.written] == ["a", "b", "c"] and RecordingBulk.written[0][1] == [1.0, 1.0]
+    first, second, third = es_fake.searches
+    assert "search_after" not in first and second["search_after"] == ["b"] and third["search_after"] == ["c"]
+    assert [s["pit"]["id"] for s in es_fake.searches] == ["pit-0", "pit-1", "pit-2"]
+    assert es_fake.closed == ["pit-3"]
+
+def test_encoder_failure_stops_the_scanner_and_closes_the_pit(fake):
+    es_fake = fake([["a"], ["b"], ["c"], ["d"], ["e"]], model=Model(fail=True))
+    with pytest.raises(ValueError, match="encoder crashed"):
+        embed_dense.main(index="docs")
+    assert len(es_fake.closed) == 1
+    assert len(es_fake.searches) < 5            # the scanner stopped instead of draining the index
+
+def test_scanner_error_reaches_the_caller(fake):
+    es_fake = fake([["a"], 500])
+    with pytest.raises(requests.HTTPError):
+        embed_dense.main(index="docs")
+    assert es_fake.closed == ["pit-1"]
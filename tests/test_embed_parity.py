@@ -0,0 +1,14 @@
+import os
+import pytest
+
+RUN_INTEGRATION = os.getenv("RUN_INTEGRATION") == "1"
+pytestmark = pytest.mark.skipif(not RUN_INTEGRATION, reason="set RUN_INTEGRATION=1 to run (downloads models)")
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx", "onnx-int8"])
+def test_backend_matches_torch_vectors(backend):
+    pytest.importorskip("sentence_transformers")
+    if backend.startswith("onnx"):
+        pytest.importorskip("optimum.onnxruntime")
+    from src.embeddings import parity_check
+    stats = parity_check(backend)   # asserts min cosine >= DENSE_PARITY_MIN_COSINE
+    assert stats["min_cosine"] <= 1.0 + 1e-5
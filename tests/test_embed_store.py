@@ -0,0 +1,42 @@
+from src.embed_store import EmbeddingStore, encode_with_store
+
+def _encoder(calls):
+    def encode(texts):
+        calls.extend(texts)
+        return [[float(len(t)), 1.0, 0.0, 0.0] for t in texts]
+    return encode
+
+def test_store_skips_known_texts_and_survives_reopen(tmp_path):
+    calls = []
+    store = EmbeddingStore(str(tmp_path), model_name="m", dim=4, max_entries=100, initial_capacity=2)
+    first = encode_with_store(["aa", "bbb", "aa", "c"], _encoder(calls), store=store)
+    assert first[0] == first[2] == [2.0, 1.0, 0.0, 0.0]
+    store.flush()
+
+    reopened = EmbeddingStore(str(tmp_path), model_name="m", dim=4, max_entries=100)
+    again = encode_with_store(["c", "bbb", "new"], _encoder(calls), store=reopened)
+    assert again[:2] == [first[3], first[1]]
+    assert calls == ["aa", "bbb", "c", "new"]   # only never-seen texts hit the encoder, once each
+    assert reopened.capacity >= 3                     # grew past initial_capacity
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="m", dim=2, max_entries=4, initial_capacity=4)
+    store.put_many(["a", "b", "c", "d"], [[1, 0]] * 4)
+    store.get_many(["a"])                 # touch a
+    store.put_many(["e"], [[0, 1]])
+    assert len(store) == 4
+    assert store.get_many(["a", "b", "e"]) == [[1.0, 0.0], None, [0.0, 1.0]]
+
+def test_other_model_does_not_reuse_vectors(tmp_path):
+    EmbeddingStore(str(tmp_path), model_name="m1", dim=2).put_many(["x"], [[1, 1]])
+    assert EmbeddingStore(str(tmp_path / "x"), model_name="m2", dim=2).get_many(["x"]) == [None]
+
+def test_eviction_is_persisted_before_a_slot_is_reused(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="m", dim=2, max_entries=4, initial_capacity=4)
+    store.put_many(["a", "b", "c", "d"], [[1, 0]] * 4)
+    store.flush()
+    store.put_many(["e"], [[0, 1]])       # evicts one row and reuses it, no flush afterwards
+
+    crashed = EmbeddingStore(str(tmp_path), model_name="m", dim=2, max_entries=4)
+    got = crashed.get_many(["a", "b", "c", "d", "e"])
+    assert got.count(None) == 2 and [0.0, 1.0] not in got   # evicted + unflushed e: misses, never e's vector
@@ -0,0 +1,40 @@
+import gzip, json
+import requests
+from src import es
+
+def _outcomes(*queued):
+    """Handler answering with the queued statuses (an exception instance is raised instead)."""
+    queued = list(queued)
+    return lambda method, url, body: queued.pop(0)
+
+def test_gzips_large_msearch_bodies_only(monkeypatch, es_session):
+    monkeypatch.setattr(es, "ES_GZIP", True)
+    session = es_session(_outcomes(200, 200, 200), install=False)
+    t = es.Transport(url="http://es:9200", session=session)
+    payload = ("{}\n" + json.dumps({"query": {"match": {"content": "x" * 2000}}}) + "\n").encode()
+    t.post("/docs/_msearch", payload)
+    t.post("/docs/_msearch", b"{}\n{}\n")
+    t.post("/docs/_search", {"query": {"match": {"content": "x" * 2000}}})
+
+    (_, url, data, headers, _), small, search = session.calls
+    assert url == "http://es:9200/docs/_msearch" and headers["Content-Encoding"] == "gzip"
+    assert headers["Content-Type"] == "application/x-ndjson" and gzip.decompress(data) == payload
+    assert "Content-Encoding" not in small[3] and small[2] == b"{}\n{}\n"
+    assert "Content-Encoding" not in search[3] and json.loads(search[2])["query"]["match"]["content"] == "x" * 2000
+
+def test_retries_429_503_and_connection_errors_but_not_read_timeouts(monkeypatch, es_session):
+    monkeypatch.setattr(es.time, "sleep", lambda s: None)
+    session = es_session(_outcomes(429, requests.ConnectionError("reset"), 503, 200), install=False)
+    t = es.Transport(session=session, retries=3)
+    assert t.get("/", timeout=5).status_code == 200 and len(session.calls) == 4
+    assert all(c[4] == 5 for c in session.calls)
+
+    session = es_session(_outcomes(503, 503), install=False)
+    assert es.Transport(session=session, retries=1).get("/").status_code == 503   # gives up, caller decides
+
+    session = es_session(_outcomes(requests.ReadTimeout("slow"), 200), install=False)
+    try:
+        es.Transport(session=session, retries=3).get("/")
+        assert False, "read timeouts must not be retried"
+    except requests.ReadTimeout:
+        assert len(session.calls) == 1
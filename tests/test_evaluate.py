@@ -0,0 +1,56 @@
+import json
+import pytest
+from src import es, evaluate as ev, rag_answer as rag
+
+def test_ranking_metrics():
+    rel = {"a": 1.0, "b": 1.0}
+    assert ev.recall_at_k(["x", "a", "y"], rel, 2) == 0.5
+    assert ev.mrr(["x", "y", "b"], rel) == pytest.approx(1 / 3)
+    assert ev.ndcg_at_k(["a", "b", "x"], rel, 3) == pytest.approx(1.0)
+    assert ev.ndcg_at_k(["x", "a"], {"a": 1.0}, 2) == pytest.approx(1 / 1.5849625)
+    assert ev.percentiles([1, 2, 3, 4]) == {"p50": 2, "p90": 4, "p99": 4, "mean": 2.5}
+
+def test_default_modes_cover_every_retrieval_mode():
+    assert {"dense-local", "bm25-local", "hybrid-msearch"} <= set(ev.MODES) == set(rag.MODES)
+
+def test_exact_knn_orders_by_cosine():
+    ids = ["d0", "d1", "d2"]
+    docs = [[1.0, 0.0], [0.7, 0.7], [0.0, 1.0]]
+    assert ev.exact_knn([[1.0, 0.1]], docs, ids, 2) == [["d0", "d1"]]
+
+class FakeES:
+    """'Live' ES for recording: BM25 ranks by word overlap, kNN by dot product."""
+    docs = {"d0": ("alpha beta", [1.0, 0.0]), "d1": ("beta gamma", [0.6, 0.8]), "d2": ("gamma", [0.0, 1.0])}
+
+    def __call__(self, method, url, body):
+        if "knn" in body:
+            qv = body["knn"]["query_vector"]
+            score = lambda d: sum(a * b for a, b in zip(qv, self.docs[d][1]))
+        else:
+            words = set(body["query"]["multi_match"]["query"].split())
+            score = lambda d: len(words & set(self.docs[d][0].split()))
+        ranked = sorted(self.docs, key=score, reverse=True)[:body["size"]]
+        return {"hits": {"hits": [{"_id": d, "_score": score(d), "_source": {}} for d in ranked]}}
+
+def test_record_then_replay_offline(monkeypatch, es_session):
+    transport = es.get_transport()
+    monkeypatch.setattr(transport, "session", transport.session)   # restored after use_fixture swaps it
+    queries = [{"query": "alpha", "relevant": {"d0": 1.0}}, {"query": "gamma", "relevant": {"d2": 1.0, "d1": 1.0}}]
+    qvecs = {"alpha": [1.0, 0.0], "gamma": [0.1, 1.0]}
+    corpus = {"ids": list(FakeES.docs), "vectors": [v for _, v in FakeES.docs.values()]}
+    rag.embedding_cache.clear()
+    transport.session = ev.RecordingSession(es_session(FakeES(), install=False))
+    ev.prime_query_vectors(qvecs)
+    live = ev.evaluate(queries, k=2, modes=["bm25", "dense"], knn=[(2, 3)], corpus=corpus, query_vectors=qvecs)
+    fixture = {"responses": transport.session.responses, "query_vectors": qvecs, "corpus": corpus}
+
+    rag.embedding_cache.clear()
+    session = ev.use_fixture(json.loads(json.dumps(fixture)))
+    replay = ev.evaluate(queries, k=2, modes=["bm25", "dense"], knn=[(2, 3)], corpus=corpus, query_vectors=qvecs)
+    strip = lambda r: {m: {k: v for k, v in out.items() if k != "latency_ms"} for m, out in r.items()}
+    assert strip(replay) == strip(live) and session.misses == 0
+    assert replay["dense"]["mrr"] == 1.0 and replay["dense"]["knn_recall@2"] == 1.0
+    assert set(replay["dense"]["latency_ms"]) == {"dense", "retrieval"}
+
+    ev.use_fixture({"responses": {}, "query_vectors": qvecs})
+    assert ev.evaluate(queries, k=2, modes=["bm25"])["bm25"]["errors"] == 2
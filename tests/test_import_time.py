@@ -0,0 +1,34 @@
+import os, re, sys, subprocess
+import pytest
+
+pytest.importorskip("fastapi")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+HEAVY = ("torch", "sentence_transformers", "transformers", "fitz", "pymupdf", "gdown", "numpy")
+
+def _importtime(module: str):
+    """Run `python -X importtime -c "import module"`; returns ({name: cumulative_us}, loaded heavy modules)."""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                       capture_output=True, text=True, timeout=120)
+    assert p.returncode == 0, p.stderr[-2000:]
+    cumulative = {}
+    for line in p.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m:
+            cumulative[m.group(3)] = int(m.group(1))
+    return cumulative, [m for m in p.stdout.strip().split(",") if m]
+
+def test_api_import_skips_heavy_deps():
+    _, heavy = _importtime("src.api")
+    assert heavy == [], f"imported at startup: {heavy}"
+
+def test_api_import_budget():
+    cumulative, _ = _importtime("src.api")
+    ms = cumulative["src.api"] / 1000.0
+    assert ms < IMPORT_BUDGET_MS, f"import src.api took {ms:.0f}ms (budget {IMPORT_BUDGET_MS:.0f}ms)"
+
+def test_rrf_import_is_light():
+    _, heavy = _importtime("src.rag_answer")
+    assert heavy == []
@@ -0,0 +1,79 @@
+import fitz
+import pytest
+from src import ingest_pdfs
+
+def _write_pdf(path, words):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), " ".join(words))
+    doc.save(str(path))
+    doc.close()
+
+@pytest.fixture
+def es(monkeypatch):
+    """Record what ingest_folder would send to Elasticsearch."""
+    calls = {"indexed": [], "docs": [], "deletes": [], "refreshes": []}
+    class RecordingBulk:
+        def __init__(self, **kw): pass
+        def index(self, actions):
+            for meta, doc in actions:
+                calls["indexed"].append(meta["index"]["_id"])
+                calls["docs"].append(doc)
+            return {"ok": len(calls["indexed"]), "failed": 0}
+    monkeypatch.setattr(ingest_pdfs, "BulkIndexer", RecordingBulk)
+    monkeypatch.setattr(ingest_pdfs, "delete_by_query", lambda index, q: calls["deletes"].append(q) or 1)
+    monkeypatch.setattr(ingest_pdfs, "refresh_index", calls["refreshes"].append)
+    return calls
+
+def test_incremental_ingest_skips_unchanged_and_cleans_up_removed(tmp_path, es):
+    data, manifest = tmp_path / "pdfs", str(tmp_path / "manifest.json")
+    data.mkdir()
+    _write_pdf(data / "a.pdf", ["alpha"] * 20)
+    _write_pdf(data / "b.pdf", ["beta"] * 20)
+    run = lambda: ingest_pdfs.ingest_folder(str(data), index="idx", incremental=True, workers=1,
+                                            manifest_path=manifest, inline_dense=False)
+
+    first = run()
+    assert first["changed"] == 2 and len(es["indexed"]) == 2
+    first_ids = list(es["indexed"])
+
+    es["indexed"].clear(); es["deletes"].clear(); es["refreshes"].clear()
+    second = run()
+    assert second["skipped"] == 2 and es["indexed"] == [] and es["deletes"] == []
+
+    _write_pdf(data / "a.pdf", ["changed"] * 20)
+    (data / "b.pdf").unlink()
+    third = run()
+    assert third["changed"] == 1 and third["removed"] == 1
+    assert es["indexed"] == [first_ids[0]]          # deterministic id -> upsert in place
+    assert len(es["deletes"]) == 2                  # stale chunks of a.pdf + all chunks of b.pdf
+    assert es["refreshes"] == ["idx"]               # once, after the whole cleanup pass
+
+def test_fresh_build_index_skips_cleanup(tmp_path, es):
+    data = tmp_path / "pdfs"
+    data.mkdir()
+    _write_pdf(data / "a.pdf", ["alpha"] * 20)
+    stats = ingest_pdfs.ingest_folder(str(data), index="idx_v2", incremental=False, fresh_index=True, workers=1,
+                                      manifest_path=str(tmp_path / "m.json"), inline_dense=False)
+    assert stats["changed"] == 1 and len(es["indexed"]) == 1
+    assert es["deletes"] == [] and es["refreshes"] == []
+
+def test_inline_dense_indexes_vectors_with_the_chunks(tmp_path, es, monkeypatch):
+    import numpy as np
+    from src import embed_store, embeddings
+    encoded = []
+    class Model:
+        def encode(self, texts, normalize_embeddings=False, **kw):
+            encoded.append(list(texts))
+            return np.array([[float(len(t)), 1.0] for t in texts])
+    monkeypatch.setattr(embeddings, "get_model", lambda: Model())
+    monkeypatch.setattr(embed_store, "EMBED_STORE_DIR", "")
+
+    data = tmp_path / "pdfs"
+    data.mkdir()
+    _write_pdf(data / "a.pdf", ["alpha"] * 20)
+    stats = ingest_pdfs.ingest_folder(str(data), index="idx", incremental=False, workers=1,
+                                      manifest_path=str(tmp_path / "m.json"), inline_dense=True)
+    assert stats["vectors"] == stats["chunks"] == 1 and len(encoded) == 1
+    doc = es["docs"][0]
+    assert doc["dense_vec"] == [float(len(doc["content"])), 1.0]
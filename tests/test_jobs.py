@@ -0,0 +1,45 @@
+import time
+from src.jobs import IngestJobs
+
+def _fake_job(params, events, cancel):
+    # Stands in for run_ingest_job: reports progress until done or cancelled.
+    for i in range(1, params["steps"] + 1):
+        events.put(("stage", "ingest", {"files": 1, "chunks": i}))
+        if cancel.is_set():
+            events.put(("cancelled", None))
+            return
+        time.sleep(params.get("sleep", 0))
+    events.put(("done", {"ingested_chunks": params["steps"]}))
+
+def _wait(jobs, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job still {jobs.get(job_id)['status']}")
+
+def test_job_runs_in_background_and_reports_progress():
+    finished = []
+    jobs = IngestJobs(on_finish=finished.append, target=_fake_job)   # called before the status is final
+    job = jobs.submit({"steps": 3})
+    assert job["status"] in ("queued", "running")
+    job = _wait(jobs, job["id"])
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"ingested_chunks": 3}
+    stage = job["stages"]["ingest"]
+    assert stage["chunks"] == 3 and stage["state"] == "done" and "chunks_per_s" in stage
+    assert [j["id"] for j in finished] == [job["id"]] and finished[0]["status"] == "running"
+
+def test_cancel_running_and_queued_jobs():
+    jobs = IngestJobs(target=_fake_job)
+    running = jobs.submit({"steps": 1000, "sleep": 0.01})
+    queued = jobs.submit({"steps": 1})
+    while jobs.get(running["id"])["status"] == "queued":
+        time.sleep(0.05)
+    assert jobs.cancel(queued["id"])["status"] == "cancelled"
+    jobs.cancel(running["id"])
+    assert _wait(jobs, running["id"])["status"] == "cancelled"
+    assert jobs.get(queued["id"])["stages"] == {}
+    assert jobs.cancel("nope") is None
@@ -0,0 +1,32 @@
+import asyncio, json
+import httpx
+from src import llm
+
+def test_messages_keep_a_stable_prefix_across_turns():
+    blocks = [{"title": "Guide", "page": 2, "snippet": "Submit by May 1."}]
+    first = llm.build_messages("When is the deadline?", blocks)
+    follow = llm.build_messages("Can it move?", blocks, history=[{"user": "When is the deadline?", "answer": "May 1."}])
+
+    assert first[0] == follow[0] == {"role": "system", "content": llm.SYS_PROMPT}
+    assert [m["role"] for m in follow] == ["system", "user", "assistant", "user"]
+    assert "[Guide p.2] Submit by May 1." in follow[-1]["content"]   # per-query context goes last
+
+def test_stream_uses_chat_endpoint_with_keep_alive_and_reports_usage(monkeypatch):
+    sent = []
+    def handler(request):
+        sent.append(json.loads(request.content))
+        lines = [{"message": {"content": "May "}, "done": False},
+                 {"message": {"content": "1."}, "done": True, "prompt_eval_count": 42, "prompt_eval_duration": 5e6}]
+        return httpx.Response(200, content="\n".join(json.dumps(l) for l in lines))
+    monkeypatch.setattr(llm, "_aclient", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        usage = {}
+        pieces = [p async for p in llm.stream_with_llm_async("When?", [], usage=usage)]
+        await llm.aclose()
+        return pieces, usage
+
+    pieces, usage = asyncio.run(run())
+    assert pieces == ["May ", "1."]
+    assert usage["prompt_eval_count"] == 42 and usage["prompt_eval_ms"] == 5.0
+    assert sent[0]["keep_alive"] == llm._KEEP_ALIVE and sent[0]["messages"][0]["role"] == "system"
@@ -0,0 +1,75 @@
+import pytest
+from src import ingest_pdfs, reindex as reindex_mod, setup_es
+
+@pytest.fixture
+def es(monkeypatch):
+    """Stand-in for the setup_es calls reindex() makes; records the alias lifecycle."""
+    calls = {"created": [], "finalized": [], "deleted": [], "pruned": [], "alias": ["docs_v1"]}
+    def finalize(name, alias):
+        calls["finalized"].append(name)
+        previous, calls["alias"] = calls["alias"], [name]
+        return {"index": name, "previous": previous}
+    monkeypatch.setattr(setup_es, "create_build_index",
+                        lambda alias: calls["created"].append(f"{alias}_v2") or f"{alias}_v2")
+    monkeypatch.setattr(setup_es, "finalize_build_index", finalize)
+    monkeypatch.setattr(setup_es, "alias_targets", lambda alias: list(calls["alias"]))
+    monkeypatch.setattr(setup_es, "prune_versions",
+                        lambda live, previous, alias: calls["pruned"].append((live, previous)) or [])
+    monkeypatch.setattr(setup_es, "delete_index", calls["deleted"].append)
+    monkeypatch.setattr(reindex_mod, "embed_dense_main", lambda progress=None, index=None: 0)
+    return calls
+
+def _fake_ingest(files, failed=0):
+    def ingest_folder(data_dir, index, incremental, fresh_index, manifest_path, progress=None):
+        assert index == "docs_v2" and incremental is False and fresh_index is True
+        ingest_pdfs.save_manifest({"params": ingest_pdfs._params(index), "files": {"a.pdf": {}}}, manifest_path)
+        return {"files": files, "chunks": 3, "vectors": 3, "failed": failed}
+    return ingest_folder
+
+def test_reindex_swaps_alias_and_adopts_manifest(tmp_path, es, monkeypatch):
+    manifest = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(reindex_mod, "ingest_folder", _fake_ingest(files=1))
+    out = reindex_mod.reindex(str(tmp_path), alias="docs", manifest_path=manifest)
+    assert es["finalized"] == ["docs_v2"] and es["deleted"] == []
+    assert es["pruned"] == [("docs_v2", ["docs_v1"])]
+    assert out["index"] == "docs_v2" and out["previous"] == ["docs_v1"]
+    live = ingest_pdfs.load_manifest(manifest)
+    assert live["params"]["index"] == "docs" and "a.pdf" in live["files"]
+    assert list(tmp_path.iterdir()) == [tmp_path / "manifest.json"]
+
+@pytest.mark.parametrize("files,failed", [(0, 0), (1, 2)])
+def test_failed_reindex_keeps_live_index(tmp_path, es, monkeypatch, files, failed):
+    manifest = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(reindex_mod, "ingest_folder", _fake_ingest(files, failed))
+    with pytest.raises(RuntimeError):
+        reindex_mod.reindex(str(tmp_path), alias="docs", manifest_path=manifest)
+    assert es["finalized"] == [] and es["deleted"] == ["docs_v2"]
+    assert list(tmp_path.iterdir()) == []
+
+def test_failures_after_the_swap_never_delete_the_live_build(tmp_path, es, monkeypatch):
+    manifest = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(reindex_mod, "ingest_folder", _fake_ingest(files=1))
+    def prune_down(live, previous, alias):
+        raise ConnectionError("es gone")
+    monkeypatch.setattr(setup_es, "prune_versions", prune_down)
+    out = reindex_mod.reindex(str(tmp_path), alias="docs", manifest_path=manifest)
+    assert out["index"] == "docs_v2" and out["deleted"] == [] and es["deleted"] == []
+
+    # the swap was applied but its response was lost
+    es["alias"] = ["docs_v1"]
+    def swap_then_fail(name, alias):
+        es["alias"] = [name]
+        raise ConnectionError("reset after /_aliases")
+    monkeypatch.setattr(setup_es, "finalize_build_index", swap_then_fail)
+    with pytest.raises(ConnectionError):
+        reindex_mod.reindex(str(tmp_path), alias="docs", manifest_path=manifest)
+    assert es["deleted"] == []
+
+def test_prune_keeps_the_previous_live_index_over_orphaned_builds(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(setup_es, "versioned_indices", lambda alias: ["docs_v1", "docs_v2", "docs_v3", "docs_v4"])
+    monkeypatch.setattr(setup_es, "_delete", lambda path: deleted.append(path.strip("/")))
+    # v3 was built but never served (killed mid force-merge); v2 was live before v4
+    assert setup_es.prune_versions("docs_v4", ["docs_v2"], alias="docs", keep=1) == ["docs_v1", "docs_v3"]
+    assert deleted == ["docs_v1", "docs_v3"]
+    assert setup_es.prune_versions("docs_v4", ["docs_v2"], alias="docs", keep=2) == ["docs_v1"]
@@ -0,0 +1,130 @@
+import time
+from src.rag_answer import run_legs
+
+def test_run_legs_overlaps_and_reports_per_leg_time():
+    def leg(name, delay):
+        def _fn():
+            time.sleep(delay)
+            return [{"_id": name}]
+        return _fn
+
+    started = time.perf_counter()
+    hits, timings = run_legs({"a": leg("a", 0.2), "b": leg("b", 0.2), "c": leg("c", 0.2)})
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5  # close to the slowest leg, not the sum (0.6s)
+    assert hits["b"] == [{"_id": "b"}]
+    assert set(timings) == {"a", "b", "c"}
+    assert all(ms >= 150 for ms in timings.values())
+
+def test_msearch_payload_and_split_round_trip():
+    import json
+    from src.rag_answer import _hybrid_bodies, _msearch_payload, _split_msearch
+
+    bodies = _hybrid_bodies("deadline", [0.1, 0.2], size=5)
+    lines = _msearch_payload(bodies).decode("utf-8").splitlines()
+    assert len(lines) == 6 and lines[0] == "{}"
+    assert "knn" in json.loads(lines[5])
+
+    resp = {"responses": [{"hits": {"hits": [{"_id": n}]}} for n in ("e", "b", "d")]}
+    legs = _split_msearch(list(bodies), resp)
+    assert [legs[k][0]["_id"] for k in ("elser", "bm25", "dense")] == ["e", "b", "d"]
+
+def test_hybrid_fetches_ids_per_leg_and_hydrates_only_the_fused_top_k(monkeypatch, es_session):
+    from src import rag_answer as rag
+
+    calls = []
+    def handler(method, url, body):
+        calls.append((url.split("/", 3)[-1], body))
+        if url.endswith("/_mget"):
+            return {"docs": [{"_id": d["_id"], "found": d["_id"] != "gone", "_source": {"title": d["_id"]}}
+                             for d in body["docs"]]}
+        if "knn" in body:
+            ids = ["d", "a", "gone"]
+        elif "multi_match" in body["query"]:
+            ids = ["a", "b", "gone"]
+        else:
+            ids = ["a", "c", "gone"]
+        return {"hits": {"hits": [{"_id": i, "_score": 1.0} for i in ids]}}
+
+    es_session(handler)
+    monkeypatch.setattr(rag, "encode_query", lambda q: [0.0, 1.0])
+    monkeypatch.setattr(rag, "HYBRID_LEG_SIZE", 30)
+
+    hits, timings = rag.retrieve("deadline", mode="hybrid", size=3)
+
+    legs = [b for path, b in calls if "_search" in path]
+    assert len(legs) == 3 and all(b["_source"] is False and b["size"] == 30 for b in legs)
+    assert all("filter_path=" in path for path, _ in calls if "_search" in path)
+    mgets = [b for path, b in calls if path.endswith("_mget")]
+    assert len(mgets) == 1 and [d["_id"] for d in mgets[0]["docs"]] == ["a", "gone", "d"]
+    assert [h["_id"] for h in hits] == ["a", "d"] and hits[0]["_source"]["title"] == "a"
+    assert "hydrate" in timings
+
+def test_answer_async_runs_legs_concurrently_over_the_async_clients(monkeypatch):
+    import asyncio, json
+    import httpx
+    from src import es, llm, rag_answer as rag
+    from src.batching import MicroBatcher
+    from src.cache import EmbeddingCache
+
+    seen = []
+    async def es_handler(request):
+        body = json.loads(request.content)
+        seen.append(request.url.path)
+        if request.url.path.endswith("/_mget"):
+            docs = [{"_id": d["_id"], "found": True,
+                     "_source": {"title": "Guide", "source": "guide.pdf", "page": 2, "drive_url": "",
+                                 "content": f"The deadline is May 1 ({d['_id']})."}} for d in body["docs"]]
+            return httpx.Response(200, json={"docs": docs})
+        await asyncio.sleep(0.2)
+        ids = ["d", "a"] if "knn" in body else ["a", "b"] if "multi_match" in body["query"] else ["a", "c"]
+        return httpx.Response(200, json={"hits": {"hits": [{"_id": i, "_score": 1.0} for i in ids]}})
+
+    def llm_handler(request):
+        assert request.url.path == "/api/chat"
+        return httpx.Response(200, json={"message": {"content": "May 1 [Guide p.2]."},
+                                         "prompt_eval_count": 120, "prompt_eval_duration": 8e6})
+
+    monkeypatch.setattr(es, "_aclient", httpx.AsyncClient(base_url="http://es",
+                                                          transport=httpx.MockTransport(es_handler)))
+    monkeypatch.setattr(llm, "_aclient", httpx.AsyncClient(transport=httpx.MockTransport(llm_handler)))
+    monkeypatch.setattr(rag, "query_batcher", MicroBatcher(lambda texts: [[0.0, 1.0]] * len(texts)))
+    monkeypatch.setattr(rag, "embedding_cache", EmbeddingCache(disk_dir=""))
+    monkeypatch.setattr(rag, "answer_cache", None)
+
+    async def run():
+        try:
+            return await rag.answer_async("When is the deadline?", mode="hybrid", size=3)
+        finally:
+            await es.aclose(); await llm.aclose()
+
+    out = asyncio.run(run())
+    assert out["answer"] == "May 1 [Guide p.2]." and out["citations"][0]["title"] == "Guide"
+    assert [r["id"] for r in out["results"]][:1] == ["a"]
+    assert sorted(p.rsplit("/", 1)[-1] for p in seen) == ["_mget", "_search", "_search", "_search"]
+    t = out["timings"]
+    assert all(t[leg] >= 150 for leg in ("elser", "bm25", "dense"))
+    assert t["retrieval"] < 500                     # the three 200 ms legs overlap on the event loop
+    assert "hydrate" in t and "llm" in t and t["llm_prefill"] == 8.0
+    assert out["context"]["llm_prompt_tokens"] == 120
+
+def test_async_encodes_share_batches_without_holding_pool_threads(monkeypatch):
+    import asyncio
+    from src import rag_answer as rag
+    from src.batching import MicroBatcher
+    from src.cache import EmbeddingCache
+
+    def encode(texts):
+        time.sleep(0.05)
+        return [[float(len(t))] for t in texts]
+    batcher = MicroBatcher(encode, max_batch=32, window_ms=20)
+    monkeypatch.setattr(rag, "query_batcher", batcher)
+    monkeypatch.setattr(rag, "embedding_cache", EmbeddingCache(disk_dir=""))
+
+    async def run():
+        return await asyncio.gather(*(rag.aencode_query("q" * i) for i in range(1, 65)))
+    vecs = asyncio.run(run())
+    assert vecs[9] == [10.0]
+    assert batcher.stats()["largest_batch"] > rag.RETRIEVAL_WORKERS   # not capped by the pool size
+    assert asyncio.run(run()) == vecs and batcher.stats()["items"] == 64   # second round: cache hits
@@ -0,0 +1,77 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from src import api
+
+def _stub_stream(fail_after_retrieval=False):
+    async def answer_stream_async(q, mode="hybrid", size=5, history=None):
+        yield "retrieval", {"mode": mode, "query": q, "answer": None,
+                            "results": [{"title": "Guide", "page": 2, "snippet": "Submit by May 1."}],
+                            "citations": [{"title": "Guide", "page": 2}]}
+        if fail_after_retrieval:
+            raise RuntimeError("ollama down")
+        for piece in ("May ", "1."):
+            yield "token", {"text": piece}
+        yield "done", {"mode": mode, "answer": "May 1.", "citations": [{"title": "Guide", "page": 2}]}
+    return answer_stream_async
+
+def _events(body):
+    """(event, data) pairs of an SSE body, parsed the way the wire format defines them."""
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+def _post(monkeypatch, stream):
+    monkeypatch.setattr(api, "rag_answer_stream", stream)
+    r = TestClient(api.app).post("/query/stream", json={"q": "When?", "mode": "bm25"})
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/event-stream")
+    return r.text
+
+def test_stream_sends_retrieval_then_tokens_then_done(monkeypatch):
+    events = _events(_post(monkeypatch, _stub_stream()))
+    assert [e for e, _ in events] == ["retrieval", "token", "token", "done"]
+    assert events[0][1]["results"][0]["title"] == "Guide" and events[0][1]["mode"] == "bm25"
+    assert "".join(d["text"] for e, d in events if e == "token") == events[-1][1]["answer"]
+
+def test_stream_failure_becomes_an_error_event(monkeypatch):
+    events = _events(_post(monkeypatch, _stub_stream(fail_after_retrieval=True)))
+    assert [e for e, _ in events] == ["retrieval", "error"]
+    assert "ollama down" in events[-1][1]["detail"]
+
+class _Response:
+    def __init__(self, body):
+        self.lines = body.split("\n")
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def raise_for_status(self):
+        pass
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+class _Placeholder:
+    def __init__(self, log):
+        self.log = log
+    def markdown(self, text):
+        self.log.append(("token", text))
+
+def test_ui_renders_sources_on_retrieval_before_the_first_token(monkeypatch):
+    pytest.importorskip("streamlit")
+    from src import ui
+    body = _post(monkeypatch, _stub_stream())
+    assert [e for e, _ in ui._iter_sse(_Response(body))] == ["retrieval", "token", "token", "done"]
+
+    log = []
+    monkeypatch.setattr(ui.requests, "post", lambda *a, **kw: _Response(body))
+    monkeypatch.setattr(ui, "_render_sources", lambda slot, data: log.append(("sources", data["results"][0]["title"])))
+    final, ttfb_ms = ui._query_stream({"q": "When?"}, _Placeholder(log), None, started=0.0)
+    assert log == [("sources", "Guide"), ("token", "May ▌"), ("token", "May 1.▌")]
+    assert final["answer"] == "May 1." and ttfb_ms is not None
+
+    error_body = _post(monkeypatch, _stub_stream(fail_after_retrieval=True))
+    monkeypatch.setattr(ui.requests, "post", lambda *a, **kw: _Response(error_body))
+    with pytest.raises(RuntimeError, match="ollama down"):
+        ui._query_stream({"q": "When?"}, _Placeholder([]), None, started=0.0)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import requests
+from src import rag_answer as rag, vector_index as vi
+
+DIM = vi.DENSE_DIMS
+
+def _vec(i):
+    v = np.zeros(DIM, dtype=np.float32); v[i] = 1.0; v[(i + 1) % DIM] = 0.2
+    return (v / np.linalg.norm(v)).tolist()
+
+@pytest.fixture
+def es(monkeypatch):
+    """Fake ES corpus: _id -> (seq_no, vector)."""
+    docs = {f"d{i}": (1, _vec(i)) for i in range(20)}
+    fetched = []
+    monkeypatch.setattr(vi, "scan_seq_nos", lambda index=None: {k: (s, "docs_v1") for k, (s, _) in docs.items()})
+    def fetch(live, ids):
+        fetched.extend(ids)
+        return [(i, {"title": i, "content": f"text {i}"}, docs[i][1]) for i in ids]
+    monkeypatch.setattr(vi, "fetch_docs", fetch)
+    return docs, fetched
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_local_index_search_and_incremental_refresh(tmp_path, es, dtype):
+    docs, fetched = es
+    index = vi.LocalDenseIndex(str(tmp_path), dtype=dtype, ann="")
+    assert not index.available()
+    assert index.refresh()["fetched"] == 20
+
+    hits = index.search(_vec(3), size=3)
+    assert hits[0]["_id"] == "d3" and hits[0]["_source"]["content"] == "text d3"
+    assert hits[0]["_score"] == pytest.approx(1.0, abs=0.02) and len(hits) == 3
+
+    fetched.clear()
+    docs["d3"] = (2, _vec(7))            # re-embedded -> new seq_no
+    del docs["d5"]
+    docs["d50"] = (1, _vec(50))
+    stats = index.refresh()
+    assert sorted(fetched) == ["d3", "d50"] and stats["removed"] == 1 and stats["vectors"] == 20
+
+    reader = vi.LocalDenseIndex(str(tmp_path), dtype=dtype)   # e.g. the API process
+    assert [h["_id"] for h in reader.search(_vec(50), size=1)] == ["d50"]
+    assert {h["_id"] for h in reader.search(_vec(7), size=2)} == {"d3", "d7"}
+    assert "d5" not in {h["_id"] for h in reader.search(_vec(5), size=20)}
+
+def test_dense_falls_back_to_local_index_when_es_is_slow(tmp_path, es, monkeypatch):
+    index = vi.LocalDenseIndex(str(tmp_path), dtype="float32", ann="")
+    index.refresh()
+    def slow(body, timeout=30):
+        assert timeout == rag.DENSE_KNN_TIMEOUT
+        raise requests.Timeout("knn took too long")
+    monkeypatch.setattr(rag, "_search", slow)
+    monkeypatch.setattr(rag, "DENSE_FALLBACK", "local")
+    monkeypatch.setattr(rag, "_local_index", lambda: index)
+    monkeypatch.setattr(rag, "encode_query", lambda q: _vec(4))
+    before = rag.dense_fallbacks
+    assert rag.q_dense("anything", size=1)[0]["_id"] == "d4"
+    assert rag.dense_fallbacks == before + 1
+
+def test_local_index_is_only_touched_after_es_fails(monkeypatch):
+    def broken():
+        raise ValueError("unreadable meta.json")
+    monkeypatch.setattr(rag, "_local_index", broken)
+    monkeypatch.setattr(rag, "encode_query", lambda q: _vec(4))
+    monkeypatch.setattr(rag, "_search", lambda body, timeout=30: [{"_id": "es"}])
+    assert rag.q_dense("q")[0]["_id"] == "es"                      # fallback off (default): never loaded
+    monkeypatch.setattr(rag, "DENSE_FALLBACK", "local")
+    assert rag.q_dense("q")[0]["_id"] == "es"                      # ES fine: still never loaded
+
+    def down(body, timeout=30):
+        raise requests.ConnectionError("es down")
+    monkeypatch.setattr(rag, "_search", down)
+    with pytest.raises(requests.ConnectionError):                  # load error = no fallback, ES error surfaces
+        rag.q_dense("q")
+
+def test_replaced_generation_is_deleted_on_the_next_refresh(tmp_path, es):
+    index = vi.LocalDenseIndex(str(tmp_path), dtype="float32", ann="")
+    index.refresh(); index.refresh()
+    assert (tmp_path / "vectors.1.npy").exists()      # readers may still be opening generation 1
+    index.refresh()
+    assert not (tmp_path / "vectors.1.npy").exists() and (tmp_path / "vectors.2.npy").exists()